@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for the message blacklist matcher.
+Compares the original per-pattern re.search loop with the combined pattern,
+one message at a time and a page at a time.
+Run from the repository root: `python -m benchmarks.blacklist_bench`
+"""
+
+import re
+import timeit
+from random import Random
+
+from commands.blacklist import MESSAGE_BLACKLIST, classify_blacklisted, is_blacklisted
+
+WORDS = (
+    "the game last night was wild i cant believe he missed that shot anyway who is "
+    "coming saturday bring snacks my cat knocked over the plant again honestly this "
+    "patch ruined ranked we should queue later after work did anyone watch the new "
+    "episode spoilers pls no pizza or tacos tonight meeting got moved to thursday"
+).split()
+NOISE = ["lol", "LMAO", "okay", "k", "hahaha", "wtf", "kek", "yo", "gm kings", "looool",
+         "https://example.com/clip/123", "www.example.org"]
+
+
+def build_corpus(size: int, seed: int = 7):
+    """Chat-like messages; roughly a quarter contain something blacklisted."""
+    rng = Random(seed)
+    corpus = []
+    for _ in range(size):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 25))]
+        if rng.random() < 0.25:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(NOISE))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def is_blacklisted_loop(message_content):
+    """The original implementation, kept here as the baseline."""
+    for pattern in MESSAGE_BLACKLIST:
+        if re.search(pattern, message_content, re.IGNORECASE):
+            return True
+    return False
+
+
+def main():
+    corpus = build_corpus(10000)
+    expected = [is_blacklisted_loop(m) for m in corpus]
+    assert [is_blacklisted(m) for m in corpus] == expected
+    assert classify_blacklisted(corpus) == expected
+
+    pages = [corpus[i:i + 100] for i in range(0, len(corpus), 100)]
+    cases = {
+        "per-pattern loop": lambda: [is_blacklisted_loop(m) for m in corpus],
+        "combined pattern": lambda: [is_blacklisted(m) for m in corpus],
+        "combined, 100-message pages": lambda: [classify_blacklisted(page) for page in pages],
+    }
+    print(f"{len(corpus)} messages, {sum(expected)} blacklisted")
+    baseline = None
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=5, repeat=5)) / 5
+        baseline = baseline or best
+        print(f"{name:30} {best * 1000:8.2f} ms  {best / len(corpus) * 1e6:6.2f} us/message  {baseline / best:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
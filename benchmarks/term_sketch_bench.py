@@ -0,0 +1,116 @@
+"""
+Benchmark for Word Yapper's approximate counting mode.
+Counts synthetic 10k, 100k and 1M message channels into the exact WordStats
+and into a TermSketch, for words and for two-word phrases, and compares the
+Python heap each holds, the build time, and how good the sketch's questions
+are: how many words it can ask about compared with exact counts (all of them,
+and those said at least FREQUENT times), and how many of its answers agree
+with the exact top author.
+Run from the repository root: `python -m benchmarks.term_sketch_bench`
+(pass message counts as arguments to override the defaults).
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from itertools import accumulate
+from random import Random
+
+from commands.term_sketch import PHRASE_SKETCH_TERMS, SKETCH_TERMS, TermSketch, bigrams
+from commands.word_stats import NOT_CANDIDATE, RELAXED, STRICT, WordStats
+
+VOCABULARY = 200_000
+FREQUENT = 10  # Terms said at least this often make fair questions
+PERSONAL_SHARE = 0.3  # Share of words drawn from the author's own favourites
+
+
+def classify(term: str) -> int:
+    # Stand-in for commands.word_cache.classify_word, which needs the enchant dictionary
+    if len(term) <= 1 or term.isdigit():
+        return NOT_CANDIDATE
+    return STRICT if len(term) > 4 else RELAXED
+
+
+def build_messages(size: int, seed: int = 7):
+    """Yield (author id, author name, words): Zipf words, each author with favourites of their own."""
+    rng = Random(seed)
+    vocabulary = [f"w{i:x}" for i in range(VOCABULARY)]
+    weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(VOCABULARY)))
+    authors = max(20, int(size ** 0.5 / 3))
+    author_weights = list(accumulate(1 / (rank + 1) for rank in range(authors)))
+    favourites = [rng.sample(range(2000), 40) for _ in range(authors)]
+    for _ in range(size):
+        author = rng.choices(range(authors), cum_weights=author_weights)[0]
+        words = [
+            vocabulary[rng.choice(favourites[author])] if rng.random() < PERSONAL_SHARE else word
+            for word in rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 20))
+        ]
+        yield 1000 + author, f"user{author}", words
+
+
+def build(make, size: int, phrases: bool):
+    stats = make()
+    for author_id, name, words in build_messages(size):
+        stats.add(author_id, name, bigrams(words) if phrases else words)
+    return stats
+
+
+def measure(make, size: int, phrases: bool):
+    """Build time, then the Python heap held by one built copy and the copy itself."""
+    gc.collect()
+    started = time.perf_counter()
+    build(make, size, phrases)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    stats = build(make, size, phrases)
+    if isinstance(stats, WordStats):
+        stats.compact()
+    gc.collect()
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, heap, stats
+
+
+def exact_answers(stats: WordStats):
+    """term -> (top author's user id, count), for candidate terms whose top author is unique."""
+    answers = {}
+    for word_id in range(len(stats)):
+        word = stats.word(word_id)
+        if classify(word) == NOT_CANDIDATE:
+            continue
+        counts = stats.row(word_id)
+        ranked = sorted(counts.values(), reverse=True)
+        if len(ranked) == 1 or ranked[0] > ranked[1]:
+            answers[word] = stats.author_ids[max(counts, key=counts.get)], sum(ranked)
+    return answers
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'messages':>10} {'terms':>7} {'mode':>7} {'build s':>8} {'heap MB':>8} "
+          f"{'askable':>8} {f'>={FREQUENT}':>8} {'correct':>8} {'bound':>6}")
+    for size in sizes:
+        for phrases, capacity in ((False, SKETCH_TERMS), (True, PHRASE_SKETCH_TERMS)):
+            kind = "phrases" if phrases else "words"
+            elapsed, heap, exact = measure(lambda: WordStats(classify), size, phrases)
+            answers = exact_answers(exact)
+            del exact
+            frequent = sum(count >= FREQUENT for _, count in answers.values())
+            print(f"{size:>10} {kind:>7} {'exact':>7} {elapsed:>8.1f} {heap / 2**20:>8.1f} {len(answers):>8} {frequent:>8}")
+
+            elapsed, heap, sketch = measure(lambda: TermSketch(classify, capacity), size, phrases)
+            asked = {
+                term: sketch.author_ids[author] for term in sketch.candidates(False)
+                if (author := sketch.top_author(term)) is not None
+            }
+            correct = sum(answers.get(term, (None,))[0] == user_id for term, user_id in asked.items())
+            frequent = sum(answers.get(term, (None, 0))[1] >= FREQUENT for term in asked)
+            print(f"{size:>10} {kind:>7} {'sketch':>7} {elapsed:>8.1f} {heap / 2**20:>8.1f} {len(asked):>8} {frequent:>8} "
+                  f"{correct / max(len(asked), 1):>8.1%} {sketch.decrement:>6}")
+            del sketch, answers
+
+
+if __name__ == "__main__":
+    main()
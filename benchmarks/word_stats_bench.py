@@ -0,0 +1,110 @@
+"""
+Benchmark for the Word Yapper word statistics storage.
+Compares the old nested-dict JSON word cache with the interned WordStats
+binary format for synthetic 10k, 100k and 1M message channels: file size,
+load time and Python heap used after loading. The binary file is mapped, so
+its data lives in the page cache rather than on the heap.
+Run from the repository root: `python -m benchmarks.word_stats_bench`
+(pass message counts as arguments to override the defaults).
+"""
+
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from itertools import accumulate
+from random import Random
+
+from commands.word_stats import NOT_CANDIDATE, RELAXED, STRICT, WordStats, write_word_stats
+
+VOCABULARY = 200_000
+
+
+def classify(word: str) -> int:
+    # Stand-in for commands.word_cache.classify_word, which needs the enchant dictionary
+    if len(word) <= 1 or word.isdigit():
+        return NOT_CANDIDATE
+    return STRICT if len(word) > 4 else RELAXED
+
+
+def build_messages(size: int, seed: int = 7):
+    """Yield (author id, author name, words) with Zipf-distributed words."""
+    rng = Random(seed)
+    vocabulary = [f"w{i:x}" for i in range(VOCABULARY)]
+    weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(VOCABULARY)))
+    authors = max(20, int(size ** 0.5 / 3))
+    for _ in range(size):
+        author = rng.randrange(authors)
+        words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(1, 20))
+        yield 1000 + author, f"user{author}", words
+
+
+def old_format(messages):
+    data = defaultdict(lambda: defaultdict(int))
+    authors = {}
+    for author_id, name, words in messages:
+        for word in words:
+            data[word][name] += 1
+        authors[name] = author_id
+    return {"data": {k: dict(v) for k, v in data.items()}, "authors": authors,
+            "last_message_id": 1, "last_update": 0, "cache_duration": 3600}
+
+
+def load_old(path):
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    data = defaultdict(lambda: defaultdict(int), {k: defaultdict(int, v) for k, v in saved['data'].items()})
+    # The old loader also built the candidate index straight away
+    top = {word: tuple(sorted(counts, key=counts.get, reverse=True)[:2])
+           for word, counts in data.items() if classify(word) != NOT_CANDIDATE}
+    return data, saved["authors"], top
+
+
+def measure(load, path):
+    """Best load time of three, then the Python heap held by one loaded copy."""
+    timings = []
+    for _ in range(3):
+        gc.collect()
+        started = time.perf_counter()
+        loaded = load(path)
+        timings.append(time.perf_counter() - started)
+        del loaded
+    gc.collect()
+    tracemalloc.start()
+    loaded = load(path)
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return min(timings), heap
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'messages':>10} {'format':>8} {'file MB':>9} {'load ms':>9} {'heap MB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            json_path = os.path.join(directory, f"{size}.json")
+            bin_path = os.path.join(directory, f"{size}.bin")
+            with open(json_path, 'w') as f:
+                json.dump(old_format(build_messages(size)), f)
+
+            stats = WordStats(classify)
+            for author_id, name, words in build_messages(size):
+                stats.add(author_id, name, words)
+            write_word_stats(bin_path, stats)
+            del stats
+
+            for name, path, load in (
+                ("json", json_path, load_old),
+                ("binary", bin_path, lambda p: WordStats.from_file(p, classify)),
+            ):
+                elapsed, heap = measure(load, path)
+                print(f"{size:>10} {name:>8} {os.path.getsize(path) / 2**20:>9.2f} {elapsed * 1000:>9.1f} {heap / 2**20:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import asyncio
+import discord
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from random import randint
+from typing import NamedTuple, Optional
+
+from commands.blacklist import classify_blacklisted, is_blacklisted
+from commands.image import BOT_USER_IDS
+
+logger = logging.getLogger('dejavu_bot')
+
+ARCHIVE_FILE = "/data/message_archive.db"
+LIVE_WRITE_INTERVAL = float(os.environ.get("LIVE_WRITE_INTERVAL", 1.0))  # Seconds live messages are buffered before a batched commit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    author_id INTEGER NOT NULL,
+    author_name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    content TEXT NOT NULL,
+    eligible INTEGER NOT NULL,
+    author_bot INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel_eligible
+    ON messages (channel_id, eligible, message_id);
+CREATE INDEX IF NOT EXISTS idx_messages_channel
+    ON messages (channel_id, message_id);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    newest_id INTEGER,
+    oldest_id INTEGER,
+    complete INTEGER NOT NULL DEFAULT 0,
+    crawled_until INTEGER
+);
+CREATE TABLE IF NOT EXISTS crawl_segments (
+    segment_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    after_id INTEGER NOT NULL,
+    before_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_segments_channel
+    ON crawl_segments (channel_id);
+"""
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = [
+    ("messages", "author_bot", "INTEGER NOT NULL DEFAULT 0"),
+    ("channels", "crawled_until", "INTEGER"),
+]
+
+
+class ArchivedMessage(NamedTuple):
+    """The parts of a message that recall and the games need."""
+    id: int
+    channel_id: int
+    guild_id: Optional[int]
+    author_id: int
+    author_name: str
+    content: str
+    created_at: datetime
+    author_bot: bool = False
+
+    @classmethod
+    def from_message(cls, message: discord.Message):
+        return cls(
+            id=message.id,
+            channel_id=message.channel.id,
+            guild_id=message.guild.id if message.guild else None,
+            author_id=message.author.id,
+            author_name=message.author.name,
+            content=message.content,
+            created_at=message.created_at,
+            author_bot=message.author.bot,
+        )
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id or '@me'}/{self.channel_id}/{self.id}"
+
+
+async def from_history(history):
+    """Adapt a channel.history() iterator to ArchivedMessage rows."""
+    async for message in history:
+        yield ArchivedMessage.from_message(message)
+
+
+async def since(messages, first_id: int):
+    """Cut a newest-first iterator of messages off before the first one older than first_id."""
+    async for message in messages:
+        if message.id < first_id:
+            return
+        yield message
+
+
+def is_recall_eligible(author_id: int, content: str) -> bool:
+    """Whether a message may be shown by /dejavu text and /dejavu image."""
+    return bool(content) and author_id not in BOT_USER_IDS and not is_blacklisted(content)
+
+
+class MessageArchive:
+    """SQLite-backed per-channel copy of message history.
+
+    A channel becomes usable for sampling once a crawl has fetched everything
+    from its first message up to ``crawled_until`` (``complete``). Live messages
+    are only appended for channels being crawled during this process
+    (``live_channels``), so the stored range never has holes from while the bot
+    was offline. The id ranges a crawl still has to fetch are kept in
+    crawl_segments and updated in the same transaction as the messages, so an
+    interrupted crawl resumes exactly where it stopped.
+    """
+
+    def __init__(self, path: str = ARCHIVE_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.conn.commit()
+        self.live_channels = set()
+        self.live_buffer = []  # ArchivedMessage rows of live messages not yet written, see run_live_writer()
+
+    def migrate(self):
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"Added column {table}.{column} to the message archive")
+
+    def close(self):
+        with self.lock:
+            self.insert_live()
+            self.conn.commit()
+            self.conn.close()
+
+    def channel_state(self, channel_id: int):
+        """Return (newest_id, oldest_id, complete, crawled_until) for a channel, or None if never crawled."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT newest_id, oldest_id, complete, crawled_until FROM channels WHERE channel_id = ?",
+                (channel_id,)
+            ).fetchone()
+
+    def is_indexed(self, channel_id: int) -> bool:
+        state = self.channel_state(channel_id)
+        return bool(state and state[2])
+
+    def add_messages(self, channel_id: int, messages: list):
+        """Store a batch of ArchivedMessage rows and widen the channel's known id range."""
+        if not messages:
+            return
+        with self.lock:
+            self.insert_messages(channel_id, messages)
+            self.conn.commit()
+
+    def insert_messages(self, channel_id: int, messages: list):
+        # Callers hold the lock and commit
+        if not messages:
+            return
+        blacklisted = classify_blacklisted([m.content for m in messages])
+        rows = [
+            (m.id, m.channel_id, m.guild_id, m.author_id, m.author_name, m.created_at.isoformat(), m.content,
+             int(bool(m.content) and m.author_id not in BOT_USER_IDS and not is_blocked), int(m.author_bot))
+            for m, is_blocked in zip(messages, blacklisted)
+        ]
+        newest = max(m.id for m in messages)
+        oldest = min(m.id for m in messages)
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO messages
+                (message_id, channel_id, guild_id, author_id, author_name, created_at, content, eligible, author_bot)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        self.conn.execute(
+            """
+            INSERT INTO channels (channel_id, newest_id, oldest_id) VALUES (?, ?, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET
+                newest_id = MAX(COALESCE(newest_id, excluded.newest_id), excluded.newest_id),
+                oldest_id = MIN(COALESCE(oldest_id, excluded.oldest_id), excluded.oldest_id)
+            """,
+            (channel_id, newest, oldest)
+        )
+
+    def record_live(self, message: discord.Message):
+        """Buffer a newly posted message if its channel is being kept current; run_live_writer() stores it."""
+        if message.channel.id in self.live_channels:
+            self.live_buffer.append(ArchivedMessage.from_message(message))
+
+    def insert_live(self):
+        # Callers hold the lock and commit
+        batch, self.live_buffer = self.live_buffer, []
+        by_channel = {}
+        for message in batch:
+            by_channel.setdefault(message.channel_id, []).append(message)
+        for channel_id, messages in by_channel.items():
+            self.insert_messages(channel_id, messages)
+
+    def write_live(self):
+        """Store the buffered live messages in one transaction; runs off the event loop."""
+        with self.lock:
+            self.insert_live()
+            self.conn.commit()
+
+    async def run_live_writer(self, interval: float = LIVE_WRITE_INTERVAL):
+        """Commit live messages in batches every interval seconds instead of once per message."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.live_buffer:
+                await asyncio.to_thread(self.write_live)
+
+    def update_content(self, message_id: int, content: str):
+        with self.lock:
+            # The edited message may still be buffered
+            self.insert_live()
+            row = self.conn.execute(
+                "SELECT author_id FROM messages WHERE message_id = ?", (message_id,)
+            ).fetchone()
+            if row is None:
+                return
+            self.conn.execute(
+                "UPDATE messages SET content = ?, eligible = ? WHERE message_id = ?",
+                (content, int(is_recall_eligible(row[0], content)), message_id)
+            )
+            self.conn.commit()
+
+    def delete_messages(self, message_ids):
+        with self.lock:
+            self.insert_live()
+            self.conn.executemany(
+                "DELETE FROM messages WHERE message_id = ?", [(i,) for i in message_ids]
+            )
+            self.conn.commit()
+
+    def mark_complete(self, channel_id: int):
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO channels (channel_id, complete) VALUES (?, 1)
+                ON CONFLICT(channel_id) DO UPDATE SET complete = 1
+                """,
+                (channel_id,)
+            )
+            self.conn.commit()
+
+    def crawl_segments(self, channel_id: int):
+        """Return the (segment_id, after_id, before_id) ranges a channel's crawl has yet to fetch."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT segment_id, after_id, before_id FROM crawl_segments WHERE channel_id = ? ORDER BY before_id DESC",
+                (channel_id,)
+            ).fetchall()
+
+    def plan_crawl(self, channel_id: int, ranges, crawled_until: int):
+        """Queue (after_id, before_id) ranges for crawling and record how far the crawl reaches."""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO crawl_segments (channel_id, after_id, before_id) VALUES (?, ?, ?)",
+                [(channel_id, after_id, before_id) for after_id, before_id in ranges]
+            )
+            self.conn.execute(
+                """
+                INSERT INTO channels (channel_id, crawled_until) VALUES (?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET crawled_until = excluded.crawled_until
+                """,
+                (channel_id, crawled_until)
+            )
+            self.conn.commit()
+
+    def add_crawled(self, channel_id: int, messages: list, segment_id: int, before_id: Optional[int]):
+        """Store a crawled page and move its segment's upper bound down to before_id (None: segment done)."""
+        with self.lock:
+            self.insert_messages(channel_id, messages)
+            if before_id is None:
+                self.conn.execute("DELETE FROM crawl_segments WHERE segment_id = ?", (segment_id,))
+            else:
+                self.conn.execute(
+                    "UPDATE crawl_segments SET before_id = ? WHERE segment_id = ?", (before_id, segment_id)
+                )
+            self.conn.commit()
+
+    def split_crawl_segment(self, channel_id: int, segment_id: int, after_id: int, middle_id: int) -> int:
+        """Give the lower half of a segment, after_id to middle_id, its own segment; returns the new segment's id.
+
+        The segment's row may already be gone if its crawl just finished; the lower half is queued all the same.
+        """
+        with self.lock:
+            self.conn.execute("UPDATE crawl_segments SET after_id = ? WHERE segment_id = ?", (middle_id, segment_id))
+            new_id = self.conn.execute(
+                "INSERT INTO crawl_segments (channel_id, after_id, before_id) VALUES (?, ?, ?)",
+                (channel_id, after_id, middle_id)
+            ).lastrowid
+            self.conn.commit()
+            return new_id
+
+    def history(self, channel_id: int, before_id: Optional[int] = None, limit: int = 1000):
+        """Return up to limit archived messages older than before_id, newest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT message_id, channel_id, guild_id, author_id, author_name, content, created_at, author_bot
+                FROM messages
+                WHERE channel_id = ? AND message_id < ?
+                ORDER BY message_id DESC LIMIT ?
+                """,
+                (channel_id, before_id if before_id is not None else 2 ** 63 - 1, limit)
+            ).fetchall()
+        return [
+            ArchivedMessage(*row[:6], created_at=datetime.fromisoformat(row[6]), author_bot=bool(row[7]))
+            for row in rows
+        ]
+
+    async def iter_history(self, channel_id: int, limit: Optional[int] = None, before_id: Optional[int] = None, page: int = 1000):
+        """Iterate over up to limit (None: all) archived messages of a channel older than before_id (None: all), newest first,
+        reading pages off the event loop."""
+        if self.live_buffer:
+            await asyncio.to_thread(self.write_live)
+        while limit is None or limit > 0:
+            size = page if limit is None else min(page, limit)
+            messages = await asyncio.to_thread(self.history, channel_id, before_id, size)
+            for message in messages:
+                yield message
+            if len(messages) < size:
+                return
+            if limit is not None:
+                limit -= len(messages)
+            before_id = messages[-1].id
+
+    def id_histogram(self, channel_id: int, bucket_seconds: int):
+        """Return (bucket, count) pairs of archived messages per bucket_seconds of creation time."""
+        with self.lock:
+            return self.conn.execute(
+                """
+                SELECT ((message_id >> 22) + 1420070400000) / (1000 * ?) AS bucket, COUNT(*)
+                FROM messages WHERE channel_id = ? GROUP BY bucket
+                """,
+                (bucket_seconds, channel_id)
+            ).fetchall()
+
+    def id_at(self, channel_id: int, after_id: int, before_id: int, offset: int) -> Optional[int]:
+        """The id of the offset-th archived message (oldest first) in after_id <= id < before_id, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT message_id FROM messages WHERE channel_id = ? AND message_id >= ? AND message_id < ?
+                ORDER BY message_id LIMIT 1 OFFSET ?
+                """,
+                (channel_id, after_id, before_id, offset)
+            ).fetchone()
+        return row[0] if row else None
+
+    def sample(self, channel_id: int, exclude_author_id: int = None, pivot_id: Optional[int] = None) -> Optional[ArchivedMessage]:
+        """Pick a random eligible message from an indexed channel.
+
+        Takes the first eligible message at or after pivot_id, like looking
+        around a random datetime, but as a single indexed lookup. Without a
+        pivot, one is drawn uniformly over the channel's lifetime, which favours
+        messages that follow quiet gaps; ActivityDensity.sample_archived() draws
+        it by message density instead.
+        """
+        state = self.channel_state(channel_id)
+        if not state or not state[2] or state[0] is None:
+            return None
+        newest_id, oldest_id, _, _ = state
+        pivot = randint(oldest_id, newest_id) if pivot_id is None else min(max(pivot_id, oldest_id), newest_id)
+        author_filter = "AND author_id != ?" if exclude_author_id else ""
+        params = (channel_id, pivot, exclude_author_id) if exclude_author_id else (channel_id, pivot)
+        with self.lock:
+            row = self.conn.execute(
+                f"""
+                SELECT message_id, channel_id, guild_id, author_id, author_name, content, created_at
+                FROM messages
+                WHERE channel_id = ? AND eligible = 1 AND message_id >= ? {author_filter}
+                ORDER BY message_id LIMIT 1
+                """,
+                params
+            ).fetchone()
+            if row is None:
+                row = self.conn.execute(
+                    f"""
+                    SELECT message_id, channel_id, guild_id, author_id, author_name, content, created_at
+                    FROM messages
+                    WHERE channel_id = ? AND eligible = 1 AND message_id < ? {author_filter}
+                    ORDER BY message_id DESC LIMIT 1
+                    """,
+                    params
+                ).fetchone()
+        if row is None:
+            return None
+        return ArchivedMessage(*row[:6], created_at=datetime.fromisoformat(row[6]))
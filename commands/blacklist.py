@@ -0,0 +1,91 @@
+import re
+from bisect import bisect_right
+
+MESSAGE_BLACKLIST = [
+    r'https?://\S+|www\.\S+',  # URL pattern
+    r'\blol\b',                # "lol" (case-insensitive)
+    r'\blo+l\b',               # "lool", "loool", etc.
+    r'\b(lol){2,}\b',          # "lollol", "lololol", etc.
+    r'\blmao\b',               # "lmao" (case-insensitive)
+    r'\brofl\b',               # "rofl" (case-insensitive)
+    r'\bwtf\b',                # "wtf" (case-insensitive)
+    r'\bkek\b',                # "kek" (case-insensitive)
+    r'\b(ha){2,}\b',           # Two or more "ha"s as a standalone word
+    r'\bgm kings\b',           # "gm kings" (case-insensitive)
+    r'\byo\b',                 # "yo" (case-insensitive)
+    r'\bok+a*y*\b|\bok\b',     # "ok", "okay", "okk", "okayyy", etc.
+    r'\bk\b',                  # "k" (case-insensitive)
+]
+
+
+def _split_alternatives(pattern):
+    """Split a pattern on its top-level "|" (outside any group)."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(pattern):
+        if char == "(" and (i == 0 or pattern[i - 1] != "\\"):
+            depth += 1
+        elif char == ")" and pattern[i - 1] != "\\":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+    parts.append(pattern[start:])
+    return parts
+
+
+def compile_blacklist(patterns):
+    """Combine the blacklist into a single compiled expression.
+
+    Alternatives of the form \\b...\\b share one pair of word boundaries, so the
+    engine tests a boundary once per position instead of once per pattern.
+    """
+    words, others = [], []
+    for pattern in patterns:
+        for alternative in _split_alternatives(pattern):
+            if alternative.startswith(r"\b") and alternative.endswith(r"\b") and len(alternative) > 4:
+                words.append(alternative[2:-2])
+            else:
+                others.append(alternative)
+    combined = others + ([r"\b(?:" + "|".join(words) + r")\b"] if words else [])
+    return re.compile("|".join(combined), re.IGNORECASE)
+
+
+# All patterns as one expression so a message is scanned once instead of once per pattern
+BLACKLIST_PATTERN = compile_blacklist(MESSAGE_BLACKLIST)
+
+# None of the patterns can match across a line break, so joined pages can be scanned in one go
+_SEPARATOR = "\n"
+
+
+def is_blacklisted(message_content):
+    # Check if the string is explicitly blacklisted
+    return BLACKLIST_PATTERN.search(message_content) is not None
+
+
+def classify_blacklisted(contents):
+    """Return one is_blacklisted result per message for a whole page of contents.
+
+    The page is joined into a single string and scanned with the combined
+    pattern; after each hit the scan resumes at the start of the next message.
+    """
+    results = [False] * len(contents)
+    if not contents:
+        return results
+    starts = []
+    offset = 0
+    for content in contents:
+        starts.append(offset)
+        offset += len(content) + len(_SEPARATOR)
+    text = _SEPARATOR.join(contents)
+
+    pos = 0
+    while True:
+        match = BLACKLIST_PATTERN.search(text, pos)
+        if match is None:
+            break
+        index = bisect_right(starts, match.start()) - 1
+        results[index] = True
+        if index + 1 >= len(starts):
+            break
+        pos = starts[index + 1]
+    return results
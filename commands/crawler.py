@@ -0,0 +1,248 @@
+import asyncio
+import discord
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from commands.archive import ArchivedMessage, MessageArchive
+from commands.density import ActivityDensity
+from commands.message_pool import RateBudget
+
+logger = logging.getLogger('dejavu_bot')
+
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", 4))  # Segments of one channel fetched at once
+CRAWL_SEGMENTS = int(os.environ.get("CRAWL_SEGMENTS", 16))  # Pieces a long unseen range is split into
+CRAWL_MIN_SEGMENT_SECONDS = 7 * 24 * 60 * 60  # Ranges shorter than this are never split
+CRAWL_RATE = float(os.environ.get("CRAWL_RATE", 8.0))  # History requests per second, all crawls together
+CRAWL_CHANNEL_RATE = float(os.environ.get("CRAWL_CHANNEL_RATE", 4.0))  # History requests per second per channel
+CRAWL_MIN_CHANNEL_RATE = 0.2
+CRAWL_BURST = 5
+CRAWL_MAX_RETRIES = 5
+CRAWL_BACKOFF = 2.0  # Seconds before retrying a failed request, doubled on each retry
+HISTORY_PAGE = 100  # Messages per history request, Discord's maximum
+CRAWL_RETRY_AFTER = float(os.environ.get("CRAWL_RETRY_AFTER", 30 * 60))  # Seconds before a failed crawl is retried
+CRAWL_FORBIDDEN_RETRY_AFTER = 24 * 60 * 60  # Seconds before retrying a channel the bot may not read
+
+
+class CrawlScheduler:
+    """Paces the history requests of all crawls.
+
+    Discord rate limits GET /channels/{id}/messages in one bucket per channel,
+    on top of the global limit. Each channel gets its own token bucket and all
+    crawls share one more, so crawls leave room for commands. A 429 halves the
+    channel's rate and pauses it for the Retry-After; every successful request
+    then wins a little of the rate back.
+    """
+
+    def __init__(self, rate: float = CRAWL_RATE, channel_rate: float = CRAWL_CHANNEL_RATE, burst: int = CRAWL_BURST):
+        self.budget = RateBudget(rate, burst)
+        self.channel_rate = channel_rate
+        self.burst = burst
+        self.buckets = {}  # channel id -> RateBudget
+
+    def bucket(self, channel_id: int) -> RateBudget:
+        bucket = self.buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.buckets[channel_id] = RateBudget(self.channel_rate, self.burst)
+        return bucket
+
+    async def acquire(self, channel_id: int):
+        await self.bucket(channel_id).acquire()
+        await self.budget.acquire()
+
+    def rate_limited(self, channel_id: int, retry_after: float):
+        bucket = self.bucket(channel_id)
+        bucket.rate = max(CRAWL_MIN_CHANNEL_RATE, bucket.rate / 2)
+        # Negative tokens make acquire() wait out the Retry-After first
+        bucket.tokens = min(bucket.tokens, 0.0) - retry_after * bucket.rate
+        logger.warning(f"Crawl of channel {channel_id} rate limited for {retry_after:.1f}s, slowing to {bucket.rate:.2f} requests/s")
+
+    def succeeded(self, channel_id: int):
+        bucket = self.buckets.get(channel_id)
+        if bucket and bucket.rate < self.channel_rate:
+            bucket.rate = min(self.channel_rate, bucket.rate + 0.05)
+
+    def forget(self, channel_id: int):
+        self.buckets.pop(channel_id, None)
+
+
+class HistoryCrawler:
+    """Fills the message archive by crawling channels in parallel id ranges.
+
+    A channel's unseen history is split into segments of snowflake ids, and
+    several workers walk them backwards a page at a time. Because snowflakes
+    are timestamps, a range of time is a range of ids and any segment can be
+    fetched independently with before/after. A worker that runs out of queued
+    segments splits the largest one still in progress, so a single long range
+    (say, left over from an interrupted crawl) is still fetched in parallel.
+
+    Progress is kept in the archive's crawl_segments, committed with each page,
+    so a crawl interrupted by a restart picks up where it stopped. Crawled pages
+    are also counted into the channel's activity density.
+    """
+
+    def __init__(self, archive: MessageArchive, density: ActivityDensity, scheduler: CrawlScheduler = None,
+                 workers: int = CRAWL_WORKERS):
+        self.archive = archive
+        self.density = density
+        self.scheduler = scheduler or CrawlScheduler()
+        self.workers = workers
+        self.tasks = {}  # channel id -> crawl task
+        self.retry_at = {}  # channel id -> time.monotonic() before which a failed crawl isn't restarted
+
+    def schedule(self, channel: discord.abc.Messageable):
+        """Start a background crawl of a channel unless one is already running or recently failed."""
+        if channel.id in self.tasks:
+            return
+        if time.monotonic() < self.retry_at.get(channel.id, 0):
+            return
+        self.retry_at.pop(channel.id, None)
+        self.tasks[channel.id] = asyncio.create_task(self.crawl(channel))
+
+    async def wait(self, channel: discord.abc.Messageable):
+        """Crawl a channel, or join the crawl already running, and wait until it ends; returns at once after a recent failure."""
+        self.schedule(channel)
+        task = self.tasks.get(channel.id)
+        if task:
+            # Shielded so a cancelled waiter doesn't cancel the crawl
+            await asyncio.shield(task)
+
+    def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+    def plan(self, channel: discord.abc.Messageable, until: int):
+        """Queue the ranges up to `until` that no crawl has covered yet."""
+        state = self.archive.channel_state(channel.id)
+        newest_id, oldest_id, complete, crawled_until = state if state else (None, None, 0, None)
+        first = channel.id - 1  # Nothing in a channel is older than the channel itself
+        if complete or crawled_until:
+            ranges = [(max(newest_id or first, crawled_until or first), until)]
+        elif newest_id:
+            # Partially archived before crawls were segmented: the two ends are missing
+            ranges = [(first, oldest_id), (newest_id, until)]
+        else:
+            ranges = [(first, until)]
+
+        segments = []
+        for after_id, before_id in ranges:
+            seconds = (before_id - after_id) / (1000 << 22)
+            pieces = int(max(1, min(CRAWL_SEGMENTS, seconds // CRAWL_MIN_SEGMENT_SECONDS)))
+            bounds = [after_id + (before_id - after_id) * i // pieces for i in range(pieces)] + [before_id]
+            segments.extend((lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo)
+        self.archive.plan_crawl(channel.id, segments, until)
+
+    async def crawl(self, channel: discord.abc.Messageable):
+        logger.info(f"Indexing channel {channel.id}")
+        started = time.perf_counter()
+        try:
+            # Live messages are archived from here on, so the crawl only has to reach this moment
+            until = discord.utils.time_snowflake(datetime.now(timezone.utc))
+            self.archive.live_channels.add(channel.id)
+            self.plan(channel, until)
+            segments = deque(
+                {"id": segment_id, "after": after_id, "before": before_id}
+                for segment_id, after_id, before_id in self.archive.crawl_segments(channel.id)
+            )
+            active = []
+            counts = {"messages": 0, "requests": 0}
+            workers = [asyncio.create_task(self.work(channel, segments, active, counts)) for _ in range(self.workers)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+            self.archive.mark_complete(channel.id)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Channel {channel.id} indexed: {counts['messages']} messages in {counts['requests']} requests, "
+                f"{elapsed:.1f}s ({counts['messages'] / max(elapsed, 1e-6):.0f} messages/s)"
+            )
+        except discord.errors.Forbidden:
+            logger.warning(f"No permission to index channel {channel.id}, not retrying for {CRAWL_FORBIDDEN_RETRY_AFTER:.0f}s")
+            self.archive.live_channels.discard(channel.id)
+            self.retry_at[channel.id] = time.monotonic() + CRAWL_FORBIDDEN_RETRY_AFTER
+        except Exception as e:
+            logger.error(f"Error indexing channel {channel.id}: {e}, retrying in {CRAWL_RETRY_AFTER:.0f}s")
+            # Retried by a recall after that; it resumes from the saved segments
+            self.archive.live_channels.discard(channel.id)
+            self.retry_at[channel.id] = time.monotonic() + CRAWL_RETRY_AFTER
+        finally:
+            self.tasks.pop(channel.id, None)
+            self.scheduler.forget(channel.id)
+
+    async def work(self, channel, segments: deque, active: list, counts: dict):
+        while True:
+            segment = segments.popleft() if segments else await self.split(channel, active)
+            if segment is None:
+                return
+            active.append(segment)
+            try:
+                while await self.crawl_page(channel, segment, counts):
+                    pass
+            finally:
+                active.remove(segment)
+
+    async def split(self, channel, active: list):
+        """Split the largest segment in progress and return its lower half, or None if none is worth splitting."""
+        # Segments whose last page is being stored are about to be deleted
+        open_segments = [s for s in active if not s.get("done")]
+        if not open_segments:
+            return None
+        segment = max(open_segments, key=lambda s: s["before"] - s["after"])
+        if (segment["before"] - segment["after"]) / (1000 << 22) < 2 * CRAWL_MIN_SEGMENT_SECONDS:
+            return None
+        middle = (segment["after"] + segment["before"]) // 2
+        lower = {"after": segment["after"], "before": middle}
+        # Narrowed before the write, so no other worker splits the same range
+        segment["after"] = middle
+        lower["id"] = await asyncio.to_thread(
+            self.archive.split_crawl_segment, channel.id, segment["id"], lower["after"], middle
+        )
+        return lower
+
+    async def crawl_page(self, channel, segment: dict, counts: dict) -> bool:
+        """Fetch and store the next page of a segment; returns whether the segment has more."""
+        page = await self.fetch_page(channel, segment["after"], segment["before"])
+        counts["requests"] += 1
+        # The segment may have been split while the request was in flight
+        messages = [m for m in page if m.id > segment["after"]]
+        more = len(messages) == HISTORY_PAGE
+        if messages:
+            segment["before"] = min(m.id for m in messages)
+        segment["done"] = not more
+        batch = [ArchivedMessage.from_message(m) for m in messages]
+        # The insert and commit run off the event loop, like reads in MessageArchive.iter_history
+        await asyncio.to_thread(self.archive.add_crawled, channel.id, batch, segment["id"], segment["before"] if more else None)
+        self.density.add(channel.id, [m.id for m in batch])
+        counts["messages"] += len(batch)
+        return more
+
+    async def fetch_page(self, channel, after_id: int, before_id: int):
+        """One history request, newest first; retries 429s and server errors with backoff."""
+        for attempt in range(CRAWL_MAX_RETRIES):
+            await self.scheduler.acquire(channel.id)
+            try:
+                page = [
+                    message async for message in channel.history(
+                        limit=HISTORY_PAGE, before=discord.Object(id=before_id), after=discord.Object(id=after_id),
+                        oldest_first=False
+                    )
+                ]
+            except discord.RateLimited as e:
+                self.scheduler.rate_limited(channel.id, e.retry_after)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = float(e.response.headers.get("Retry-After", CRAWL_BACKOFF * 2 ** attempt))
+                    self.scheduler.rate_limited(channel.id, retry_after)
+                elif e.status >= 500:
+                    logger.warning(f"History request for channel {channel.id} failed with HTTP {e.status}, retrying")
+                    await asyncio.sleep(CRAWL_BACKOFF * 2 ** attempt)
+                else:
+                    raise
+            else:
+                self.scheduler.succeeded(channel.id)
+                return page
+        raise RuntimeError(f"History requests for channel {channel.id} kept failing")
@@ -0,0 +1,145 @@
+import asyncio
+import discord
+import logging
+import os
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import accumulate
+from random import random, randrange, uniform
+
+from commands.archive import MessageArchive
+
+logger = logging.getLogger('dejavu_bot')
+
+DISCORD_EPOCH_MS = 1420070400000
+DENSITY_BUCKET_SECONDS = int(os.environ.get("DENSITY_BUCKET_SECONDS", 24 * 60 * 60))
+
+
+def snowflake_seconds(message_id: int) -> float:
+    """Unix time (seconds) a message was created, read from its id."""
+    return ((message_id >> 22) + DISCORD_EPOCH_MS) / 1000
+
+
+def seconds_snowflake(seconds: float) -> int:
+    """The lowest message id that can have been created at a Unix time."""
+    return (int(seconds * 1000) - DISCORD_EPOCH_MS) << 22
+
+
+class ChannelDensity:
+    """Histogram of a channel's message count per time bucket."""
+
+    def __init__(self, bucket_seconds: int = DENSITY_BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.counts = defaultdict(int)  # bucket index -> messages
+        self.cumulative = None  # (bucket indexes, running totals), rebuilt lazily after changes
+
+    def add_count(self, bucket: int, count: int):
+        self.counts[bucket] += count
+        self.cumulative = None
+
+    def add(self, message_ids):
+        for message_id in message_ids:
+            self.counts[int(snowflake_seconds(message_id) // self.bucket_seconds)] += 1
+        self.cumulative = None
+
+    def sample(self, start: float, end: float) -> float:
+        """Pick a time in [start, end) following the histogram.
+
+        Only part of a channel may have been seen so far, so the span outside
+        the first and last known buckets is sampled uniformly, with weight
+        equal to its share of the channel's lifetime.
+        """
+        if not self.counts or end <= start:
+            return uniform(start, end)
+        first = max(start, min(self.counts) * self.bucket_seconds)
+        last = min(end, (max(self.counts) + 1) * self.bucket_seconds)
+        uncovered = (end - start) - max(0.0, last - first)
+        if random() * (end - start) < uncovered:
+            point = uniform(0, uncovered)
+            return start + point if point < first - start else last + point - (first - start)
+
+        bucket_start = self.pick_bucket() * self.bucket_seconds
+        return uniform(max(start, bucket_start), min(end, bucket_start + self.bucket_seconds))
+
+    def pick_bucket(self) -> int:
+        """A bucket index, drawn with probability proportional to its message count."""
+        if self.cumulative is None:
+            buckets = sorted(self.counts)
+            self.cumulative = (buckets, list(accumulate(self.counts[b] for b in buckets)))
+        buckets, totals = self.cumulative
+        return buckets[bisect_right(totals, random() * totals[-1])]
+
+
+class ActivityDensity:
+    """Per-channel message density, used to aim random history lookups at busy periods.
+
+    A channel's histogram is seeded from the message archive the first time it
+    is sampled and then grows with every batch the archive crawl stores, so
+    each message is counted once. Also tracks history calls per message found
+    by random lookups, which should stay close to 1.
+    """
+
+    def __init__(self, archive: MessageArchive, bucket_seconds: int = DENSITY_BUCKET_SECONDS):
+        self.archive = archive
+        self.bucket_seconds = bucket_seconds
+        self.channels = {}
+        self.history_calls = 0
+        self.picks = 0
+
+    async def channel(self, channel_id: int) -> ChannelDensity:
+        density = self.channels.get(channel_id)
+        if density is None:
+            # A GROUP BY over the channel's archive, so it runs off the event loop
+            histogram = await asyncio.to_thread(self.archive.id_histogram, channel_id, self.bucket_seconds)
+            density = self.channels.get(channel_id)  # Seeded by another caller meanwhile
+            if density is None:
+                density = self.channels[channel_id] = ChannelDensity(self.bucket_seconds)
+                for bucket, count in histogram:
+                    density.add_count(bucket, count)
+        return density
+
+    def add(self, channel_id: int, message_ids):
+        """Count newly crawled messages; unseeded channels will pick them up from the archive."""
+        density = self.channels.get(channel_id)
+        if density:
+            density.add(message_ids)
+
+    async def sample_moment(self, channel: discord.abc.Messageable) -> datetime:
+        start = channel.created_at.timestamp()
+        end = datetime.now(timezone.utc).timestamp()
+        density = await self.channel(channel.id)
+        return datetime.fromtimestamp(density.sample(start, end), timezone.utc)
+
+    async def sample_archived(self, channel_id: int, exclude_author_id: int = None):
+        """MessageArchive.sample() with its pivot on a random archived message, so quiet gaps don't weigh in.
+
+        A bucket is drawn by its message count and the pivot is a random message
+        within it, picked by position rather than by time.
+        """
+        if not self.archive.is_indexed(channel_id):
+            return None
+        density = await self.channel(channel_id)
+        if not density.counts:
+            return None
+        bucket = density.pick_bucket()
+        bucket_start = bucket * self.bucket_seconds
+        after_id = seconds_snowflake(bucket_start)
+        before_id = seconds_snowflake(bucket_start + self.bucket_seconds)
+        offset = randrange(density.counts[bucket])
+
+        def sample():
+            # The histogram may be a little off from the archive; then the bucket's start will do
+            pivot_id = self.archive.id_at(channel_id, after_id, before_id, offset) or after_id
+            return self.archive.sample(channel_id, exclude_author_id, pivot_id)
+
+        return await asyncio.to_thread(sample)
+
+    def record_lookup(self, history_calls: int, picks: int):
+        self.history_calls += history_calls
+        self.picks += picks
+        logger.debug(f"Random history lookups: {self.calls_per_pick:.2f} API calls per successful pick ({self.history_calls}/{self.picks})")
+
+    @property
+    def calls_per_pick(self) -> float:
+        return self.history_calls / self.picks if self.picks else 0.0
@@ -0,0 +1,66 @@
+import aiohttp
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger('dejavu_bot')
+
+DOWNLOAD_CONCURRENCY = int(os.environ.get("DOWNLOAD_CONCURRENCY", 4))  # Downloads in flight across the bot
+DOWNLOAD_MAX_BYTES = int(os.environ.get("DOWNLOAD_MAX_BYTES", 25 * 1024 * 1024))  # Per file; Discord's upload limit
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=15)
+CHUNK_SIZE = 64 * 1024
+
+
+class Downloader:
+    """One pooled aiohttp session for the bot's own HTTP downloads.
+
+    The session keeps connections alive and caches DNS lookups, so sharing
+    several CDN images reuses the same connections. A semaphore bounds the
+    number of downloads in flight and each file is capped at max_bytes.
+    """
+
+    def __init__(self, concurrency: int = DOWNLOAD_CONCURRENCY, max_bytes: int = DOWNLOAD_MAX_BYTES):
+        self.concurrency = concurrency
+        self.max_bytes = max_bytes
+        self.session = None
+        self.semaphore = None
+
+    def start(self):
+        """Create the session; must be called with the event loop running."""
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, ttl_dns_cache=300, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=DOWNLOAD_TIMEOUT)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def fetch(self, url: str):
+        """Download a URL, or return None if it fails, times out or is larger than max_bytes."""
+        async with self.semaphore:
+            try:
+                async with self.session.get(url) as resp:
+                    if resp.status != 200:
+                        logger.warning(f"Failed to download {url}: HTTP {resp.status}")
+                        return None
+                    if resp.content_length and resp.content_length > self.max_bytes:
+                        logger.warning(f"Skipping {url}: {resp.content_length} bytes is over the download cap")
+                        return None
+                    data = bytearray()
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        data += chunk
+                        if len(data) > self.max_bytes:
+                            logger.warning(f"Skipping {url}: over the download cap of {self.max_bytes} bytes")
+                            return None
+                    return bytes(data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Failed to download {url}: {e!r}")
+                return None
+
+    async def fetch_all(self, urls):
+        """Download URLs concurrently; returns a list of bytes or None in the same order."""
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.fetch(url) for url in urls))
+        logger.debug(f"Downloaded {sum(r is not None for r in results)}/{len(urls)} files in {time.perf_counter() - started:.2f}s")
+        return results
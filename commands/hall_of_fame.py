@@ -0,0 +1,264 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from random import randrange
+
+logger = logging.getLogger('dejavu_bot')
+
+INDEXED_FIELDS = ("author_name", "channel_id", "pin_type")
+SEARCH_INDEX_FILE = "/data/hall_of_fame_search.db"
+
+
+def sort_key(message_id: str, entry: dict):
+    return (entry.get("pinned_at") or "", message_id)
+
+
+class HallOfFame:
+    """Hall of Fame entries keyed by message id string, indexed for paging.
+
+    Behaves like the dict it replaces for lookups, inserts and deletes. Every
+    entry is also kept in an ordered index of all pins and in one ordered
+    index per value of author_name, channel_id and pin_type, each sorted by
+    pinned_at, so a page or a random pick is a single list access.
+    """
+
+    def __init__(self, entries: dict = None, search_index: "HallOfFameSearchIndex" = None):
+        self.entries = {}
+        self.indexes = defaultdict(list)  # (field, value) -> sorted [(pinned_at, message_id)], (None, None) for all
+        self.search_index = None
+        self.image_mirror = None  # Set once the mirror is running; new pins are queued for it
+        self.pinner_ids = {}  # message_id -> set of user ids with a 📌 reaction, loaded on first use
+        for message_id, entry in (entries or {}).items():
+            self[message_id] = entry
+        # Attach after loading so existing pins are only reindexed if the index is out of sync
+        if search_index:
+            search_index.sync(self.entries)
+            self.search_index = search_index
+
+    def index_keys(self, entry: dict):
+        yield (None, None)
+        for field in INDEXED_FIELDS:
+            yield (field, entry.get(field))
+
+    def __contains__(self, message_id):
+        return message_id in self.entries
+
+    def __getitem__(self, message_id):
+        return self.entries[message_id]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, message_id, default=None):
+        return self.entries.get(message_id, default)
+
+    def items(self):
+        return self.entries.items()
+
+    def values(self):
+        return self.entries.values()
+
+    def __setitem__(self, message_id, entry):
+        if message_id in self.entries:
+            del self[message_id]
+        self.entries[message_id] = entry
+        self.pinner_ids.pop(message_id, None)
+        key = sort_key(message_id, entry)
+        for index_key in self.index_keys(entry):
+            insort(self.indexes[index_key], key)
+        if self.search_index:
+            self.search_index.add(message_id, entry)
+        if self.image_mirror:
+            self.image_mirror.enqueue(message_id, entry)
+
+    def __delitem__(self, message_id):
+        entry = self.entries.pop(message_id)
+        self.pinner_ids.pop(message_id, None)
+        key = sort_key(message_id, entry)
+        for index_key in self.index_keys(entry):
+            index = self.indexes[index_key]
+            position = bisect_left(index, key)
+            if position < len(index) and index[position] == key:
+                del index[position]
+            if not index:
+                del self.indexes[index_key]
+        if self.search_index:
+            self.search_index.remove(message_id)
+
+    def pinners(self, message_id):
+        """Ids of users whose 📌 reaction keeps a pin, or None for pins stored before they were tracked."""
+        if message_id not in self.pinner_ids:
+            user_ids = self.entries[message_id].get("pinned_by_ids")
+            if user_ids is None:
+                return None
+            self.pinner_ids[message_id] = set(user_ids)
+        return self.pinner_ids[message_id]
+
+    def set_pinners(self, message_id, user_ids):
+        self.pinner_ids[message_id] = set(user_ids)
+        self.store_pinners(message_id)
+
+    def add_pinner(self, message_id, user_id: int):
+        """Record a 📌 reaction on a pin whose pinners are known (see pinners())."""
+        self.pinner_ids[message_id].add(user_id)
+        self.store_pinners(message_id)
+
+    def remove_pinner(self, message_id, user_id: int):
+        self.pinner_ids[message_id].discard(user_id)
+        self.store_pinners(message_id)
+
+    def store_pinners(self, message_id):
+        # Replace rather than mutate the stored list, so a snapshot being written stays consistent
+        self.entries[message_id]["pinned_by_ids"] = list(self.pinner_ids[message_id])
+
+    def cursor(self, field: str = None, value=None, random: bool = False):
+        return HallOfFameCursor(self, (field, value) if field else (None, None), random)
+
+    def search(self, query: str, author_name: str = None, after: str = None, before: str = None, limit: int = 10):
+        """Return (entry, snippet) pairs ranked by relevance; see HallOfFameSearchIndex.search."""
+        if not self.search_index:
+            return []
+        results = self.search_index.search(query, author_name, after, before, limit)
+        return [(self.entries[message_id], snippet) for message_id, snippet in results if message_id in self.entries]
+
+
+class HallOfFameCursor:
+    """A position in one Hall of Fame index, newest pin first.
+
+    Only the entry being shown is looked up. The cursor remembers the sort key
+    of that entry so it stays put when other pins are added or removed.
+    """
+
+    def __init__(self, store: HallOfFame, index_key, random: bool = False):
+        self.store = store
+        self.index_key = index_key
+        self.page = randrange(len(self)) if random and len(self) else 0
+        self.key = None  # Sort key of the entry last shown
+
+    @property
+    def index(self):
+        return self.store.indexes.get(self.index_key, [])
+
+    def __len__(self):
+        return len(self.index)
+
+    def current(self):
+        """Return the entry at the cursor, or None if the index is empty."""
+        index = self.index
+        if not index:
+            return None
+        if self.key is not None:
+            position = bisect_left(index, self.key)
+            if position < len(index) and index[position] == self.key:
+                self.page = len(index) - 1 - position
+        self.page = min(self.page, len(index) - 1)
+        self.key = index[len(index) - 1 - self.page]
+        return self.store.get(self.key[1])
+
+    def move(self, step: int):
+        self.current()
+        self.page = max(0, min(self.page + step, len(self) - 1))
+        self.key = None
+
+
+class HallOfFameSearchIndex:
+    """SQLite FTS5 index over pinned message text and author names.
+
+    Kept next to hall_of_fame.json and updated incrementally as pins are added
+    and removed. Results are ranked with bm25.
+    """
+
+    def __init__(self, path: str = SEARCH_INDEX_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS pins USING fts5(
+                message_id UNINDEXED,
+                original_message_text,
+                author_name,
+                said_on UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @staticmethod
+    def row(message_id: str, entry: dict):
+        # Timestamps are stored as "YYYY-MM-DD HH:MM AM", so the date sorts as text
+        timestamp = entry.get("timestamp") or ""
+        said_on = timestamp[:10] if re.match(r"\d{4}-\d{2}-\d{2}", timestamp) else None
+        return (message_id, entry.get("original_message_text") or "", entry.get("author_name") or "", said_on)
+
+    def sync(self, entries: dict):
+        """Rebuild the index if it does not hold exactly the given pins."""
+        with self.lock:
+            indexed = {row[0] for row in self.conn.execute("SELECT message_id FROM pins")}
+            if indexed == set(entries):
+                return
+            logger.info(f"Rebuilding Hall of Fame search index for {len(entries)} pins")
+            self.conn.execute("DELETE FROM pins")
+            self.conn.executemany(
+                "INSERT INTO pins VALUES (?, ?, ?, ?)",
+                [self.row(message_id, entry) for message_id, entry in entries.items()]
+            )
+            self.conn.commit()
+
+    def add(self, message_id: str, entry: dict):
+        with self.lock:
+            self.conn.execute("DELETE FROM pins WHERE message_id = ?", (message_id,))
+            self.conn.execute("INSERT INTO pins VALUES (?, ?, ?, ?)", self.row(message_id, entry))
+            self.conn.commit()
+
+    def remove(self, message_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM pins WHERE message_id = ?", (message_id,))
+            self.conn.commit()
+
+    def search(self, query: str, author_name: str = None, after: str = None, before: str = None, limit: int = 10):
+        """Return [(message_id, snippet)] best match first.
+
+        Every word of the query must appear (the last one as a prefix). Dates
+        are "YYYY-MM-DD" bounds on the day the original message was sent.
+        """
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        sql = (
+            "SELECT message_id, snippet(pins, 1, '**', '**', '…', 16) FROM pins "
+            "WHERE pins MATCH ?"
+        )
+        params = [match]
+        if author_name:
+            sql += " AND author_name = ?"
+            params.append(author_name)
+        if after:
+            sql += " AND said_on >= ?"
+            params.append(after)
+        if before:
+            sql += " AND said_on <= ?"
+            params.append(before)
+        sql += " ORDER BY bm25(pins) LIMIT ?"
+        params.append(limit)
+
+        started = time.perf_counter()
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        logger.debug(f"Hall of Fame search for {query!r} returned {len(rows)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return rows
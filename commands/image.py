@@ -1,13 +1,17 @@
+import asyncio
 import discord
 from discord.ui import View, Button
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from io import BytesIO
 import logging
 from random import choice
-import re
 from PIL import Image, ImageDraw, ImageFont
-import textwrap
 from datetime import datetime, timezone
+from functools import lru_cache
 import os
+import time
+
+from commands.text_layout import layout_card
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -37,6 +41,21 @@ BACKGROUNDS = [
         "yap"
 ]
 
+FONT_PATH = "assets/fonts/Courier.ttf"
+# Decoded backgrounds kept in memory; the default holds all of them (roughly 40 MB)
+BACKGROUND_CACHE_SIZE = int(os.environ.get("BACKGROUND_CACHE_SIZE", len(BACKGROUNDS)))
+
+# Image rendering runs off the event loop on a "thread" or "process" pool
+RENDER_POOL = os.environ.get("RENDER_POOL", "thread")
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+RENDER_QUEUE_SIZE = int(os.environ.get("RENDER_QUEUE_SIZE", 16))  # Renders queued or running before rejecting
+
+# Output encoding: "png", "webp", "jpeg", or "auto" to pick by IMAGE_BYTE_BUDGET
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "png").lower()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 85))  # WebP and JPEG quality
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 0))  # Downscale the longest side to this; 0 keeps full size
+IMAGE_BYTE_BUDGET = int(os.environ.get("IMAGE_BYTE_BUDGET", 0))  # Target upload size in "auto" mode; 0 means no limit
+
 BOT_USER_IDS = [
     361033318273384449, # BibleBot
     1241256728994254938, # dejavu
@@ -44,21 +63,166 @@ BOT_USER_IDS = [
     552734173803184128, # Thoth
 ]
 
-MESSAGE_BLACKLIST = [
-    r'https?://\S+|www\.\S+',  # URL pattern
-    r'\blol\b',                # "lol" (case-insensitive)
-    r'\blo+l\b',               # "lool", "loool", etc.
-    r'\b(lol){2,}\b',          # "lollol", "lololol", etc.
-    r'\blmao\b',               # "lmao" (case-insensitive)
-    r'\brofl\b',               # "rofl" (case-insensitive)
-    r'\bwtf\b',                # "wtf" (case-insensitive)
-    r'\bkek\b',                # "kek" (case-insensitive)
-    r'\b(ha){2,}\b',           # Two or more "ha"s as a standalone word
-    r'\bgm kings\b',           # "gm kings" (case-insensitive)
-    r'\byo\b',                 # "yo" (case-insensitive)
-    r'\bok+a*y*\b|\bok\b',     # "ok", "okay", "okk", "okayyy", etc.
-    r'\bk\b',                  # "k" (case-insensitive)
-]
+@lru_cache(maxsize=BACKGROUND_CACHE_SIZE)
+def load_background(background: str) -> Image.Image:
+    """Decode a background once; callers must draw on a copy()."""
+    background_path = f"assets/images/{background}.jpg"
+    logger.debug(f"Loading background image from: {background_path}")
+    background_img = Image.open(background_path)
+    background_img.load()
+    return background_img
+
+
+@lru_cache(maxsize=8)
+def load_font(size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(FONT_PATH, size=size)
+
+
+def preload_assets():
+    """Decode every background and load the fonts so first renders are fast."""
+    for background in BACKGROUNDS[:BACKGROUND_CACHE_SIZE]:
+        if background != "random":
+            load_background(background)
+    load_font(36)
+    load_font(24)
+
+
+def encode_image(image: Image.Image, image_format: str = None):
+    """Encode a rendered image according to the IMAGE_* settings.
+
+    Returns (encoded bytes, file extension). In "auto" mode without an
+    IMAGE_BYTE_BUDGET, lossless output always fits, so it is a plain PNG.
+    With a budget, the cheap lossy encoders are tried instead, WebP then
+    JPEG, and the first that fits wins; if neither fits, the smaller is used.
+    """
+    image_format = image_format or IMAGE_FORMAT
+    if IMAGE_MAX_DIMENSION and max(image.size) > IMAGE_MAX_DIMENSION:
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+    if image_format == "auto":
+        if not IMAGE_BYTE_BUDGET:
+            return encode_image(image, "png")
+        smallest = None
+        for candidate in ("webp", "jpeg"):
+            encoded = encode_image(image, candidate)
+            if len(encoded[0]) <= IMAGE_BYTE_BUDGET:
+                return encoded
+            if smallest is None or len(encoded[0]) < len(smallest[0]):
+                smallest = encoded
+        return smallest
+
+    buffer = BytesIO()
+    if image_format == "webp":
+        image.save(buffer, "WEBP", quality=IMAGE_QUALITY, method=4)
+        return buffer.getvalue(), "webp"
+    if image_format in ("jpeg", "jpg"):
+        image.convert("RGB").save(buffer, "JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        return buffer.getvalue(), "jpg"
+    image.save(buffer, "PNG")
+    return buffer.getvalue(), "png"
+
+
+def render_image(text: str, background: str):
+    """Draw the message text onto a background and encode it.
+
+    Pure and synchronous so it can run in a worker thread or process.
+    Returns (encoded bytes, file extension, seconds drawing, seconds encoding).
+    """
+    started = time.perf_counter()
+    # Draw on a copy of the cached, already decoded background
+    background_img = load_background(background).copy()
+    width, height = background_img.size
+
+    # Create a drawing object
+    draw = ImageDraw.Draw(background_img)
+
+    # Load fonts
+    font_large = load_font(36)
+    font_small = load_font(24)
+
+    # Split the text
+    parts = text.split("\n")
+    author = parts[0]
+    message = "\n".join(parts[1:-1])  # The message itself may span several lines
+    timestamp = parts[-1]
+
+    # Set colors and alignment based on background
+    text_color = (255, 255, 255)  # White for both backgrounds
+    if background == "iphone":
+        shadow_color = (0, 0, 0)  # Black shadow for iphone
+        alignment = "center"
+    else:
+        shadow_color = None  # No shadow for japmic
+        alignment = "top"
+
+    # Wrap on pixel widths and position every line up front
+    lines = layout_card(author, message, timestamp, (width, height), font_large, font_small, alignment == "center")
+
+    for x, y, line, font in lines:
+        if shadow_color:
+            # Draw shadow
+            shadow_offset = 2
+            for offset in [(0, 0), (0, shadow_offset), (shadow_offset, 0), (shadow_offset, shadow_offset)]:
+                draw.text((x + offset[0], y + offset[1]), line, font=font, fill=shadow_color)
+        # Draw main text
+        draw.text((x, y), line, font=font, fill=text_color)
+
+    drawn = time.perf_counter()
+    data, extension = encode_image(background_img)
+    return data, extension, drawn - started, time.perf_counter() - drawn
+
+
+class RenderQueueFull(Exception):
+    """Raised when RENDER_QUEUE_SIZE renders are already queued or running."""
+
+
+_render_executor = None
+_queued_renders = 0
+
+
+def get_render_executor():
+    global _render_executor
+    if _render_executor is None:
+        if RENDER_POOL == "process":
+            _render_executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=preload_assets)
+        else:
+            _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+        logger.info(f"Started {RENDER_POOL} render pool with {RENDER_WORKERS} workers")
+    return _render_executor
+
+
+def shutdown_render_pool():
+    global _render_executor
+    if _render_executor is not None:
+        _render_executor.shutdown(wait=False, cancel_futures=True)
+        _render_executor = None
+
+
+async def render_in_pool(text: str, background: str):
+    """Run render_image on the render pool, keeping the event loop free.
+
+    Returns (encoded bytes, file extension).
+    """
+    global _queued_renders
+    if _queued_renders >= RENDER_QUEUE_SIZE:
+        raise RenderQueueFull()
+    _queued_renders += 1
+    queued_at = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        data, extension, draw_seconds, encode_seconds = await loop.run_in_executor(
+            get_render_executor(), render_image, text, background
+        )
+    finally:
+        _queued_renders -= 1
+    total_seconds = time.perf_counter() - queued_at
+    logger.info(
+        f"Rendered {background}: draw {draw_seconds * 1000:.1f} ms, "
+        f"encode {extension} {encode_seconds * 1000:.1f} ms, {len(data)} bytes "
+        f"(waited {(total_seconds - draw_seconds - encode_seconds) * 1000:.1f} ms)"
+    )
+    return data, extension
+
 
 async def create_and_send_image(text: str, channel: discord.TextChannel, background: str, bot_instance=None, jump_url: str = None):
     """Create and send an image with the message text overlaid on the selected background.
@@ -77,98 +241,21 @@ async def create_and_send_image(text: str, channel: discord.TextChannel, backgro
             error_message = await channel.send("Invalid background selection.")
             return error_message
 
-        # Load the background image
-        background_path = f"assets/images/{background}.jpg"
-        logger.debug(f"Loading background image from: {background_path}")
-        
         # Verify the file exists
+        background_path = f"assets/images/{background}.jpg"
         if not os.path.exists(background_path):
             logger.error(f"Background image not found: {background_path}")
             error_message = await channel.send("Background image not found.")
             return error_message
             
-        background_img = Image.open(background_path)
-        width, height = background_img.size
-        
-        # Create a drawing object
-        draw = ImageDraw.Draw(background_img)
-        
-        # Load fonts
-        font_large = ImageFont.truetype("assets/fonts/Courier.ttf", size=36)
-        font_small = ImageFont.truetype("assets/fonts/Courier.ttf", size=24)
-        
-        # Split the text
-        parts = text.split("\n")
-        author = parts[0]
-        message = parts[1]
-        timestamp = parts[2]
-        
-        # Wrap the message text
-        wrapped_message = textwrap.fill(message, width=40)
-        
-        # Set colors and alignment based on background
-        text_color = (255, 255, 255)  # White for both backgrounds
-        if background == "iphone":
-            shadow_color = (0, 0, 0)  # Black shadow for iphone
-            alignment = "center"
-        else:
-            shadow_color = None  # No shadow for japmic
-            alignment = "top"
-        
-        # Calculate total text height
-        author_bbox = draw.textbbox((0, 0), author, font=font_large)
-        author_height = author_bbox[3] - author_bbox[1]
-        
-        message_lines = wrapped_message.split('\n')
-        message_height = sum(draw.textbbox((0, 0), line, font=font_small)[3] - draw.textbbox((0, 0), line, font=font_small)[1] for line in message_lines)
-        
-        timestamp_bbox = draw.textbbox((0, 0), timestamp, font=font_small)
-        timestamp_height = timestamp_bbox[3] - timestamp_bbox[1]
-        
-        total_height = author_height + message_height + timestamp_height + 40  # 40 for padding
-        
-        # Set starting y position based on alignment
-        if alignment == "center":
-            start_y = (height - total_height) // 2
-        else:  # top
-            start_y = 20
-        
-        # Draw text with optional shadow effect
-        def draw_text_with_shadow(position, text, font, shadow_color, text_color):
-            if shadow_color:
-                # Draw shadow
-                shadow_offset = 2
-                for offset in [(0, 0), (0, shadow_offset), (shadow_offset, 0), (shadow_offset, shadow_offset)]:
-                    draw.text((position[0]+offset[0], position[1]+offset[1]), text, font=font, fill=shadow_color)
-            # Draw main text
-            draw.text(position, text, font=font, fill=text_color)
-        
-        # Draw author
-        author_bbox = draw.textbbox((0, 0), author, font=font_large)
-        author_width = author_bbox[2] - author_bbox[0]
-        author_position = ((width - author_width) // 2, start_y)
-        draw_text_with_shadow(author_position, author, font_large, shadow_color, text_color)
-        
-        # Draw message
-        current_y = start_y + author_height + 20  # 20 for padding
-        for line in message_lines:
-            line_bbox = draw.textbbox((0, 0), line, font=font_small)
-            line_width = line_bbox[2] - line_bbox[0]
-            line_position = ((width - line_width) // 2, current_y)
-            draw_text_with_shadow(line_position, line, font_small, shadow_color, text_color)
-            current_y += line_bbox[3] - line_bbox[1]
-        
-        # Draw timestamp
-        timestamp_width = timestamp_bbox[2] - timestamp_bbox[0]
-        timestamp_position = ((width - timestamp_width) // 2, current_y + 20)  # 20 for padding
-        draw_text_with_shadow(timestamp_position, timestamp, font_small, shadow_color, text_color)
-        
-        # Save and send the image
-        buffer = BytesIO()
-        background_img.save(buffer, "PNG")
-        buffer.seek(0)
-        
-        file = discord.File(buffer, filename=f"dejavu_message_{background}.png")
+        try:
+            data, extension = await render_in_pool(text, background)
+        except RenderQueueFull:
+            logger.warning("Render queue is full, rejecting image request")
+            error_message = await channel.send("Too many images are being made right now. Please try again in a moment.")
+            return error_message
+
+        file = discord.File(BytesIO(data), filename=f"dejavu_message_{background}.{extension}")
         
         # Create view with pin button if bot_instance is provided
         view = None
@@ -188,15 +275,6 @@ async def create_and_send_image(text: str, channel: discord.TextChannel, backgro
         return error_message
 
 
-def is_blacklisted(message_content):
-    # Check if the string is explicitly blacklisted
-    for pattern in MESSAGE_BLACKLIST:
-        if re.search(pattern, message_content, re.IGNORECASE):
-            return True
-
-    return False
-
-
 class JumpLinkView(View):
     """View containing a jump-to-original button for text responses."""
     
@@ -282,7 +360,8 @@ class PinButtonView(View):
                 "background_used": self.background,
                 "pinned_by": interaction.user.name,
                 "pinned_at": datetime.now(timezone.utc).isoformat(),
-                "pin_type": "bot_image"
+                "pin_type": "bot_image",
+                "pinned_by_ids": []  # Nobody has reacted with 📌 yet; the bot adds its own below
             }
             
             self.bot.hall_of_fame[message_id_str] = pin_entry
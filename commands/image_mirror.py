@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+from commands.downloads import Downloader
+from commands.persistence import atomic_write
+
+logger = logging.getLogger('dejavu_bot')
+
+MIRROR_DIR = "/data/hall_of_fame_images"
+MIRROR_MAX_BYTES = int(os.environ.get("MIRROR_MAX_BYTES", 2 * 1024 * 1024 * 1024))  # Disk budget for mirrored images
+
+
+def base_url(url: str) -> str:
+    # CDN URLs carry expiring signature parameters; the path identifies the file
+    return url.split("?")[0]
+
+
+class ImageMirror:
+    """Local copies of Hall of Fame images, stored once per distinct content.
+
+    A background worker downloads the images of each new pin and writes them
+    to MIRROR_DIR named by their SHA-256, so an image pinned twice is stored
+    once. The entry records what was mirrored in "mirrored_images" as
+    {"url", "sha256", "filename"} (sha256 is None if the download failed), so
+    each image is only fetched once. When the mirror grows past max_bytes,
+    files no pin refers to are removed first, then the least recently shared.
+    """
+
+    def __init__(self, downloader: Downloader, on_change, directory: str = MIRROR_DIR, max_bytes: int = MIRROR_MAX_BYTES):
+        self.downloader = downloader
+        self.on_change = on_change  # Called after an entry's mirror records change
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hall_of_fame = None
+        self.files = {}  # sha256 -> {"path", "size", "used"}
+        self.total_bytes = 0
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def path_for(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.directory, sha256[:2], f"{sha256}{ext}")
+
+    def scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue  # Leftover temp file from an interrupted write
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                self.files[os.path.splitext(name)[0]] = {"path": path, "size": stat.st_size, "used": stat.st_mtime}
+                self.total_bytes += stat.st_size
+
+    async def start(self, hall_of_fame):
+        """Index the files on disk, queue pins that were never mirrored and start the worker."""
+        self.hall_of_fame = hall_of_fame
+        await asyncio.to_thread(self.scan)
+        logger.info(f"Image mirror holds {len(self.files)} files, {self.total_bytes} bytes")
+        for message_id, entry in hall_of_fame.items():
+            self.enqueue(message_id, entry)
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def enqueue(self, message_id: str, entry: dict):
+        if entry.get("image_urls") and "mirrored_images" not in entry:
+            self.queue.put_nowait(message_id)
+
+    async def run(self):
+        while True:
+            message_id = await self.queue.get()
+            try:
+                await self.mirror_entry(message_id)
+            except Exception as e:
+                logger.error(f"Error mirroring images for pin {message_id}: {e}")
+
+    async def mirror_entry(self, message_id: str):
+        entry = self.hall_of_fame.get(message_id)
+        if not entry or "mirrored_images" in entry:
+            return
+        urls = entry.get("image_urls") or []
+        downloads = await self.downloader.fetch_all(urls)
+        records = []
+        for url, data in zip(urls, downloads):
+            filename = os.path.basename(urlparse(url).path) or "image.png"
+            if data is None:
+                records.append({"url": url, "sha256": None, "filename": filename})
+                continue
+            sha256 = hashlib.sha256(data).hexdigest()
+            if sha256 not in self.files:
+                path = self.path_for(sha256, os.path.splitext(filename)[1].lower() or ".png")
+                await asyncio.to_thread(atomic_write, path, data)
+                self.files[sha256] = {"path": path, "size": len(data), "used": time.time()}
+                self.total_bytes += len(data)
+            records.append({"url": url, "sha256": sha256, "filename": filename})
+        entry["mirrored_images"] = records
+        self.on_change()
+        logger.debug(f"Mirrored {sum(r['sha256'] is not None for r in records)}/{len(urls)} images for pin {message_id}")
+        if self.total_bytes > self.max_bytes:
+            await self.evict()
+
+    def local_file(self, entry: dict, url: str):
+        """Return (path, filename) of the mirrored copy of an entry's image, or None."""
+        for record in entry.get("mirrored_images") or []:
+            if record["sha256"] and base_url(record["url"]) == base_url(url):
+                info = self.files.get(record["sha256"])
+                if info is None or not os.path.exists(info["path"]):
+                    return None
+                info["used"] = time.time()
+                try:
+                    os.utime(info["path"])  # So recency survives restarts
+                except OSError:
+                    pass
+                return info["path"], record["filename"]
+        return None
+
+    async def evict(self):
+        """Remove mirrored files until the mirror fits in max_bytes.
+
+        The choice and the bookkeeping happen on the event loop, where pins and
+        mirrors change; only the file removals run in a thread. Mirroring runs
+        in the same worker, so nothing is written while files are removed.
+        """
+        referenced = {
+            record["sha256"]
+            for entry in self.hall_of_fame.values()
+            for record in entry.get("mirrored_images") or []
+        }
+        # Unreferenced files first, then least recently used
+        order = sorted(self.files.items(), key=lambda item: (item[0] in referenced, item[1]["used"]))
+        victims = []
+        for sha256, info in order:
+            if self.total_bytes <= self.max_bytes:
+                break
+            victims.append((sha256, info))
+            del self.files[sha256]
+            self.total_bytes -= info["size"]
+        failed = await asyncio.to_thread(remove_files, [info["path"] for _, info in victims])
+        for sha256, info in victims:
+            if info["path"] in failed and sha256 not in self.files:
+                self.files[sha256] = info
+                self.total_bytes += info["size"]
+            elif info["path"] not in failed:
+                logger.debug(f"Evicted mirrored image {sha256}")
+
+
+def remove_files(paths) -> set:
+    """Delete files, returning the paths that could not be removed."""
+    failed = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not evict mirrored image {path}: {e}")
+            failed.add(path)
+    return failed
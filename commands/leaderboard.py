@@ -0,0 +1,123 @@
+from bisect import bisect_left, insort
+
+GAMES = ("total", "whosaid", "wordyapper")
+GLOBAL_SCOPE = "global"
+
+
+class RankedBoard:
+    """Players ordered by score for one scope and game.
+
+    Keeps a sorted list of (-score, player) so a player's rank is one bisect
+    (O(log n)) and the top N is a slice. A score change is a bisect plus one
+    list delete and one insert, which shift the entries after it: O(n), but a
+    memmove of pointers, tens of microseconds even for 100k players, so no tree is
+    worth its upkeep here.
+    """
+
+    def __init__(self):
+        self.order = []
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def set(self, player: str, score: int):
+        old = self.scores.get(player)
+        if old == score:
+            return
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, player))]
+        self.scores[player] = score
+        insort(self.order, (-score, player))
+
+    def rank(self, player: str):
+        """1-based rank shared by tied players, or None if the player has no score."""
+        score = self.scores.get(player)
+        if score is None:
+            return None
+        return bisect_left(self.order, (-score, "")) + 1
+
+    def slice(self, start: int, stop: int):
+        """Return (rank, player, score) for positions start..stop-1."""
+        return [
+            (bisect_left(self.order, (neg_score, "")) + 1, player, -neg_score)
+            for neg_score, player in self.order[max(start, 0):stop]
+        ]
+
+    def top(self, n: int):
+        return self.slice(0, n)
+
+    def neighbours(self, player: str, radius: int = 2):
+        """The player's own row with up to `radius` players above and below."""
+        score = self.scores.get(player)
+        if score is None:
+            return []
+        position = bisect_left(self.order, (-score, player))
+        return self.slice(position - radius, position + radius + 1)
+
+
+class Leaderboard:
+    """Scores per scope (GLOBAL_SCOPE or a guild id string), player and game.
+
+    Stored as {"global": {player: {game: score}}, "<guild id>": {...}}; the
+    old flat {player: {game: score}} file is read as the global scope.
+    """
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        if self.is_legacy(data):
+            data = {GLOBAL_SCOPE: data}
+        self.scopes = {}
+        self.boards = {}
+        for scope, players in data.items():
+            for player, stats in players.items():
+                for game in GAMES:
+                    self.set(scope, player, game, stats.get(game, 0))
+
+    @staticmethod
+    def is_legacy(data: dict) -> bool:
+        """Whether data is the old flat format, told apart by shape: there a player's stats hold scores, not dicts.
+
+        Key names can't tell them apart, since a player may be called "global".
+        """
+        return any(not isinstance(value, dict) for stats in data.values() for value in stats.values())
+
+    def board(self, scope: str, game: str) -> RankedBoard:
+        key = (scope, game)
+        if key not in self.boards:
+            self.boards[key] = RankedBoard()
+        return self.boards[key]
+
+    def stats(self, scope: str, player: str) -> dict:
+        players = self.scopes.setdefault(scope, {})
+        if player not in players:
+            players[player] = {game: 0 for game in GAMES}
+        return players[player]
+
+    def set(self, scope: str, player: str, game: str, score: int):
+        self.stats(scope, player)[game] = score
+        self.board(scope, game).set(player, score)
+
+    def record(self, guild_id, game_type: str, scores: dict):
+        """Add one game's scores to the global board and the guild's board."""
+        scopes = [GLOBAL_SCOPE] + ([str(guild_id)] if guild_id else [])
+        for scope in scopes:
+            for player, score in scores.items():
+                stats = self.stats(scope, player)
+                self.set(scope, player, "total", stats["total"] + score)
+                self.set(scope, player, game_type, stats[game_type] + score)
+
+    def top(self, scope: str, game: str = "total", n: int = 10):
+        """Return (rank, player, stats) for the best n players."""
+        players = self.scopes.get(scope, {})
+        return [(rank, player, players[player]) for rank, player, _ in self.board(scope, game).top(n)]
+
+    def standing(self, scope: str, player: str, game: str = "total", radius: int = 2):
+        """Return (rank, [(rank, player, stats)] around the player), rank None if unranked."""
+        players = self.scopes.get(scope, {})
+        board = self.board(scope, game)
+        rows = [(rank, name, players[name]) for rank, name, _ in board.neighbours(player, radius)]
+        return board.rank(player), rows
+
+    def snapshot(self):
+        return {scope: {player: dict(stats) for player, stats in players.items()} for scope, players in self.scopes.items()}
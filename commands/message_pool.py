@@ -0,0 +1,152 @@
+import asyncio
+import discord
+import logging
+import os
+import time
+from collections import deque
+from random import sample
+
+from commands.archive import ArchivedMessage, MessageArchive
+from commands.blacklist import classify_blacklisted
+from commands.density import ActivityDensity
+from commands.image import BOT_USER_IDS
+
+logger = logging.getLogger('dejavu_bot')
+
+POOL_SIZE = int(os.environ.get("MESSAGE_POOL_SIZE", 20))  # Messages kept ready per channel
+POOL_LOW_WATER = int(os.environ.get("MESSAGE_POOL_LOW_WATER", 5))  # Refill when a pool drops below this
+POOL_IDLE_TIMEOUT = 30 * 60  # Seconds without commands or messages before a channel's pool is dropped
+POOL_REFILL_RATE = float(os.environ.get("MESSAGE_POOL_REFILL_RATE", 1.0))  # History calls per second, all pools together
+POOL_REFILL_BURST = 5
+HISTORY_PAGE = 50  # Messages fetched per history call
+PICKS_PER_PAGE = 3  # Messages kept from one page, so a pool isn't one conversation
+MAX_EMPTY_FETCHES = 5  # Fetches in a row that add nothing before a refill gives up
+SWEEP_INTERVAL = 60
+
+
+class RateBudget:
+    """Token bucket shared by all pool refills so they stay well inside Discord's rate limits."""
+
+    def __init__(self, rate: float = POOL_REFILL_RATE, burst: int = POOL_REFILL_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessagePool:
+    """Per-channel pools of random messages that are already known to be recall eligible.
+
+    pop() hands out a message without any API call when the channel's pool has
+    one, and starts a background refill once the pool drops below the low-water
+    mark. Refills take from the message archive when the channel is indexed and
+    otherwise fetch history pages around activity-weighted random times, paced
+    by a shared RateBudget. Pools of channels that have gone quiet are dropped.
+    """
+
+    def __init__(self, archive: MessageArchive, density: ActivityDensity, size: int = POOL_SIZE,
+                 low_water: int = POOL_LOW_WATER, idle_timeout: float = POOL_IDLE_TIMEOUT, budget: RateBudget = None):
+        self.archive = archive
+        self.density = density
+        self.size = size
+        self.low_water = low_water
+        self.idle_timeout = idle_timeout
+        self.budget = budget or RateBudget()
+        self.pools = {}  # channel id -> {"messages": deque of ArchivedMessage, "last_activity", "task"}
+        self.last_sweep = time.monotonic()
+
+    def touch(self, channel_id: int):
+        pool = self.pools.get(channel_id)
+        if pool:
+            pool["last_activity"] = time.monotonic()
+
+    def pop(self, channel: discord.abc.Messageable, exclude_author_id: int = None):
+        """Take a ready message from the channel's pool, or None if it has none (yet)."""
+        self.evict_quiet()
+        pool = self.pools.get(channel.id)
+        if pool is None:
+            pool = self.pools[channel.id] = {"messages": deque(), "last_activity": time.monotonic(), "task": None}
+        pool["last_activity"] = time.monotonic()
+
+        message = next((m for m in pool["messages"] if m.author_id != exclude_author_id), None)
+        if message:
+            pool["messages"].remove(message)
+        if len(pool["messages"]) < self.low_water:
+            self.schedule_refill(channel, pool)
+        return message
+
+    def discard(self, channel_id: int, message_ids):
+        """Forget pooled messages that were edited or deleted."""
+        pool = self.pools.get(channel_id)
+        if pool:
+            message_ids = set(message_ids)
+            for message in [m for m in pool["messages"] if m.id in message_ids]:
+                pool["messages"].remove(message)
+
+    def evict_quiet(self):
+        now = time.monotonic()
+        if now - self.last_sweep < SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        for channel_id in [c for c, pool in self.pools.items() if now - pool["last_activity"] > self.idle_timeout]:
+            pool = self.pools.pop(channel_id)
+            if pool["task"] and not pool["task"].done():
+                pool["task"].cancel()
+            logger.debug(f"Dropped message pool for quiet channel {channel_id}")
+
+    def schedule_refill(self, channel: discord.abc.Messageable, pool: dict):
+        if pool["task"] is None or pool["task"].done():
+            pool["task"] = asyncio.create_task(self.refill(channel, pool))
+
+    async def refill(self, channel: discord.abc.Messageable, pool: dict):
+        messages = pool["messages"]
+        empty_fetches = 0
+        history_calls = 0
+        try:
+            while len(messages) < self.size and empty_fetches < MAX_EMPTY_FETCHES:
+                if self.pools.get(channel.id) is not pool:
+                    return
+                pooled = {m.id for m in messages}
+
+                archived = await self.density.sample_archived(channel.id)
+                if archived:
+                    if archived.id in pooled:
+                        empty_fetches += 1
+                    else:
+                        messages.append(archived)
+                        empty_fetches = 0
+                    continue
+
+                await self.budget.acquire()
+                history_calls += 1
+                page = [
+                    ArchivedMessage.from_message(m)
+                    async for m in channel.history(limit=HISTORY_PAGE, around=await self.density.sample_moment(channel))
+                ]
+                blacklisted = classify_blacklisted([m.content for m in page])
+                eligible = [
+                    m for m, is_blocked in zip(page, blacklisted)
+                    if m.content and m.author_id not in BOT_USER_IDS and not is_blocked and m.id not in pooled
+                ]
+                picks = sample(eligible, min(PICKS_PER_PAGE, len(eligible), self.size - len(messages)))
+                self.density.record_lookup(1, len(picks))
+                if not picks:
+                    empty_fetches += 1
+                    continue
+                empty_fetches = 0
+                messages.extend(picks)
+            logger.debug(f"Message pool for channel {channel.id} refilled to {len(messages)} with {history_calls} history call(s)")
+        except discord.errors.Forbidden:
+            logger.warning(f"No permission to read history for message pool in channel {channel.id}")
+        except Exception as e:
+            logger.error(f"Error refilling message pool for channel {channel.id}: {e}")
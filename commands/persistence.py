@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger('dejavu_bot')
+
+FILE_LOCK = threading.Lock()  # Lock for file I/O operations
+PERSIST_INTERVAL = float(os.environ.get("PERSIST_INTERVAL", 2.0))  # Seconds to coalesce writes over
+
+
+def atomic_write(path: str, data: bytes):
+    """Write a file so readers see either the old or the new contents, never a partial write."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json(path: str, payload):
+    with FILE_LOCK:
+        atomic_write(path, json.dumps(payload).encode())
+
+
+class WriteBehind:
+    """Debounced, atomic persistence for state that changes on the event loop.
+
+    Callers register a name with a path and a snapshot function, then call
+    mark_dirty(name) after each change. Writes are coalesced for `interval`
+    seconds; the snapshot is taken on the loop (so it sees a consistent state)
+    and serialized and written in a worker thread.
+    """
+
+    def __init__(self, interval: float = PERSIST_INTERVAL):
+        self.interval = interval
+        self.targets = {}  # name -> (path, snapshot, writer)
+        self.dirty = set()
+        self.flush_task = None
+
+    def register(self, name: str, path: str, snapshot, writer=write_json):
+        self.targets[name] = (path, snapshot, writer)
+
+    def mark_dirty(self, name: str):
+        self.dirty.add(name)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (startup or shutdown): write straight away
+            self.flush_sync()
+            return
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = loop.create_task(self.flush_later())
+
+    async def flush_later(self):
+        # Loop so changes made while a flush is running get their own write
+        while self.dirty:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        names, self.dirty = self.dirty, set()
+        for name in names:
+            path, snapshot, writer = self.targets[name]
+            try:
+                payload = snapshot()
+                await asyncio.to_thread(writer, path, payload)
+                logger.debug(f"Persisted {name} to {path}")
+            except Exception as e:
+                logger.error(f"Error saving {name}: {e}")
+
+    def flush_pending(self, name: str):
+        """Synchronously write one target if it has unsaved changes."""
+        if name in self.dirty:
+            self.dirty.discard(name)
+            path, snapshot, writer = self.targets[name]
+            try:
+                writer(path, snapshot())
+            except Exception as e:
+                logger.error(f"Error saving {name}: {e}")
+
+    def flush_sync(self):
+        """Write everything that is dirty, blocking; used at shutdown."""
+        for name in list(self.dirty):
+            self.flush_pending(name)
@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import defaultdict, deque
+
+logger = logging.getLogger('dejavu_bot')
+
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 100))  # Games running at once across all guilds
+SESSION_IDLE_TIMEOUT = 15 * 60  # Seconds without activity before a session is reaped
+REAP_INTERVAL = 60
+ANSWER_TIMEOUT = 60.0  # Seconds players have to answer a round
+
+
+def new_session(game: str, channel_id: int, rounds: int, mercy_mode: bool):
+    return {
+        "game": game,  # "whosaid" or "wordyapper"
+        "playing": True,
+        "channel": channel_id,
+        "rounds": 0,
+        "max_rounds": rounds,
+        "mercy_mode": mercy_mode,
+        "scores": defaultdict(int),
+        "streak": defaultdict(int),
+        # Who Said
+        "author": None,
+        "author_id": None,
+        "message": None,
+        "upcoming": deque(),  # Prefetched (author_id, author_name, content, history_calls) questions
+        "prefetch_task": None,
+        "question_ready": asyncio.Event(),  # Set whenever the prefetch queues a question
+        # Word Yapper
+        "cache": None,
+        "phrases": False,  # Ask about two-word phrases instead of words
+        "word": None,
+        "top_user": None,
+        "top_user_id": None,
+        "used_words": set(),
+        "deadline": None,  # Set while a question is open for guesses
+        "last_activity": time.monotonic()
+    }
+
+
+class SessionManager:
+    """Game sessions keyed by channel id, one game per channel.
+
+    At most MAX_SESSIONS run at once; sessions that see no activity for
+    SESSION_IDLE_TIMEOUT seconds are dropped by reap_idle().
+
+    Round timeouts for every session are driven by one scheduler task (run()):
+    deadlines go on a heap and the task sleeps until the earliest one, so an
+    open question costs nothing until it expires.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.deadlines = []  # heap of (deadline, sequence, session)
+        self.sequence = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.timeout_tasks = set()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, channel_id: int):
+        return self.sessions.get(channel_id)
+
+    def start(self, game: str, channel_id: int, rounds: int, mercy_mode: bool):
+        """Create a session for a channel, or return None if no slot is free."""
+        if len(self.sessions) >= self.max_sessions:
+            self.reap_idle()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session = new_session(game, channel_id, rounds, mercy_mode)
+        self.sessions[channel_id] = session
+        logger.debug(f"Started {game} session in channel {channel_id} ({len(self.sessions)} active)")
+        return session
+
+    def end(self, session):
+        session["playing"] = False
+        session["deadline"] = None
+        if session["prefetch_task"] and not session["prefetch_task"].done():
+            session["prefetch_task"].cancel()
+        if self.sessions.get(session["channel"]) is session:
+            del self.sessions[session["channel"]]
+        logger.debug(f"Ended {session['game']} session in channel {session['channel']} ({len(self.sessions)} active)")
+
+    @staticmethod
+    def touch(session):
+        session["last_activity"] = time.monotonic()
+
+    def reap_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for session in [s for s in self.sessions.values() if s["last_activity"] < cutoff]:
+            logger.info(f"Reaping idle {session['game']} session in channel {session['channel']}")
+            self.end(session)
+
+    def open_round(self, session, timeout: float = ANSWER_TIMEOUT):
+        """Start accepting guesses for the session's current question."""
+        deadline = time.monotonic() + timeout
+        session["deadline"] = deadline
+        self.touch(session)
+        heapq.heappush(self.deadlines, (deadline, next(self.sequence), session))
+        self.wakeup.set()
+
+    @staticmethod
+    def close_round(session):
+        """Stop accepting guesses; the pending timeout is discarded when it comes due."""
+        session["deadline"] = None
+
+    @staticmethod
+    def is_open(session) -> bool:
+        return session["playing"] and session["deadline"] is not None
+
+    async def run(self, on_timeout, reap_interval: float = REAP_INTERVAL):
+        """Call on_timeout(session) when an open round expires, and reap idle sessions."""
+        next_reap = time.monotonic() + reap_interval
+        while True:
+            now = time.monotonic()
+            if now >= next_reap:
+                self.reap_idle()
+                next_reap = now + reap_interval
+            while self.deadlines and self.deadlines[0][0] <= now:
+                deadline, _, session = heapq.heappop(self.deadlines)
+                # Entries for rounds that were answered or sessions that ended are stale
+                if self.is_open(session) and session["deadline"] == deadline:
+                    self.close_round(session)
+                    task = asyncio.create_task(on_timeout(session))
+                    self.timeout_tasks.add(task)
+                    task.add_done_callback(self.timeout_tasks.discard)
+
+            wake_at = min(next_reap, self.deadlines[0][0]) if self.deadlines else next_reap
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=max(0.0, wake_at - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
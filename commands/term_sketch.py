@@ -0,0 +1,147 @@
+import os
+from array import array
+from heapq import nlargest
+
+from commands.word_stats import RELAXED, STRICT
+
+# Approximate Word Yapper counting, see TermSketch
+SKETCH_TERMS = int(os.environ.get("SKETCH_TERMS", 20_000))  # Terms kept per approximate word sketch
+SKETCH_AUTHORS = int(os.environ.get("SKETCH_AUTHORS", 4))  # Authors kept per term
+PHRASE_SKETCH_TERMS = int(os.environ.get("PHRASE_SKETCH_TERMS", 20_000))  # Terms kept per phrase sketch
+
+
+def bigrams(words):
+    return [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TermSketch:
+    """Bounded-memory counts of which authors use which terms (words or phrases) most.
+
+    A Misra-Gries heavy-hitters summary: at most 2 * capacity terms are kept,
+    and when there are more, the (capacity + 1)-th largest count is subtracted
+    from every term and the terms left at zero are dropped. Each term keeps the
+    same kind of summary of its authors, with authors_per_term counters. The
+    summaries merge whole Counters at a time, which suits the counting pipeline.
+
+    Counts never overstate: a kept count is at most `decrement` below the true
+    count, where decrement <= N / (capacity + 1) after N occurrences, and so
+    every term used more than that is kept. An author's count for a term is at
+    most the term's own author decrement plus `decrement` low. top_author()
+    only names an author whose lead survives those bounds, so the answer to a
+    question is always right, however long the history.
+    """
+
+    def __init__(self, classify, capacity: int = SKETCH_TERMS, authors_per_term: int = SKETCH_AUTHORS):
+        self.classify = classify  # term -> NOT_CANDIDATE, RELAXED or STRICT
+        self.capacity = capacity
+        self.authors_per_term = authors_per_term
+        self.terms = {}  # term -> [count, author decrement, {author index: count}, candidacy]
+        self.decrement = 0
+        self.author_ids = array("q")
+        self.author_names = []
+        self.author_index = {}  # user id -> author index
+        self.candidate_lists = None  # (strict, relaxed) terms, rebuilt lazily after changes
+
+    @property
+    def size(self) -> int:
+        """Number of counters, used for the memory budget."""
+        return len(self.terms) + sum(len(record[2]) for record in self.terms.values())
+
+    def author_name(self, author: int) -> str:
+        return self.author_names[author]
+
+    def intern_author(self, user_id: int, name: str) -> int:
+        author = self.author_index.get(user_id)
+        if author is None:
+            author = len(self.author_ids)
+            self.author_ids.append(user_id)
+            self.author_names.append(name)
+            self.author_index[user_id] = author
+        else:
+            self.author_names[author] = name
+        return author
+
+    def add(self, user_id: int, name: str, terms):
+        self.intern_author(user_id, name)
+        counts = {}
+        for term in terms:
+            counts[(term, user_id)] = counts.get((term, user_id), 0) + 1
+        self.add_counts(counts)
+
+    def add_counts(self, counts):
+        """Add {(term, user id): count}; the authors must already be interned."""
+        for (term, user_id), count in counts.items():
+            record = self.terms.get(term)
+            if record is None:
+                record = self.terms[term] = [0, 0, {}, self.classify(term)]
+            record[0] += count
+            authors = record[2]
+            author = self.author_index[user_id]
+            authors[author] = authors.get(author, 0) + count
+            if len(authors) > 2 * self.authors_per_term:
+                record[1] += self.prune(authors, self.authors_per_term)
+        if len(self.terms) > 2 * self.capacity:
+            cut = nlargest(self.capacity + 1, (record[0] for record in self.terms.values()))[-1]
+            self.decrement += cut
+            for term, record in list(self.terms.items()):
+                record[0] -= cut
+                if record[0] <= 0:
+                    del self.terms[term]
+        self.candidate_lists = None
+
+    @staticmethod
+    def prune(counts: dict, keep: int) -> int:
+        """Subtract the (keep + 1)-th largest count from every counter; returns the amount."""
+        cut = nlargest(keep + 1, counts.values())[-1]
+        for key, count in list(counts.items()):
+            if count <= cut:
+                del counts[key]
+            else:
+                counts[key] = count - cut
+        return cut
+
+    def top_author(self, term: str, excluded_user_ids=frozenset()):
+        """The author index that certainly used a term most, or None if the counts can't tell."""
+        _, author_decrement, authors, _ = self.terms[term]
+        ranked = nlargest(2, (a for a in authors if self.author_ids[a] not in excluded_user_ids), key=authors.get)
+        if not ranked:
+            return None
+        runner_up = authors[ranked[1]] if len(ranked) > 1 else 0
+        # Unlisted authors and the runner-up may be undercounted by up to this much
+        slack = author_decrement + self.decrement
+        return ranked[0] if authors[ranked[0]] > runner_up + slack else None
+
+    def candidates(self, strict: bool):
+        if self.candidate_lists is None:
+            strict_terms = [term for term, record in self.terms.items() if record[3] == STRICT]
+            relaxed_terms = [term for term, record in self.terms.items() if record[3] >= RELAXED]
+            self.candidate_lists = (strict_terms, relaxed_terms)
+        return self.candidate_lists[0 if strict else 1]
+
+    def to_dict(self) -> dict:
+        """A JSON-ready copy; taken on the event loop, so it doesn't change while being written."""
+        return {
+            "capacity": self.capacity,
+            "authors_per_term": self.authors_per_term,
+            "decrement": self.decrement,
+            "author_ids": list(self.author_ids),
+            "author_names": list(self.author_names),
+            "terms": [
+                [term, count, author_decrement, list(authors.items()), kind]
+                for term, (count, author_decrement, authors, kind) in self.terms.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, classify) -> "TermSketch":
+        sketch = cls(classify, data["capacity"], data["authors_per_term"])
+        sketch.decrement = data["decrement"]
+        sketch.author_ids = array("q", data["author_ids"])
+        sketch.author_names = data["author_names"]
+        sketch.author_index = {user_id: author for author, user_id in enumerate(sketch.author_ids)}
+        sketch.terms = {
+            term: [count, author_decrement, dict(authors), kind]
+            for term, count, author_decrement, authors, kind in data["terms"]
+        }
+        return sketch
+
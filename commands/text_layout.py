@@ -0,0 +1,102 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+from PIL import ImageFont
+
+MARGIN = 20  # Horizontal space kept clear on each side of the text
+BLOCK_SPACING = 20  # Vertical gap between the author, message and timestamp blocks
+
+
+class PlacedLine(NamedTuple):
+    x: int
+    y: int
+    text: str
+    font: ImageFont.FreeTypeFont
+
+
+class FontMetrics:
+    """Per-font glyph advances and line height, measured once per character."""
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        ascent, descent = font.getmetrics()
+        self.line_height = ascent + descent
+        self.advances = {}
+
+    def width(self, text: str) -> int:
+        advances = self.advances
+        total = 0.0
+        for char in text:
+            advance = advances.get(char)
+            if advance is None:
+                advance = advances[char] = self.font.getlength(char)
+            total += advance
+        return int(round(total))
+
+    def wrap(self, text: str, max_width: int) -> list:
+        """Greedy word wrap on pixel widths; words wider than a line are split."""
+        lines = []
+        space = self.width(" ")
+        for paragraph in text.split("\n"):
+            line, line_width = "", 0
+            for word in paragraph.split():
+                word_width = self.width(word)
+                if line and line_width + space + word_width <= max_width:
+                    line += " " + word
+                    line_width += space + word_width
+                    continue
+                if line:
+                    lines.append(line)
+                while word_width > max_width and len(word) > 1:
+                    cut = self.fit(word, max_width)
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_width = self.width(word)
+                line, line_width = word, word_width
+            lines.append(line)
+        return lines
+
+    def fit(self, word: str, max_width: int) -> int:
+        """Number of leading characters of word that fit in max_width (at least one)."""
+        total = 0
+        for i, char in enumerate(word):
+            total += self.width(char)
+            if total > max_width:
+                return max(i, 1)
+        return len(word)
+
+
+@lru_cache(maxsize=16)
+def metrics_for(font: ImageFont.FreeTypeFont) -> FontMetrics:
+    return FontMetrics(font)
+
+
+def layout_card(author: str, message: str, timestamp: str, size: tuple,
+                title_font: ImageFont.FreeTypeFont, body_font: ImageFont.FreeTypeFont,
+                centered: bool) -> list:
+    """Position every line of a dejavu image in one pass.
+
+    Returns PlacedLine entries, each horizontally centered, with the block either
+    vertically centered or starting near the top of the image.
+    """
+    width, height = size
+    max_width = max(width - 2 * MARGIN, 1)
+    title = metrics_for(title_font)
+    body = metrics_for(body_font)
+
+    blocks = [
+        (title, title.wrap(author, max_width)),
+        (body, body.wrap(message, max_width)),
+        (body, body.wrap(timestamp, max_width)),
+    ]
+    total_height = sum(metrics.line_height * len(lines) for metrics, lines in blocks)
+    total_height += BLOCK_SPACING * (len(blocks) - 1)
+    y = (height - total_height) // 2 if centered else MARGIN
+
+    placed = []
+    for metrics, lines in blocks:
+        for line in lines:
+            placed.append(PlacedLine((width - metrics.width(line)) // 2, y, line, metrics.font))
+            y += metrics.line_height
+        y += BLOCK_SPACING
+    return placed
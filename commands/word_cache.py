@@ -0,0 +1,546 @@
+import asyncio
+import discord
+import enchant
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from random import randrange
+
+from commands.persistence import FILE_LOCK, WriteBehind, atomic_write, write_json
+from commands.term_sketch import PHRASE_SKETCH_TERMS, TermSketch, bigrams
+from commands.word_stats import NOT_CANDIDATE, RELAXED, STRICT, WordStats, write_word_stats
+
+logger = logging.getLogger('dejavu_bot')
+
+WORD_CACHE_DIR = "word_cache"
+WORD_CACHE_DURATION = 3600
+# "exact" counts the latest 10000 messages and every message after them;
+# "approximate" counts the whole archived history into a fixed-size TermSketch
+WORD_CACHE_MODES = ("exact", "approximate")
+# Upper bound on (word, author) counters kept in memory across all channels
+MAX_WORD_CACHE_ENTRIES = int(os.environ.get("MAX_WORD_CACHE_ENTRIES", 2_000_000))
+
+
+COMMON_WORDS_TO_EXCLUDE = {
+    'the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'i',
+    'it', 'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at',
+    'this', 'but', 'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she',
+    'or', 'an', 'will', 'my', 'one', 'all', 'would', 'there', 'their', 'what',
+    'so', 'up', 'out', 'if', 'about', 'who', 'get', 'which', 'go', 'me',
+    'when', 'make', 'can', 'like', 'time', 'no', 'just', 'him', 'know', 'take',
+    'people', 'into', 'year', 'your', 'good', 'some', 'could', 'these', 'give', 'day', 'most', 'us'
+}
+
+DICTIONARY = enchant.Dict("en_US")
+
+PICK_ATTEMPTS = 20  # Random draws before falling back to a scan of the candidates
+
+# Word counting pipeline used to build and refresh caches from channel history
+WORD_COUNT_POOL = os.environ.get("WORD_COUNT_POOL", "thread")  # "thread" or "process"
+WORD_COUNT_WORKERS = int(os.environ.get("WORD_COUNT_WORKERS", min(4, os.cpu_count() or 1)))
+PIPELINE_PAGE_SIZE = 100  # Messages per page; one history request
+PIPELINE_QUEUE_PAGES = 8  # Pages fetched ahead of the counting workers
+
+
+def classify_word(word: str) -> int:
+    """Whether Word Yapper may ask about a word: STRICT, RELAXED (fallback) or NOT_CANDIDATE."""
+    if (word in COMMON_WORDS_TO_EXCLUDE
+            or len(word) <= 1  # Exclude very short words
+            or word.isdigit()):  # Exclude strings of just numbers
+        return NOT_CANDIDATE
+    if len(word) > 2 and DICTIONARY.check(word):  # Check if it's a valid English word
+        return STRICT
+    return RELAXED
+
+
+def classify_phrase(phrase: str) -> int:
+    """Candidacy of a phrase: a question if any word is, relaxed if any word is only relaxed."""
+    kinds = [classify_word(word) for word in phrase.split(" ")]
+    if max(kinds) == NOT_CANDIDATE:
+        return NOT_CANDIDATE
+    return RELAXED if RELAXED in kinds else STRICT
+
+
+def empty_word_cache(guild_id, channel_id, mode="exact"):
+    return {
+        "guild_id": guild_id,
+        "channel_id": channel_id,
+        "mode": mode,
+        "stats": WordStats(classify_word) if mode == "exact" else TermSketch(classify_word),
+        "phrases": None,  # TermSketch of two-word phrases, counted once the phrase variant is played here
+        "first_message_id": None,  # Oldest message folded into the counts
+        "last_message_id": None,  # Newest message folded into the counts
+        "last_update": 0,
+        "cache_duration": WORD_CACHE_DURATION,
+        "updating": False,  # Prevents concurrent updates of the same channel
+        "pending": [],  # Live messages that arrived during an update
+        "size": 0
+    }
+
+
+def empty_phrase_sketch():
+    return TermSketch(classify_phrase, PHRASE_SKETCH_TERMS)
+
+
+def tokenize(content: str):
+    # Limit word processing to prevent DoS
+    return re.findall(r'\w+', content.lower())[:100]  # Limit to 100 words per message
+
+
+def count_message_words(cache, message: discord.Message):
+    """Fold one message into a channel's word counts."""
+    if message.author.bot:
+        return
+    words = tokenize(message.content)
+    cache["stats"].add(message.author.id, message.author.name, words)
+    if cache["phrases"] is not None:
+        cache["phrases"].add(message.author.id, message.author.name, bigrams(words))
+    if not cache["last_message_id"] or message.id > cache["last_message_id"]:
+        cache["last_message_id"] = message.id
+
+
+_count_executor = None
+
+
+def get_count_executor():
+    global _count_executor
+    if _count_executor is None:
+        if WORD_COUNT_POOL == "process":
+            _count_executor = ProcessPoolExecutor(max_workers=WORD_COUNT_WORKERS)
+        else:
+            _count_executor = ThreadPoolExecutor(max_workers=WORD_COUNT_WORKERS, thread_name_prefix="word_count")
+        logger.info(f"Started {WORD_COUNT_POOL} word count pool with {WORD_COUNT_WORKERS} workers")
+    return _count_executor
+
+
+def shutdown_count_pool():
+    global _count_executor
+    if _count_executor is not None:
+        _count_executor.shutdown(wait=False, cancel_futures=True)
+        _count_executor = None
+
+
+def count_page(page, count_words=True, count_phrases=False):
+    """Count the words and/or phrases of a page of (user id, content) pairs; runs in the count pool."""
+    words, phrases = Counter(), Counter()
+    for user_id, content in page:
+        tokens = tokenize(content)
+        if count_words:
+            for word in tokens:
+                words[(word, user_id)] += 1
+        if count_phrases:
+            for phrase in bigrams(tokens):
+                phrases[(phrase, user_id)] += 1
+    return words, phrases
+
+
+async def count_history(cache, messages, count_words=True) -> int:
+    """Fold an async iterator of ArchivedMessage rows into a cache.
+
+    Runs as a pipeline so fetching and counting overlap: this coroutine pulls
+    messages and queues them in pages, WORD_COUNT_WORKERS consumers tokenize
+    and count pages in the count pool, and each page's Counter is merged into
+    the cache back on the event loop. The queue is bounded, so a slow pool
+    pauses fetching instead of buffering history. If counting a page fails,
+    the workers are cancelled and the error is raised here; the counts are
+    then incomplete and the caller should drop the cache. Phrases are counted
+    too if the cache has a phrase sketch; with count_words=False only they
+    are, and the cache's first and last_message_id are left alone. Returns the number of
+    messages counted.
+    """
+    loop = asyncio.get_running_loop()
+    stats = cache["stats"] if count_words else None
+    phrases = cache["phrases"]
+    sketches = [sketch for sketch in (stats, phrases) if sketch is not None]
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_PAGES)
+
+    async def consume():
+        while (page := await queue.get()) is not None:
+            word_counts, phrase_counts = await loop.run_in_executor(
+                get_count_executor(), count_page, page, stats is not None, phrases is not None
+            )
+            if stats is not None:
+                stats.add_counts(word_counts)
+            if phrases is not None:
+                phrases.add_counts(phrase_counts)
+
+    workers = [asyncio.create_task(consume()) for _ in range(WORD_COUNT_WORKERS)]
+
+    async def put(item):
+        # A failed worker stops draining the queue, so never wait on a full queue without watching them
+        putter = asyncio.ensure_future(queue.put(item))
+        try:
+            while not putter.done():
+                running = [worker for worker in workers if not worker.done()]
+                await asyncio.wait([putter, *running], return_when=asyncio.FIRST_COMPLETED)
+                for worker in workers:
+                    if worker.done() and worker.exception():
+                        raise worker.exception()
+        finally:
+            putter.cancel()
+
+    names = {}  # user id -> (message id, name) of their newest message seen
+    newest_id = cache["last_message_id"]
+    oldest_id = cache["first_message_id"]
+    counted = 0
+    started = time.perf_counter()
+    try:
+        page = []
+        async for message in messages:
+            if message.author_bot:
+                continue
+            for sketch in sketches:
+                sketch.intern_author(message.author_id, message.author_name)
+            if message.id > names.get(message.author_id, (0, None))[0]:
+                names[message.author_id] = (message.id, message.author_name)
+            if not newest_id or message.id > newest_id:
+                newest_id = message.id
+            if not oldest_id or message.id < oldest_id:
+                oldest_id = message.id
+            page.append((message.author_id, message.content))
+            counted += 1
+            if len(page) >= PIPELINE_PAGE_SIZE:
+                await put(page)
+                page = []
+        if page:
+            await put(page)
+        for _ in workers:
+            await put(None)
+        await asyncio.gather(*workers)
+    except BaseException:
+        for worker in workers:
+            worker.cancel()
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    for user_id, (_, name) in names.items():
+        for sketch in sketches:
+            sketch.intern_author(user_id, name)
+    if count_words:
+        cache["first_message_id"], cache["last_message_id"] = oldest_id, newest_id
+    logger.debug(f"Counted {counted} messages for channel {cache['channel_id']} in {time.perf_counter() - started:.2f}s")
+    return counted
+
+
+def is_stale(cache) -> bool:
+    return time.time() - cache["last_update"] > cache["cache_duration"]
+
+
+def pick_word(cache, used_words, excluded_author_ids=frozenset(), phrases=False):
+    """Pick an unused candidate word and its top author as (word, author id, author name), or Nones.
+
+    Draws at random and rejects used words, which is O(1) while most candidates
+    are unused; only a nearly exhausted list falls back to a scan. Strict
+    candidates are tried first, then relaxed ones. With phrases, picks a
+    two-word phrase instead.
+    """
+    if phrases or cache["mode"] == "approximate":
+        return pick_term(cache["phrases"] if phrases else cache["stats"], used_words, excluded_author_ids)
+    stats = cache["stats"]
+
+    def top_author(word_id):
+        for author in stats.top_authors(word_id):
+            if stats.author_ids[author] not in excluded_author_ids:
+                return author
+        return None
+
+    def result(word_id):
+        author = top_author(word_id)
+        return stats.word(word_id), stats.author_ids[author], stats.author_name(author)
+
+    for strict in (True, False):
+        compacted, recent = stats.candidates(strict)
+        total = len(compacted) + len(recent)
+        if not total:
+            continue
+        for _ in range(PICK_ATTEMPTS):
+            i = randrange(total)
+            word_id = compacted[i] if i < len(compacted) else recent[i - len(compacted)]
+            if stats.word(word_id) not in used_words and top_author(word_id) is not None:
+                return result(word_id)
+        remaining = [
+            word_id for part in (compacted, recent) for word_id in part
+            if stats.word(word_id) not in used_words and top_author(word_id) is not None
+        ]
+        if remaining:
+            return result(remaining[randrange(len(remaining))])
+        logger.warning("Not enough words found with current criteria. Relaxing restrictions.")
+    return None, None, None
+
+
+def pick_term(sketch: TermSketch, used_words, excluded_author_ids=frozenset()):
+    """pick_word for a TermSketch; only terms whose top author is certain are asked about."""
+    for strict in (True, False):
+        terms = sketch.candidates(strict)
+        if not terms:
+            continue
+        for _ in range(PICK_ATTEMPTS):
+            term = terms[randrange(len(terms))]
+            if term not in used_words and (author := sketch.top_author(term, excluded_author_ids)) is not None:
+                return term, sketch.author_ids[author], sketch.author_name(author)
+        remaining = [
+            (term, author) for term in terms
+            if term not in used_words and (author := sketch.top_author(term, excluded_author_ids)) is not None
+        ]
+        if remaining:
+            term, author = remaining[randrange(len(remaining))]
+            return term, sketch.author_ids[author], sketch.author_name(author)
+        logger.warning("Not enough words found with current criteria. Relaxing restrictions.")
+    return None, None, None
+
+
+def snapshot_word_cache(cache):
+    """What WordCacheStore writes: a WordStats copy for exact caches, a JSON-ready dict for approximate ones."""
+    meta = {
+        "first_message_id": cache['first_message_id'],
+        "last_message_id": cache['last_message_id'],
+        "last_update": cache['last_update'],
+        "cache_duration": cache['cache_duration'],
+    }
+    if cache["mode"] == "approximate":
+        return dict(meta, words=cache["stats"].to_dict())
+    stats = cache["stats"].copy()
+    stats.meta = meta
+    return stats
+
+
+def snapshot_phrases(cache):
+    """What WordCacheStore writes for a phrase sketch: tied to the word counts it was counted alongside."""
+    return {
+        "mode": cache["mode"],
+        "last_message_id": cache["last_message_id"],
+        "phrases": cache["phrases"].to_dict(),
+    }
+
+
+def load_legacy_word_cache(cache, path: str) -> bool:
+    """Read an exact word cache saved in the old JSON format (word -> author name -> count); returns whether it had counts."""
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    authors = saved.get("authors", {})
+    if not authors:
+        return False  # Saved before author ids were recorded; rebuild from history
+    stats = cache["stats"]
+    for word, counts in saved['data'].items():
+        for name, count in counts.items():
+            if name not in authors:
+                continue  # Counted before author ids were recorded
+            author = stats.intern_author(authors[name], name)
+            row = stats.delta.setdefault(stats.intern_word(word), {})
+            stats.delta_pairs += author not in row
+            row[author] = row.get(author, 0) + count
+    stats.compact()
+    cache["last_message_id"] = saved.get("last_message_id")
+    cache["last_update"] = saved.get("last_update", 0)
+    cache["cache_duration"] = saved.get("cache_duration", WORD_CACHE_DURATION)
+    return True
+
+
+class WordCacheStore:
+    """Word statistics keyed by (guild id, channel id).
+
+    Each channel is persisted to its own file under WORD_CACHE_DIR, a
+    memory-mappable WordStats file or, for channels in approximate mode (see
+    set_mode), the JSON of its TermSketch, and has its own freshness. Channels
+    where the phrase variant has been played also keep their phrase sketch, in
+    a JSON file of its own. Channels are kept in LRU order and the least recently used
+    ones are saved and dropped from memory once the total number of counters
+    exceeds MAX_WORD_CACHE_ENTRIES; they are reloaded from disk on next use.
+    """
+
+    def __init__(self, persistence: WriteBehind, directory: str = WORD_CACHE_DIR, max_entries: int = MAX_WORD_CACHE_ENTRIES):
+        self.persistence = persistence
+        self.directory = directory
+        self.max_entries = max_entries
+        self.caches = OrderedDict()
+        self.modes = self.load_modes()  # str(channel id) -> mode, for channels not in "exact" mode
+        self.persistence.register("word_cache_modes", self.modes_path, lambda: dict(self.modes))
+
+    @property
+    def modes_path(self) -> str:
+        return os.path.join(self.directory, "modes.json")
+
+    def load_modes(self) -> dict:
+        with FILE_LOCK:
+            try:
+                with open(self.modes_path, 'r') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                return {}
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading word cache modes: {e}")
+                return {}
+
+    def mode_for(self, channel_id) -> str:
+        return self.modes.get(str(channel_id), "exact")
+
+    def set_mode(self, guild_id, channel_id, mode: str):
+        """Switch how a channel is counted; the next game loads (or builds) the cache for that mode."""
+        if mode == "exact":
+            self.modes.pop(str(channel_id), None)
+        else:
+            self.modes[str(channel_id)] = mode
+        self.persistence.mark_dirty("word_cache_modes")
+        cache = self.caches.pop((guild_id, channel_id), None)
+        if cache:
+            self.save(cache)
+
+    def path_for(self, guild_id, channel_id, mode="exact") -> str:
+        extension = ".bin" if mode == "exact" else ".sketch.json"
+        return os.path.join(self.directory, f"{guild_id or 'dm'}_{channel_id}{extension}")
+
+    def legacy_path_for(self, guild_id, channel_id) -> str:
+        return os.path.join(self.directory, f"{guild_id or 'dm'}_{channel_id}.json")
+
+    def phrases_path_for(self, guild_id, channel_id) -> str:
+        return os.path.join(self.directory, f"{guild_id or 'dm'}_{channel_id}.phrases.json")
+
+    @staticmethod
+    def persistence_name(guild_id, channel_id, mode="exact") -> str:
+        return f"word_cache:{mode}:{guild_id or 'dm'}_{channel_id}"
+
+    @staticmethod
+    def phrases_persistence_name(guild_id, channel_id) -> str:
+        return f"word_cache:phrases:{guild_id or 'dm'}_{channel_id}"
+
+    def get(self, guild_id, channel_id):
+        """Return the cache for a channel, loading it from disk if needed."""
+        key = (guild_id, channel_id)
+        cache = self.caches.get(key)
+        if cache is None:
+            cache = self.load(guild_id, channel_id)
+            self.caches[key] = cache
+            self.evict()
+        else:
+            self.caches.move_to_end(key)
+        return cache
+
+    def discard(self, guild_id, channel_id):
+        """Drop a channel's in-memory cache, e.g. after a failed update left it half counted; the next get() reloads it from disk."""
+        self.caches.pop((guild_id, channel_id), None)
+
+    def peek(self, guild_id, channel_id):
+        """Return the in-memory cache for a channel without loading or reordering."""
+        return self.caches.get((guild_id, channel_id))
+
+    def load(self, guild_id, channel_id):
+        mode = self.mode_for(channel_id)
+        logger.debug(f"Loading {mode} word cache for channel {channel_id}")
+        cache = empty_word_cache(guild_id, channel_id, mode)
+        path = self.path_for(guild_id, channel_id, mode)
+        # An evicted copy may still be waiting to be written
+        self.persistence.flush_pending(self.persistence_name(guild_id, channel_id, mode))
+        if mode == "exact":
+            self.convert_legacy(guild_id, channel_id)
+        with FILE_LOCK:
+            if not os.path.exists(path):
+                return cache
+            try:
+                if mode == "exact":
+                    stats = WordStats.from_file(path, classify_word)
+                    meta = stats.meta
+                else:
+                    with open(path, 'r') as f:
+                        meta = json.load(f)
+                    stats = TermSketch.from_dict(meta.pop("words"), classify_word)
+                meta.pop("phrases", None)  # Kept in the meta by older versions; phrases now have their own file
+                cache["stats"] = stats
+                cache["first_message_id"] = meta.get("first_message_id")  # Not saved by older versions
+                cache["last_message_id"] = meta.get("last_message_id")
+                cache["last_update"] = meta.get("last_update", 0)
+                cache["cache_duration"] = meta.get("cache_duration", WORD_CACHE_DURATION)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error loading word cache for channel {channel_id}: {e}, starting fresh")
+                return empty_word_cache(guild_id, channel_id, mode)
+        cache["phrases"] = self.load_phrases(cache)
+        self.update_size(cache)
+        return cache
+
+    def convert_legacy(self, guild_id, channel_id):
+        """Convert a channel's word cache from the old JSON format to a .bin file once, then remove the JSON."""
+        legacy_path = self.legacy_path_for(guild_id, channel_id)
+        with FILE_LOCK:
+            if not os.path.exists(legacy_path):
+                return
+            try:
+                cache = empty_word_cache(guild_id, channel_id)
+                if os.path.exists(self.path_for(guild_id, channel_id)):
+                    logger.info(f"Removing old JSON word cache for channel {channel_id}, already converted")
+                elif load_legacy_word_cache(cache, legacy_path):
+                    atomic_write(self.path_for(guild_id, channel_id), snapshot_word_cache(cache).to_bytes())
+                    logger.info(f"Converted word cache for channel {channel_id} from JSON")
+                else:
+                    logger.info(f"Old word cache for channel {channel_id} has no author ids, rebuilding")
+                os.remove(legacy_path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error converting word cache for channel {channel_id}: {e}, rebuilding")
+                try:
+                    os.remove(legacy_path)
+                except OSError:
+                    pass
+
+    def load_phrases(self, cache):
+        """A channel's saved phrase sketch, or None if there is none that matches its word counts."""
+        guild_id, channel_id = cache["guild_id"], cache["channel_id"]
+        path = self.phrases_path_for(guild_id, channel_id)
+        self.persistence.flush_pending(self.phrases_persistence_name(guild_id, channel_id))
+        with FILE_LOCK:
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if data["mode"] != cache["mode"] or data["last_message_id"] != cache["last_message_id"]:
+                    # Saved alongside other word counts; recounted when the phrase variant is next played
+                    logger.info(f"Phrase counts for channel {channel_id} are out of date, dropping them")
+                    return None
+                return TermSketch.from_dict(data["phrases"], classify_phrase)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error loading phrase counts for channel {channel_id}: {e}")
+                return None
+
+    def save(self, cache):
+        """Schedule a write-behind save of a channel's cache."""
+        name = self.persistence_name(cache["guild_id"], cache["channel_id"], cache["mode"])
+        # Re-register every time: a reloaded channel is a new dict
+        self.persistence.register(
+            name, self.path_for(cache["guild_id"], cache["channel_id"], cache["mode"]), lambda: snapshot_word_cache(cache),
+            writer=write_word_stats if cache["mode"] == "exact" else write_json
+        )
+        self.persistence.mark_dirty(name)
+        if cache["phrases"] is not None:
+            name = self.phrases_persistence_name(cache["guild_id"], cache["channel_id"])
+            self.persistence.register(
+                name, self.phrases_path_for(cache["guild_id"], cache["channel_id"]), lambda: snapshot_phrases(cache)
+            )
+            self.persistence.mark_dirty(name)
+
+    def count_message(self, cache, message: discord.Message):
+        """Fold a live message into a channel's counts and schedule a save, so they outlive a restart."""
+        count_message_words(cache, message)
+        self.update_size(cache)
+        self.save(cache)
+
+    def update_size(self, cache):
+        cache["size"] = cache["stats"].size + (cache["phrases"].size if cache["phrases"] is not None else 0)
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used channels until the counter budget is met."""
+        total = sum(cache["size"] for cache in self.caches.values())
+        for key in list(self.caches):
+            if total <= self.max_entries or len(self.caches) <= 1:
+                break
+            cache = self.caches[key]
+            if cache["updating"]:
+                continue
+            logger.debug(f"Evicting word cache for channel {cache['channel_id']}")
+            # Counts folded in from live messages since the last save would be lost
+            self.save(cache)
+            total -= cache["size"]
+            del self.caches[key]
@@ -0,0 +1,240 @@
+import json
+import mmap
+import struct
+from array import array
+from heapq import nlargest
+
+from commands.persistence import FILE_LOCK, atomic_write
+
+MAGIC = b"DJWS"
+VERSION = 1
+# magic, version, then byte lengths of: meta, word offsets, word blob, author ids, row offsets, cols, vals, top, strict, relaxed
+HEADER = struct.Struct("<4sI10Q")
+ALIGN = 8
+
+# Word Yapper candidacy of a word, see commands.word_cache.classify_word
+NOT_CANDIDATE, RELAXED, STRICT = 0, 1, 2
+
+
+def padded(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % ALIGN)
+
+
+class WordStats:
+    """How often each author used each word in one channel.
+
+    Words and authors are interned to integer ids; authors by user id, so a
+    rename doesn't split anyone's counts (the latest name is kept for display).
+    Counts are a CSR matrix, one row per word: row_offsets[w]..row_offsets[w+1]
+    index into cols (author) and vals (count). Loaded from the binary format the
+    arrays are memoryviews over a read-only mmap, so loading does no parsing.
+    Counts added after a load or compact() go into a small delta of dicts.
+
+    For Word Yapper, the candidate word lists (strict and relaxed) and the two
+    top authors of every word are stored with the counts, so a loaded channel
+    can start a game straight away.
+    """
+
+    def __init__(self, classify):
+        self.classify = classify  # word -> NOT_CANDIDATE, RELAXED or STRICT
+        self.meta = {}
+        # Words: the compacted ones live in a blob, newer ones in a list
+        self.word_offsets = array("I", [0])
+        self.word_blob = b""
+        self.new_words = []
+        self.word_ids = None  # word -> id, built when the first message is counted
+        # Authors
+        self.author_ids = array("q")
+        self.author_names = []
+        self.author_index = {}  # user id -> author index
+        # Counts
+        self.row_offsets = array("I", [0])
+        self.cols = array("I")
+        self.vals = array("I")
+        self.top = array("I")  # Two per compacted word: author index + 1, 0 for none
+        self.delta = {}  # word id -> {author index: count}
+        self.delta_pairs = 0
+        # Word Yapper candidates
+        self.strict = array("I")
+        self.relaxed = array("I")
+        self.new_strict = []
+        self.new_relaxed = []
+
+    @property
+    def base_words(self) -> int:
+        return len(self.word_offsets) - 1
+
+    def __len__(self):
+        return self.base_words + len(self.new_words)
+
+    @property
+    def size(self) -> int:
+        """Number of (word, author) counters, used for the memory budget."""
+        return len(self.cols) + self.delta_pairs
+
+    def word(self, word_id: int) -> str:
+        if word_id < self.base_words:
+            return bytes(self.word_blob[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]).decode()
+        return self.new_words[word_id - self.base_words]
+
+    def author_name(self, author: int) -> str:
+        return self.author_names[author]
+
+    def intern_word(self, word: str) -> int:
+        if self.word_ids is None:
+            self.word_ids = {self.word(i): i for i in range(len(self))}
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = len(self)
+            self.new_words.append(word)
+            self.word_ids[word] = word_id
+            kind = self.classify(word)
+            if kind >= RELAXED:
+                self.new_relaxed.append(word_id)
+            if kind == STRICT:
+                self.new_strict.append(word_id)
+        return word_id
+
+    def intern_author(self, user_id: int, name: str) -> int:
+        author = self.author_index.get(user_id)
+        if author is None:
+            author = len(self.author_ids)
+            self.author_ids.append(user_id)
+            self.author_names.append(name)
+            self.author_index[user_id] = author
+        else:
+            self.author_names[author] = name
+        return author
+
+    def add(self, user_id: int, name: str, words):
+        author = self.intern_author(user_id, name)
+        for word in words:
+            row = self.delta.setdefault(self.intern_word(word), {})
+            if author not in row:
+                self.delta_pairs += 1
+                row[author] = 0
+            row[author] += 1
+
+    def add_counts(self, counts):
+        """Add {(word, user id): count}, e.g. from a worker; the authors must already be interned."""
+        for (word, user_id), count in counts.items():
+            author = self.author_index[user_id]
+            row = self.delta.setdefault(self.intern_word(word), {})
+            if author not in row:
+                self.delta_pairs += 1
+                row[author] = 0
+            row[author] += count
+
+    def row(self, word_id: int) -> dict:
+        """Return {author index: count} for a word."""
+        counts = {}
+        if word_id < self.base_words:
+            for k in range(self.row_offsets[word_id], self.row_offsets[word_id + 1]):
+                counts[self.cols[k]] = self.vals[k]
+        for author, count in self.delta.get(word_id, {}).items():
+            counts[author] = counts.get(author, 0) + count
+        return counts
+
+    def top_authors(self, word_id: int):
+        """Author indexes of the (up to) two most frequent users of a word."""
+        if word_id < self.base_words and word_id not in self.delta:
+            return tuple(t - 1 for t in self.top[2 * word_id:2 * word_id + 2] if t)
+        counts = self.row(word_id)
+        return tuple(nlargest(2, counts, key=counts.get))
+
+    def candidates(self, strict: bool):
+        """The compacted and the newer candidate word ids, as two sequences."""
+        return (self.strict, self.new_strict) if strict else (self.relaxed, self.new_relaxed)
+
+    def copy(self) -> "WordStats":
+        """A copy that can be compacted and written in another thread.
+
+        Compacted arrays are never modified in place, so they are shared; the
+        parts that change as messages are counted are copied.
+        """
+        other = WordStats(self.classify)
+        other.__dict__.update(self.__dict__)
+        other.meta = dict(self.meta)
+        other.new_words = list(self.new_words)
+        other.word_ids = None
+        other.author_ids = array("q", self.author_ids)
+        other.author_names = list(self.author_names)
+        other.delta = {word_id: dict(row) for word_id, row in self.delta.items()}
+        other.new_strict = list(self.new_strict)
+        other.new_relaxed = list(self.new_relaxed)
+        return other
+
+    def compact(self):
+        """Merge the delta into fresh CSR arrays; word and author ids stay the same."""
+        word_offsets = array("I", self.word_offsets)
+        blob = bytearray(self.word_blob)
+        for word in self.new_words:
+            blob += word.encode()
+            word_offsets.append(len(blob))
+
+        row_offsets, cols, vals, top = array("I", [0]), array("I"), array("I"), array("I")
+        for word_id in range(len(self)):
+            counts = self.row(word_id)
+            for author in sorted(counts):
+                cols.append(author)
+                vals.append(counts[author])
+            row_offsets.append(len(cols))
+            ranked = nlargest(2, counts, key=counts.get)
+            top.extend([author + 1 for author in ranked] + [0] * (2 - len(ranked)))
+
+        self.word_offsets, self.word_blob, self.new_words = word_offsets, bytes(blob), []
+        self.row_offsets, self.cols, self.vals, self.top = row_offsets, cols, vals, top
+        self.strict = array("I", list(self.strict) + self.new_strict)
+        self.relaxed = array("I", list(self.relaxed) + self.new_relaxed)
+        self.new_strict, self.new_relaxed = [], []
+        self.delta, self.delta_pairs = {}, 0
+
+    def to_bytes(self) -> bytes:
+        """Serialize; compacts first if anything was counted since the last compaction."""
+        if self.delta or self.new_words:
+            self.compact()
+        meta = dict(self.meta, author_names=self.author_names)
+        sections = [json.dumps(meta).encode(), self.word_offsets.tobytes(), bytes(self.word_blob)] + [
+            part.tobytes()  # arrays and memoryviews alike
+            for part in (self.author_ids, self.row_offsets, self.cols, self.vals, self.top, self.strict, self.relaxed)
+        ]
+        header = HEADER.pack(MAGIC, VERSION, *(len(s) for s in sections))
+        return padded(header) + b"".join(padded(s) for s in sections)
+
+    @classmethod
+    def from_file(cls, path: str, classify) -> "WordStats":
+        """Map a file written by to_bytes(); the arrays are views into the mapping (native byte order)."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+        magic, version, *lengths = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} word stats file")
+        position = HEADER.size + (-HEADER.size % ALIGN)
+        parts = []
+        for length in lengths:
+            parts.append(view[position:position + length])
+            position += length + (-length % ALIGN)
+        meta_bytes, word_offsets, word_blob, author_ids, row_offsets, cols, vals, top, strict, relaxed = parts
+
+        stats = cls(classify)
+        stats.meta = json.loads(bytes(meta_bytes))
+        stats.author_names = stats.meta.pop("author_names")
+        stats.word_offsets = word_offsets.cast("I")
+        stats.word_blob = word_blob
+        stats.author_ids = array("q", author_ids.cast("q"))  # Small, and appended to as new authors post
+        stats.author_index = {user_id: author for author, user_id in enumerate(stats.author_ids)}
+        stats.row_offsets = row_offsets.cast("I")
+        stats.cols = cols.cast("I")
+        stats.vals = vals.cast("I")
+        stats.top = top.cast("I")
+        stats.strict = strict.cast("I")
+        stats.relaxed = relaxed.cast("I")
+        return stats
+
+
+def write_word_stats(path: str, stats: WordStats):
+    """WriteBehind writer: stats is a copy() taken on the event loop."""
+    data = stats.to_bytes()
+    with FILE_LOCK:
+        atomic_write(path, data)
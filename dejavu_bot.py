@@ -5,22 +5,16 @@ Arguments: text, image, whosaid
 """
 
 import os
-from datetime import datetime, timedelta, timezone
-from random import choice, randrange, randint
+from datetime import datetime, timezone
 from typing import Literal
-import re
-from collections import defaultdict
 import time
 import discord
 from discord import app_commands, Embed
 import logging
 import json
-import enchant
 import asyncio
 from io import BytesIO
-import aiohttp
 from discord.ui import View, Button
-import threading
 
 from dotenv import load_dotenv
 
@@ -28,8 +22,29 @@ from commands.image import (
     BACKGROUNDS,
     BOT_USER_IDS,
     create_and_send_image,
-    is_blacklisted,
-    JumpLinkView
+    JumpLinkView,
+    preload_assets,
+    shutdown_render_pool
+)
+from commands.blacklist import is_blacklisted
+from commands.archive import ArchivedMessage, MessageArchive, from_history, since
+from commands.crawler import HistoryCrawler
+from commands.hall_of_fame import HallOfFame, HallOfFameCursor, HallOfFameSearchIndex
+from commands.image_mirror import ImageMirror
+from commands.density import ActivityDensity
+from commands.downloads import Downloader
+from commands.leaderboard import GLOBAL_SCOPE, Leaderboard
+from commands.message_pool import MessagePool
+from commands.persistence import FILE_LOCK, WriteBehind
+from commands.sessions import SessionManager
+from commands.word_cache import (
+    WORD_CACHE_MODES,
+    WordCacheStore,
+    count_history,
+    empty_phrase_sketch,
+    is_stale,
+    pick_word,
+    shutdown_count_pool
 )
 
 # Load environment variables
@@ -44,21 +59,6 @@ VERY_DARK_COLORS = [
     "indigo", "midnightblue", "navy", "purple",
 ]
 
-CACHE_FILE_PATH = "word_cache.json"
-FILE_LOCK = threading.Lock()  # Lock for file I/O operations
-
-COMMON_WORDS_TO_EXCLUDE = {
-    'the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'i',
-    'it', 'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at',
-    'this', 'but', 'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she',
-    'or', 'an', 'will', 'my', 'one', 'all', 'would', 'there', 'their', 'what',
-    'so', 'up', 'out', 'if', 'about', 'who', 'get', 'which', 'go', 'me',
-    'when', 'make', 'can', 'like', 'time', 'no', 'just', 'him', 'know', 'take',
-    'people', 'into', 'year', 'your', 'good', 'some', 'could', 'these', 'give', 'day', 'most', 'us'
-}
-
-DICTIONARY = enchant.Dict("en_US")
-
 LEADERBOARD_FILE = "leaderboard.json"
 HALL_OF_FAME_FILE = "/data/hall_of_fame.json"
 STREAK_BONUS = 1  # Points awarded for maintaining a streak
@@ -74,6 +74,9 @@ except ValueError:
     MERCY_USER_ID = 0
 
 MAX_RETRIES = 3
+WHOSAID_FETCH_ATTEMPTS = 10  # History lookups per Who Said question before giving up
+WHOSAID_PREFETCH = 2  # Who Said questions to keep ready ahead of the current round
+INDEX_TOUCH_INTERVAL = 60  # Seconds between keep-alives of a session waiting for a channel to be indexed
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -87,69 +90,25 @@ class DejavuBot(discord.Client):
         intents.message_content = True
         super().__init__(intents=intents)
         self.tree = app_commands.CommandTree(self)
-        self.whosaid = {
-            "playing": False,
-            "channel": None,
-            "author": None,
-            "message": None,
-            "rounds": 0,
-            "max_rounds": 5,
-            "scores": defaultdict(int),
-            "streak": defaultdict(int)
-        }
-        self.word_yapper = {
-            "playing": False,
-            "channel": None,
-            "word": None,
-            "top_user": None,
-            "rounds": 0,
-            "max_rounds": 5,
-            "scores": defaultdict(int),
-            "used_words": set(),
-            "streak": defaultdict(int)
-        }
-        self.word_cache = self.load_word_cache()
+        self.sessions = SessionManager()  # Game sessions keyed by channel id
+        self.persistence = WriteBehind()
+        self.word_caches = WordCacheStore(self.persistence)
         self.leaderboard = self.load_leaderboard()
+        self.hall_of_fame_search = HallOfFameSearchIndex()
         self.hall_of_fame = self.load_hall_of_fame()
-        self.word_cache_updating = False  # Flag to prevent concurrent cache updates
-
-    def load_word_cache(self):
-        logger.debug("Loading word cache from file")
-        with FILE_LOCK:
-            if os.path.exists(CACHE_FILE_PATH):
-                try:
-                    with open(CACHE_FILE_PATH, 'r') as f:
-                        cache = json.load(f)
-                    # Convert defaultdict(int) back from JSON
-                    cache['data'] = defaultdict(lambda: defaultdict(int), {k: defaultdict(int, v) for k, v in cache['data'].items()})
-                    return cache
-                except (json.JSONDecodeError, KeyError) as e:
-                    logger.error(f"Error loading word cache: {e}, starting fresh")
-                    return {
-                        "data": defaultdict(lambda: defaultdict(int)),
-                        "last_update": 0,
-                        "cache_duration": 3600
-                    }
-            else:
-                return {
-                    "data": defaultdict(lambda: defaultdict(int)),
-                    "last_update": 0,
-                    "cache_duration": 3600
-                }
-
-    def save_word_cache(self):
-        logger.debug("Saving word cache to file")
-        with FILE_LOCK:
-            try:
-                cache_to_save = {
-                    "data": {k: dict(v) for k, v in self.word_cache['data'].items()},
-                    "last_update": self.word_cache['last_update'],
-                    "cache_duration": self.word_cache['cache_duration']
-                }
-                with open(CACHE_FILE_PATH, 'w') as f:
-                    json.dump(cache_to_save, f)
-            except Exception as e:
-                logger.error(f"Error saving word cache: {e}")
+        self.persistence.register(
+            "leaderboard", LEADERBOARD_FILE, lambda: self.leaderboard.snapshot()
+        )
+        self.persistence.register(
+            "hall_of_fame", HALL_OF_FAME_FILE,
+            lambda: {message_id: dict(entry) for message_id, entry in self.hall_of_fame.items()}
+        )
+        self.archive = MessageArchive()
+        self.density = ActivityDensity(self.archive)
+        self.crawler = HistoryCrawler(self.archive, self.density)
+        self.message_pool = MessagePool(self.archive, self.density)
+        self.downloader = Downloader()  # Pooled HTTP session, started in setup_hook
+        self.image_mirror = ImageMirror(self.downloader, self.save_hall_of_fame)
 
     def load_leaderboard(self):
         logger.debug("Loading leaderboard from file")
@@ -157,27 +116,18 @@ class DejavuBot(discord.Client):
             if os.path.exists(LEADERBOARD_FILE):
                 try:
                     with open(LEADERBOARD_FILE, 'r') as f:
-                        return json.load(f)
+                        return Leaderboard(json.load(f))
                 except json.JSONDecodeError as e:
                     logger.error(f"Error loading leaderboard: {e}, starting fresh")
-                    return {}
-            return {}
+                    return Leaderboard()
+            return Leaderboard()
 
     def save_leaderboard(self):
-        logger.debug("Saving leaderboard to file")
-        with FILE_LOCK:
-            try:
-                with open(LEADERBOARD_FILE, 'w') as f:
-                    json.dump(self.leaderboard, f)
-            except Exception as e:
-                logger.error(f"Error saving leaderboard: {e}")
-
-    def update_leaderboard(self, game_type, scores):
-        for player, score in scores.items():
-            if player not in self.leaderboard:
-                self.leaderboard[player] = {"total": 0, "whosaid": 0, "wordyapper": 0}
-            self.leaderboard[player]["total"] += score
-            self.leaderboard[player][game_type] += score
+        """Schedule a write-behind save of the leaderboard."""
+        self.persistence.mark_dirty("leaderboard")
+
+    def update_leaderboard(self, guild_id, game_type, scores):
+        self.leaderboard.record(guild_id, game_type, scores)
         self.save_leaderboard()
 
     def load_hall_of_fame(self):
@@ -189,27 +139,36 @@ class DejavuBot(discord.Client):
             if os.path.exists(HALL_OF_FAME_FILE):
                 try:
                     with open(HALL_OF_FAME_FILE, 'r') as f:
-                        return json.load(f)
+                        return HallOfFame(json.load(f), self.hall_of_fame_search)
                 except json.JSONDecodeError:
                     logger.error("Error decoding Hall of Fame JSON, starting fresh")
-                    return {}
-            return {}
+                    return HallOfFame(search_index=self.hall_of_fame_search)
+            return HallOfFame(search_index=self.hall_of_fame_search)
 
     def save_hall_of_fame(self):
-        logger.debug("Saving Hall of Fame to file")
-        # Ensure /data directory exists
-        os.makedirs(os.path.dirname(HALL_OF_FAME_FILE), exist_ok=True)
-        
-        with FILE_LOCK:
-            try:
-                with open(HALL_OF_FAME_FILE, 'w') as f:
-                    json.dump(self.hall_of_fame, f)
-            except Exception as e:
-                logger.error(f"Error saving Hall of Fame: {e}")
+        """Schedule a write-behind save of the Hall of Fame."""
+        self.persistence.mark_dirty("hall_of_fame")
 
     async def setup_hook(self):
         logger.debug("Setting up command tree")
         await self.tree.sync()
+        await asyncio.to_thread(preload_assets)
+        self.downloader.start()
+        await self.image_mirror.start(self.hall_of_fame)
+        self.hall_of_fame.image_mirror = self.image_mirror
+        self.session_scheduler = asyncio.create_task(self.sessions.run(handle_round_timeout))
+        self.live_writer = asyncio.create_task(self.archive.run_live_writer())
+
+    async def close(self):
+        await super().close()
+        self.crawler.stop()
+        self.image_mirror.stop()
+        await self.downloader.close()
+        shutdown_render_pool()
+        shutdown_count_pool()
+        self.persistence.flush_sync()
+        self.archive.close()
+        self.hall_of_fame_search.close()
 
 bot = DejavuBot()
 
@@ -257,43 +216,91 @@ async def whosaid(
     """Handle the /dejavu whosaid command."""
     logger.debug(f"Who Said game invoked with rounds: {rounds}, mercy_mode: {mercy_mode}")
     
-    if bot.whosaid["playing"] or bot.word_yapper["playing"]:
-        await inter.response.send_message("A game is already in progress.")
+    if bot.sessions.get(inter.channel.id):
+        await inter.response.send_message("A game is already in progress in this channel.")
         return
 
     if rounds < 1 or rounds > 10:
         await inter.response.send_message("Number of rounds must be between 1 and 10.")
         return
 
+    session = bot.sessions.start("whosaid", inter.channel.id, rounds, mercy_mode)
+    if session is None:
+        await inter.response.send_message("Too many games are running right now. Please try again later.")
+        return
+
     await inter.response.defer()
-    await start_whosaid(inter.channel, rounds, mercy_mode)
+    try:
+        await start_whosaid(inter.channel, session)
+    except Exception as e:
+        logger.error(f"Error starting Who Said game in channel {inter.channel.id}: {e}")
+        bot.sessions.end(session)
+        await inter.followup.send("An error occurred while starting the game. Please try again later.")
+        return
     await inter.followup.send("Who Said game started.")
 
 @dejavu.command(name="wordyapper", description="Play 'Word Yapper' game")
 @app_commands.describe(
     rounds="Number of rounds to play (default: 5, max: 10)",
-    mercy_mode="Enable Mercy Mode"
+    mercy_mode="Enable Mercy Mode",
+    phrases="Ask about two-word phrases instead of single words"
 )
 async def wordyapper(
     inter: discord.Interaction, 
     rounds: int = 5,
-    mercy_mode: bool = False
+    mercy_mode: bool = False,
+    phrases: bool = False
 ):
     """Handle the /dejavu wordyapper command."""
-    logger.debug(f"Word Yapper game invoked with rounds: {rounds}, mercy_mode: {mercy_mode}")
+    logger.debug(f"Word Yapper game invoked with rounds: {rounds}, mercy_mode: {mercy_mode}, phrases: {phrases}")
     
-    if bot.whosaid["playing"] or bot.word_yapper["playing"]:
-        await inter.response.send_message("A game is already in progress.")
+    if bot.sessions.get(inter.channel.id):
+        await inter.response.send_message("A game is already in progress in this channel.")
         return
 
     if rounds < 1 or rounds > 10:
         await inter.response.send_message("Number of rounds must be between 1 and 10.")
         return
 
+    session = bot.sessions.start("wordyapper", inter.channel.id, rounds, mercy_mode)
+    if session is None:
+        await inter.response.send_message("Too many games are running right now. Please try again later.")
+        return
+    session["phrases"] = phrases
+
     await inter.response.defer()
-    await start_word_yapper(inter.channel, rounds, mercy_mode)
+    try:
+        await start_word_yapper(inter.channel, session)
+    except Exception as e:
+        logger.error(f"Error starting Word Yapper game in channel {inter.channel.id}: {e}")
+        bot.sessions.end(session)
+        await inter.followup.send("An error occurred while starting the game. Please try again later.")
+        return
     await inter.followup.send("Word Yapper game started.")
 
+@dejavu.command(name="yappermode", description="Choose how Word Yapper counts words in this channel")
+@app_commands.describe(
+    mode="exact: the latest 10000 messages, then every new one; approximate: the whole history, in bounded memory"
+)
+async def yappermode(inter: discord.Interaction, mode: Literal["exact", "approximate"]):
+    """Handle the /dejavu yappermode command."""
+    logger.debug(f"Word Yapper mode {mode} requested for channel {inter.channel.id}")
+    if not inter.permissions.manage_channels:
+        await inter.response.send_message("You need the Manage Channels permission to change this.", ephemeral=True)
+        return
+    if mode not in WORD_CACHE_MODES:
+        await inter.response.send_message("Invalid mode.", ephemeral=True)
+        return
+    if bot.sessions.get(inter.channel.id):
+        await inter.response.send_message("A game is in progress in this channel. Try again when it ends.", ephemeral=True)
+        return
+
+    guild_id = inter.guild.id if inter.guild else None
+    bot.word_caches.set_mode(guild_id, inter.channel.id, mode)
+    if mode == "approximate" and not bot.archive.is_indexed(inter.channel.id):
+        bot.crawler.schedule(inter.channel)
+    await inter.response.send_message(f"Word Yapper will use {mode} counts in this channel from the next game.")
+
 bot.tree.add_command(dejavu)
 
 async def process_dejavu_command(inter: discord.Interaction, format: Literal["text", "image"], background: str = "japmic"):
@@ -310,27 +317,36 @@ async def process_dejavu_command(inter: discord.Interaction, format: Literal["te
             return
     
     channel = inter.channel
-    created_at = channel.created_at
-    end = datetime.now(timezone.utc)
     
     try:
-        for _ in range(MAX_RETRIES):
-            logger.debug(f"Channel created at: {created_at}, Current time: {end}")
-            rand_datetime = get_rand_datetime(created_at, end)
+        message_found = False
+        archived = bot.message_pool.pop(channel) or await bot.density.sample_archived(channel.id)
+        if archived:
+            logger.debug(f"Random message found in archive: {archived.content[:20]}...")
+            await create_and_send_response(archived, channel, format, background)
+            message_found = True
+        if channel.id not in bot.archive.live_channels:
+            bot.crawler.schedule(channel)
+
+        history_calls = 0
+        for _ in range(0 if message_found else MAX_RETRIES):
+            rand_datetime = await bot.density.sample_moment(channel)
             logger.debug(f"Random datetime generated: {rand_datetime}")
     
-            message_found = False
+            history_calls += 1
             async for rand_message in channel.history(limit=5, around=rand_datetime):
                 if (rand_message.content and
                     not is_blacklisted(rand_message.content) and
                     rand_message.author.id not in BOT_USER_IDS
                 ):
                     logger.debug(f"Random message found: {rand_message.content[:20]}...")  # Log first 20 chars
-                    await create_and_send_response(rand_message, channel, format, background)
+                    await create_and_send_response(ArchivedMessage.from_message(rand_message), channel, format, background)
                     message_found = True
                     break
             if message_found:
                 break
+        if history_calls:
+            bot.density.record_lookup(history_calls, int(message_found))
         
         if not message_found:
             logger.warning("No suitable message found in channel history")
@@ -358,22 +374,13 @@ async def process_dejavu_command(inter: discord.Interaction, format: Literal["te
             pass
         logger.debug("Dejavu command processing completed")
 
-def get_rand_datetime(start: datetime, end: datetime) -> datetime:
-    """Return a random datetime between two datetime objects."""
-    logger.debug(f"Generating random datetime between {start} and {end}")
-    delta = end - start
-    int_delta = (delta.days * 24 * 60 * 60) + delta.seconds
-    random_second = randrange(int_delta)
-    return start + timedelta(seconds=random_second)
-
-async def create_and_send_response(rand_message: discord.Message, channel: discord.TextChannel, choice: Literal["text", "image"], background: str):
+async def create_and_send_response(rand_message: ArchivedMessage, channel: discord.TextChannel, choice: Literal["text", "image"], background: str):
     """Create and send the appropriate response based on the user's choice."""
     logger.debug(f"Creating response for choice: {choice}, background: {background}")
-    text = f"{rand_message.author.name} said: \n{rand_message.content}\nat {rand_message.created_at.strftime('%Y-%m-%d %I:%M %p')}"
+    text = f"{rand_message.author_name} said: \n{rand_message.content}\nat {rand_message.created_at.strftime('%Y-%m-%d %I:%M %p')}"
     
     # Build jump URL to original message
-    guild_id = rand_message.guild.id if rand_message.guild else "@me"
-    jump_url = f"https://discord.com/channels/{guild_id}/{rand_message.channel.id}/{rand_message.id}"
+    jump_url = rand_message.jump_url
 
     try:
         if choice == "text":
@@ -392,91 +399,106 @@ async def create_and_send_response(rand_message: discord.Message, channel: disco
 
     logger.debug("Response sent successfully")
 
-async def start_whosaid(channel: discord.TextChannel, rounds: int, mercy_mode: bool):
+async def start_whosaid(channel: discord.TextChannel, session: dict):
     """Start a 'Who said' game with multiple rounds."""
-    logger.debug(f"Starting 'Who said' game with {rounds} rounds, Mercy Mode: {mercy_mode}")
-    bot.whosaid.update({
-        "playing": True,
-        "channel": channel.id,
-        "rounds": 0,
-        "max_rounds": rounds,
-        "scores": defaultdict(int),
-        "mercy_mode": mercy_mode
-    })
-    await play_whosaid_round(channel)
+    logger.debug(f"Starting 'Who said' game in channel {channel.id} with {session['max_rounds']} rounds, Mercy Mode: {session['mercy_mode']}")
+    await play_whosaid_round(channel, session)
 
-async def play_whosaid_round(channel: discord.TextChannel):
+async def play_whosaid_round(channel: discord.TextChannel, session: dict):
     """Play a single round of 'Who said' game."""
-    created_at = channel.created_at
-    end = datetime.now(timezone.utc)
-    
-    max_attempts = 10  # Limit attempts to prevent infinite loop
-    attempts = 0
-    
-    while attempts < max_attempts:
-        attempts += 1
-        rand_datetime = get_rand_datetime(created_at, end)
-        async for rand_message in channel.history(limit=1, around=rand_datetime):
-            if rand_message.content and (not bot.whosaid["mercy_mode"] or rand_message.author.id != MERCY_USER_ID):
-                bot.whosaid.update({
-                    "author": rand_message.author.name,
-                    "message": rand_message.content
-                })
-                bot.whosaid["rounds"] += 1
-                await channel.send(f"Round {bot.whosaid['rounds']}/{bot.whosaid['max_rounds']}\nWho said: {rand_message.content}")
-                
-                # Add timeout
-                try:
-                    await asyncio.wait_for(wait_for_correct_answer(channel), timeout=60.0)
-                except asyncio.TimeoutError:
-                    await channel.send("No one answered in time. Game aborted.")
-                    await end_whosaid_game(channel)
+    if not session["upcoming"]:
+        # Nothing prefetched yet (first round, or the prefetch fell behind): wait for the
+        # next question to be queued, or for the prefetch to give up
+        started = time.perf_counter()
+        session["question_ready"].clear()
+        task = prefetch_whosaid_questions(channel, session)
+        ready = asyncio.create_task(session["question_ready"].wait())
+        await asyncio.wait([task, ready], return_when=asyncio.FIRST_COMPLETED)
+        ready.cancel()
+        logger.debug(f"Waited {time.perf_counter() - started:.2f}s for a Who Said question in channel {channel.id}")
+    if not session["playing"]:
+        return
+    if not session["upcoming"]:
+        # If we couldn't find a message after WHOSAID_FETCH_ATTEMPTS, abort the game
+        await channel.send("Could not find a suitable message. Game aborted.")
+        await end_whosaid_game(channel, session)
+        return
+
+    author_id, author_name, content, history_calls = session["upcoming"].popleft()
+    session.update({
+        "author": author_name,
+        "author_id": author_id,
+        "message": content
+    })
+    session["rounds"] += 1
+    await channel.send(f"Round {session['rounds']}/{session['max_rounds']}\nWho said: {content}")
+    bot.sessions.open_round(session)
+    logger.debug(f"Who Said round {session['rounds']} in channel {channel.id} used {history_calls} history call(s)")
+
+    # Look for the next questions while this one is being answered
+    prefetch_whosaid_questions(channel, session)
+
+def prefetch_whosaid_questions(channel: discord.TextChannel, session: dict) -> asyncio.Task:
+    """Make sure a task is filling the session's queue of upcoming questions, and return it."""
+    task = session["prefetch_task"]
+    if task is None or task.done():
+        task = session["prefetch_task"] = asyncio.create_task(fill_whosaid_questions(channel, session))
+    return task
+
+async def fill_whosaid_questions(channel: discord.TextChannel, session: dict):
+    """Queue up to WHOSAID_PREFETCH questions for the rounds still to be played."""
+    try:
+        while session["playing"]:
+            needed = session["max_rounds"] - session["rounds"] - len(session["upcoming"])
+            if needed <= 0 or len(session["upcoming"]) >= WHOSAID_PREFETCH:
                 return
+            question = await fetch_whosaid_question(channel, session)
+            if question is None:
+                return
+            session["upcoming"].append(question)
+            session["question_ready"].set()
+    except Exception as e:
+        logger.error(f"Error prefetching Who Said questions for channel {channel.id}: {e}")
+
+async def fetch_whosaid_question(channel: discord.TextChannel, session: dict):
+    """Find a message to ask about; returns (author_id, author_name, content, history_calls) or None."""
+    excluded = MERCY_USER_ID if session["mercy_mode"] and MERCY_USER_ID else None
+    archived = (bot.message_pool.pop(channel, exclude_author_id=excluded)
+                or await bot.density.sample_archived(channel.id, exclude_author_id=excluded))
+    if archived:
+        return archived.author_id, archived.author_name, archived.content, 0
+
+    for attempt in range(1, WHOSAID_FETCH_ATTEMPTS + 1):
+        rand_datetime = await bot.density.sample_moment(channel)
+        async for rand_message in channel.history(limit=1, around=rand_datetime):
+            if rand_message.content and (not session["mercy_mode"] or rand_message.author.id != MERCY_USER_ID):
+                bot.density.record_lookup(attempt, 1)
+                return rand_message.author.id, rand_message.author.name, rand_message.content, attempt
         # If we didn't find a suitable message, we'll try again with a new random datetime
-    
-    # If we couldn't find a message after max_attempts, abort the game
-    await channel.send("Could not find a suitable message. Game aborted.")
-    await end_whosaid_game(channel)
-
-async def wait_for_correct_answer(channel: discord.TextChannel):
-    while True:
-        try:
-            message = await bot.wait_for('message', check=lambda m: m.channel == channel and not m.author.bot and m.mentions, timeout=60.0)
-            if message.mentions and message.mentions[0].name == bot.whosaid["author"]:
-                await process_whosaid_guess(message)
-                break
-            else:
-                await message.reply("Wrong! Try again.")
-        except asyncio.TimeoutError:
-            await channel.send("No one answered in time. Game aborted.")
-            await end_whosaid_game(channel)
-            break
-        except IndexError:
-            await message.reply("Please mention a user.")
-        except Exception as e:
-            logger.error(f"Error in wait_for_correct_answer: {e}")
-            await channel.send("An error occurred. Game aborted.")
-            await end_whosaid_game(channel)
-            break
+    bot.density.record_lookup(WHOSAID_FETCH_ATTEMPTS, 0)
+    logger.debug(f"No Who Said question found in channel {channel.id} after {WHOSAID_FETCH_ATTEMPTS} history calls")
+    return None
 
-async def process_whosaid_guess(message: discord.Message):
+async def process_whosaid_guess(message: discord.Message, session: dict):
     """Process a guess for the 'Who said' game."""
     points = 1
-    bot.whosaid["scores"][message.author.name] += points
+    session["scores"][message.author.name] += points
     await message.reply(f"Correct! You get {points} point(s).")
-    await continue_or_end_whosaid(message.channel)
+    await continue_or_end_whosaid(message.channel, session)
 
-async def continue_or_end_whosaid(channel: discord.TextChannel):
+async def continue_or_end_whosaid(channel: discord.TextChannel, session: dict):
     """Continue to the next round or end the 'Who said' game."""
-    if bot.whosaid["rounds"] < bot.whosaid["max_rounds"]:
-        await asyncio.sleep(2)  # Short delay before next round
-        await play_whosaid_round(channel)
+    if session["rounds"] < session["max_rounds"]:
+        await play_whosaid_round(channel, session)
     else:
-        await end_whosaid_game(channel)
+        await end_whosaid_game(channel, session)
 
-async def end_whosaid_game(channel: discord.TextChannel):
+async def end_whosaid_game(channel: discord.TextChannel, session: dict):
     """End the 'Who said' game and display final scores."""
-    scores = bot.whosaid["scores"]
+    if not session["playing"]:
+        return
+    bot.sessions.end(session)
+    scores = session["scores"]
     winner = max(scores, key=scores.get) if scores else None
     
     embed = Embed(title="Who Said - Game Over", color=discord.Color.gold())
@@ -485,171 +507,227 @@ async def end_whosaid_game(channel: discord.TextChannel):
         embed.add_field(name="Winner", value=f"🏆 {winner} with {scores[winner]} points!", inline=False)
     
     await channel.send(embed=embed)
-    bot.update_leaderboard("whosaid", scores)
+    bot.update_leaderboard(channel.guild.id if channel.guild else None, "whosaid", scores)
     await show_leaderboard_after_game(channel)
-    bot.whosaid["playing"] = False
 
-async def start_word_yapper(channel: discord.TextChannel, rounds: int, mercy_mode: bool):
+async def start_word_yapper(channel: discord.TextChannel, session: dict):
     """Start a Word Yapper game with multiple rounds."""
-    logger.debug(f"Starting Word Yapper game. Rounds: {rounds}, Mercy Mode: {mercy_mode}")
-    current_time = time.time()
-    
-    # Check if cache is valid
-    if current_time - bot.word_cache["last_update"] > bot.word_cache["cache_duration"]:
+    logger.debug(f"Starting Word Yapper game in channel {channel.id}. Rounds: {session['max_rounds']}, Mercy Mode: {session['mercy_mode']}")
+    guild_id = channel.guild.id if channel.guild else None
+    cache = bot.word_caches.get(guild_id, channel.id)
+
+    # Approximate counts are built from the whole archived history, never from a partial scan
+    needs_history = not cache["last_message_id"] or (session["phrases"] and cache["phrases"] is None)
+    if cache["mode"] == "approximate" and needs_history and not is_archived(channel):
+        indexed = await wait_for_index(channel, session)
+        if not session["playing"]:
+            return
+        if not indexed:
+            await channel.send(
+                "Couldn't finish indexing this channel's history, so approximate Word Yapper can't start yet. "
+                "Please try again later."
+            )
+            bot.sessions.end(session)
+            return
+        # May have been evicted while the crawl ran
+        cache = bot.word_caches.get(guild_id, channel.id)
+
+    # Check if cache is valid, and has phrase counts if the game asks about phrases
+    if is_stale(cache) or (session["phrases"] and cache["phrases"] is None):
         # Check if another update is already in progress
-        if bot.word_cache_updating:
+        if cache["updating"]:
             logger.debug("Cache update already in progress, waiting...")
             # Wait for the update to complete
             max_wait = 60  # Maximum wait time in seconds
             wait_interval = 1
             waited = 0
-            while bot.word_cache_updating and waited < max_wait:
+            while cache["updating"] and waited < max_wait:
                 await asyncio.sleep(wait_interval)
                 waited += wait_interval
             
-            if bot.word_cache_updating:
+            if cache["updating"]:
                 await channel.send("Cache update is taking too long. Please try again later.")
+                bot.sessions.end(session)
                 return
         else:
-            bot.word_cache_updating = True
+            cache["updating"] = True
             try:
-                logger.debug("Cache invalid, updating word cache")
-                loading_embed = Embed(
-                    title="Word Yapper",
-                    description="Updating word cache... This may take a moment.",
-                    color=discord.Color.blue()
-                )
-                loading_embed.set_footer(text="Please wait while I analyze the channel history.")
-                loading_message = await channel.send(embed=loading_embed)
-
-                word_counts = defaultdict(lambda: defaultdict(int))
-                message_count = 0
-                # Limit to 10000 messages to prevent memory issues
-                async for message in channel.history(limit=10000):
-                    if message.author.bot or (mercy_mode and message.author.id == MERCY_USER_ID):
-                        continue
-                    # Limit word processing to prevent DoS
-                    words = re.findall(r'\w+', message.content.lower())[:100]  # Limit to 100 words per message
-                    for word in words:
-                        word_counts[word][message.author.name] += 1
-                    message_count += 1
-                
-                bot.word_cache["data"] = word_counts
-                bot.word_cache["last_update"] = current_time
-                bot.save_word_cache()  # Save cache after updating
-
-                await loading_message.delete()
+                if is_stale(cache):
+                    await refresh_word_cache(channel, cache)
+                    stats = cache["stats"]
+                    if cache["mode"] == "exact" and stats.delta_pairs > len(stats.cols) // 4:
+                        # Fold the new counts into the compact arrays off the event loop. The thread works
+                        # on a copy, so saves taken meanwhile never see half-replaced arrays; live messages
+                        # wait in cache["pending"] until the update ends, so the copy misses none.
+                        compacted = stats.copy()
+                        await asyncio.to_thread(compacted.compact)
+                        compacted.word_ids = stats.word_ids  # Compacting keeps word ids
+                        cache["stats"] = compacted
+                    cache["last_update"] = time.time()
+                if session["phrases"] and cache["phrases"] is None:
+                    await count_phrases(channel, cache)
+                bot.word_caches.save(cache)  # Save cache after updating
+            except Exception:
+                # Partly counted; reload the last saved copy next time
+                bot.word_caches.discard(guild_id, channel.id)
+                raise
             finally:
-                bot.word_cache_updating = False
+                cache["updating"] = False
+                pending, cache["pending"] = cache["pending"], []
+                # Unless the update failed and the cache was discarded
+                if bot.word_caches.peek(guild_id, channel.id) is cache:
+                    for message in pending:
+                        if message.id > (cache["last_message_id"] or 0):
+                            bot.word_caches.count_message(cache, message)
+                    bot.word_caches.update_size(cache)
     else:
         logger.debug("Using existing word cache")
-        word_counts = bot.word_cache["data"]
-        message_count = sum(sum(author_counts.values()) for author_counts in word_counts.values())
-
-    bot.word_yapper.update({
-        "playing": True,
-        "channel": channel.id,
-        "rounds": 0,
-        "max_rounds": rounds,
-        "scores": defaultdict(int),
-        "mercy_mode": mercy_mode,
-        "used_words": set()
-    })
-
-    await play_word_yapper_round(channel, word_counts, message_count)
+    session["cache"] = cache
+
+    await play_word_yapper_round(channel, session)
+
+async def refresh_word_cache(channel: discord.TextChannel, cache):
+    """Bring a channel's word cache up to date.
+
+    The first build scans the latest 10000 messages, or in approximate mode the
+    channel's whole history from the archive. Later refreshes only fetch
+    messages newer than the last one counted, so their cost is proportional to
+    the number of new messages.
+    """
+    last_message_id = cache["last_message_id"]
+    if last_message_id:
+        logger.debug(f"Refreshing word cache for channel {channel.id} after message {last_message_id}")
+        new_messages = await count_history(
+            cache, from_history(channel.history(limit=None, after=discord.Object(id=last_message_id), oldest_first=True))
+        )
+        logger.debug(f"Word cache refreshed with {new_messages} new messages")
+        return
 
-async def play_word_yapper_round(channel: discord.TextChannel, word_counts, message_count):
+    if is_archived(channel):
+        # The archive holds the channel up to now, so the build needs no API calls
+        logger.debug(f"Building {cache['mode']} word cache for channel {channel.id} from the archive")
+        await count_history(cache, bot.archive.iter_history(channel.id, limit=history_limit(cache)))
+    elif cache["mode"] == "approximate":
+        # start_word_yapper waits for the crawl first
+        raise RuntimeError(f"Channel {channel.id} is not indexed")
+    else:
+        logger.debug(f"Building word cache for channel {channel.id}")
+        loading_message = await send_word_cache_loading(channel, "Updating word cache... This may take a moment.")
+        await count_history(cache, from_history(channel.history(limit=10000)))
+        await loading_message.delete()
+
+def is_archived(channel: discord.TextChannel) -> bool:
+    """Whether the archive holds a channel's whole history up to now."""
+    return bot.archive.is_indexed(channel.id) and channel.id in bot.archive.live_channels
+
+async def wait_for_index(channel: discord.TextChannel, session: dict) -> bool:
+    """Crawl a channel's history, keeping the session from being reaped as idle meanwhile; returns whether it completed."""
+    loading_message = await send_word_cache_loading(channel, "Indexing this channel's history... This may take a while.")
+    crawl = asyncio.ensure_future(bot.crawler.wait(channel))
+    try:
+        while not crawl.done():
+            bot.sessions.touch(session)
+            await asyncio.wait([crawl], timeout=INDEX_TOUCH_INTERVAL)
+        crawl.result()
+    finally:
+        crawl.cancel()
+        await loading_message.delete()
+    return is_archived(channel)
+
+def history_limit(cache):
+    # Exact counts use memory per (word, author) pair, so their first build reads only the latest 10000
+    # messages; they still grow as new messages are counted
+    return None if cache["mode"] == "approximate" else 10000
+
+async def count_phrases(channel: discord.TextChannel, cache):
+    """Count a channel's two-word phrases the first time the phrase variant is played there.
+
+    Covers the same messages as the word counts, from their first_message_id
+    to their last_message_id; from then on phrases are counted alongside words.
+    Caches saved before first_message_id was recorded fall back to the history
+    limit of their mode, so there the two windows can differ.
+    """
+    cache["phrases"] = empty_phrase_sketch()
+    first_message_id, last_message_id = cache["first_message_id"], cache["last_message_id"]
+    if not last_message_id:
+        return
+    limit = None if first_message_id else history_limit(cache)
+    before = last_message_id + 1
+    if is_archived(channel):
+        logger.debug(f"Counting phrases for channel {channel.id} from the archive")
+        messages = bot.archive.iter_history(channel.id, limit=limit, before_id=before)
+        await count_history(cache, since(messages, first_message_id) if first_message_id else messages, count_words=False)
+    elif cache["mode"] == "approximate":
+        raise RuntimeError(f"Channel {channel.id} is not indexed")
+    else:
+        logger.debug(f"Counting phrases for channel {channel.id}")
+        loading_message = await send_word_cache_loading(channel, "Counting phrases... This may take a moment.")
+        after = discord.Object(id=first_message_id - 1) if first_message_id else None
+        history = channel.history(limit=limit, before=discord.Object(id=before), after=after)
+        await count_history(cache, from_history(history), count_words=False)
+        await loading_message.delete()
+
+async def send_word_cache_loading(channel: discord.TextChannel, description: str) -> discord.Message:
+    loading_embed = Embed(title="Word Yapper", description=description, color=discord.Color.blue())
+    loading_embed.set_footer(text="Please wait while I analyze the channel history.")
+    return await channel.send(embed=loading_embed)
+
+async def play_word_yapper_round(channel: discord.TextChannel, session: dict):
     """Play a single round of Word Yapper game."""
-    logger.debug("Playing Word Yapper round")
-    common_words = [word for word, counts in word_counts.items() 
-                    if sum(counts.values()) >= 1  # Said at least once
-                    and word not in COMMON_WORDS_TO_EXCLUDE
-                    and DICTIONARY.check(word)  # Check if it's a valid English word
-                    and len(word) > 2  # Exclude very short words
-                    and not word.isdigit()  # Exclude strings of just numbers
-                    and word not in bot.word_yapper["used_words"]]
-
-    if not common_words:
-        logger.warning("Not enough words found with current criteria. Relaxing restrictions.")
-        common_words = [word for word, counts in word_counts.items() 
-                        if sum(counts.values()) >= 1
-                        and word not in COMMON_WORDS_TO_EXCLUDE
-                        and len(word) > 1
-                        and not word.isdigit()
-                        and word not in bot.word_yapper["used_words"]]
-
-    if not common_words:
+    logger.debug(f"Playing Word Yapper round in channel {channel.id}")
+    cache = session["cache"]
+    # Mercy Mode ignores the mercy user's words when deciding who said them most
+    mercy_ids = {MERCY_USER_ID} if session["mercy_mode"] else set()
+
+    chosen_word, top_user_id, top_user = pick_word(cache, session["used_words"], mercy_ids, session["phrases"])
+    if not chosen_word:
         await channel.send("Not enough unique words left to continue the game. Ending the game now.")
-        await end_word_yapper_game(channel)
+        await end_word_yapper_game(channel, session)
         return
 
-    chosen_word = choice(common_words)
-    bot.word_yapper["used_words"].add(chosen_word)
-    top_user = max(word_counts[chosen_word], key=word_counts[chosen_word].get)
+    session["used_words"].add(chosen_word)
 
-    bot.word_yapper.update({
+    session.update({
         "word": chosen_word,
-        "top_user": top_user
+        "top_user": top_user,
+        "top_user_id": top_user_id
     })
-    bot.word_yapper["rounds"] += 1
+    session["rounds"] += 1
+    bot.sessions.touch(session)
 
-    logger.debug(f"Word Yapper round {bot.word_yapper['rounds']} started with word: {chosen_word}, top user: {top_user}")
+    logger.debug(f"Word Yapper round {session['rounds']} started with word: {chosen_word}, top user: {top_user}")
 
     game_start_embed = Embed(
         title="Word Yapper",
-        description=f"Word Yapper - Round {bot.word_yapper['rounds']}/{bot.word_yapper['max_rounds']}",
+        description=f"Word Yapper - Round {session['rounds']}/{session['max_rounds']}",
         color=discord.Color.green()
     )
     game_start_embed.add_field(name="Question", value=f"Who do you think said '{chosen_word}' most often?", inline=False)
     game_start_embed.set_footer(text="Mention the user you think said it most!")
     await channel.send(embed=game_start_embed)
-    
-    # Add timeout
-    try:
-        await asyncio.wait_for(wait_for_correct_word_yapper_answer(channel), timeout=60.0)
-    except asyncio.TimeoutError:
-        await channel.send("No one answered in time. Game aborted.")
-        await end_word_yapper_game(channel)
-
-async def wait_for_correct_word_yapper_answer(channel: discord.TextChannel):
-    while True:
-        try:
-            message = await bot.wait_for('message', check=lambda m: m.channel == channel and not m.author.bot and m.mentions, timeout=60.0)
-            if message.mentions and message.mentions[0].name == bot.word_yapper["top_user"]:
-                await process_word_yapper_guess(message)
-                break
-            else:
-                await message.reply("Wrong! Try again.")
-        except asyncio.TimeoutError:
-            await channel.send("No one answered in time. Game aborted.")
-            await end_word_yapper_game(channel)
-            break
-        except IndexError:
-            await message.reply("Please mention a user.")
-        except Exception as e:
-            logger.error(f"Error in wait_for_correct_word_yapper_answer: {e}")
-            await channel.send("An error occurred. Game aborted.")
-            await end_word_yapper_game(channel)
-            break
+    bot.sessions.open_round(session)
 
-async def process_word_yapper_guess(message: discord.Message):
+async def process_word_yapper_guess(message: discord.Message, session: dict):
     """Process a guess for the Word Yapper game."""
     points = 1
-    bot.word_yapper["scores"][message.author.name] += points
-    await message.reply(f"Correct! {bot.word_yapper['top_user']} said '{bot.word_yapper['word']}' most often. You get {points} point(s).")
-    await continue_or_end_word_yapper(message.channel)
+    session["scores"][message.author.name] += points
+    await message.reply(f"Correct! {session['top_user']} said '{session['word']}' most often. You get {points} point(s).")
+    await continue_or_end_word_yapper(message.channel, session)
 
-async def continue_or_end_word_yapper(channel: discord.TextChannel):
+async def continue_or_end_word_yapper(channel: discord.TextChannel, session: dict):
     """Continue to the next round or end the Word Yapper game."""
-    if bot.word_yapper["rounds"] < bot.word_yapper["max_rounds"]:
+    if session["rounds"] < session["max_rounds"]:
         await asyncio.sleep(2)  # Short delay before next round
-        await play_word_yapper_round(channel, bot.word_cache["data"], sum(sum(author_counts.values()) for author_counts in bot.word_cache["data"].values()))
+        await play_word_yapper_round(channel, session)
     else:
-        await end_word_yapper_game(channel)
+        await end_word_yapper_game(channel, session)
 
-async def end_word_yapper_game(channel: discord.TextChannel):
+async def end_word_yapper_game(channel: discord.TextChannel, session: dict):
     """End the Word Yapper game and display final scores."""
-    scores = bot.word_yapper["scores"]
+    if not session["playing"]:
+        return
+    bot.sessions.end(session)
+    scores = session["scores"]
     winner = max(scores, key=scores.get) if scores else None
     
     embed = Embed(title="Word Yapper - Game Over", color=discord.Color.gold())
@@ -658,56 +736,129 @@ async def end_word_yapper_game(channel: discord.TextChannel):
         embed.add_field(name="Winner", value=f"🏆 {winner} with {scores[winner]} points!", inline=False)
     
     await channel.send(embed=embed)
-    bot.update_leaderboard("wordyapper", scores)
+    bot.update_leaderboard(channel.guild.id if channel.guild else None, "wordyapper", scores)
     await show_leaderboard_after_game(channel)
-    bot.word_yapper["playing"] = False
+
+async def handle_game_guess(message: discord.Message, session: dict):
+    """Check a mention against the open question of the channel's game."""
+    bot.sessions.touch(session)
+    answer_id = session["author_id"] if session["game"] == "whosaid" else session["top_user_id"]
+    if message.mentions[0].id != answer_id:
+        await message.reply("Wrong! Try again.")
+        return
+
+    bot.sessions.close_round(session)
+    try:
+        if session["game"] == "whosaid":
+            await process_whosaid_guess(message, session)
+        else:
+            await process_word_yapper_guess(message, session)
+    except Exception as e:
+        logger.error(f"Error processing guess in channel {message.channel.id}: {e}")
+        await message.channel.send("An error occurred. Game aborted.")
+        await end_game(message.channel, session)
+
+async def handle_round_timeout(session: dict):
+    """Called by the session scheduler when nobody answered a question in time."""
+    channel = bot.get_channel(session["channel"])
+    if channel is None:
+        bot.sessions.end(session)
+        return
+    await channel.send("No one answered in time. Game aborted.")
+    await end_game(channel, session)
+
+async def end_game(channel: discord.TextChannel, session: dict):
+    if session["game"] == "whosaid":
+        await end_whosaid_game(channel, session)
+    else:
+        await end_word_yapper_game(channel, session)
+
+def add_leaderboard_row(embed: Embed, rank: int, player: str, scores: dict):
+    embed.add_field(
+        name=f"{rank}. {player}",
+        value=f"Total: {scores['total']} | Who Said: {scores['whosaid']} | Word Yapper: {scores['wordyapper']}",
+        inline=False
+    )
 
 async def show_leaderboard_after_game(channel: discord.TextChannel):
-    sorted_players = sorted(bot.leaderboard.items(), key=lambda x: x[1]["total"], reverse=True)
-    
     embed = Embed(title="Updated Leaderboard", color=discord.Color.gold())
-    for i, (player, scores) in enumerate(sorted_players[:5], 1):
-        embed.add_field(
-            name=f"{i}. {player}",
-            value=f"Total: {scores['total']} | Who Said: {scores['whosaid']} | Word Yapper: {scores['wordyapper']}",
-            inline=False
-        )
+    for rank, player, scores in bot.leaderboard.top(GLOBAL_SCOPE, "total", 5):
+        add_leaderboard_row(embed, rank, player, scores)
     
     await channel.send(embed=embed)
 
-@bot.tree.command(name="leaderboard", description="View the leaderboard")
-async def show_leaderboard(inter: discord.Interaction):
+leaderboard = app_commands.Group(name="leaderboard", description="View the leaderboard")
+
+GAME_NAMES = {"total": "Total", "whosaid": "Who Said", "wordyapper": "Word Yapper"}
+
+def leaderboard_scope(inter: discord.Interaction, scope: str):
+    """Return (scope key, label) for a scope option."""
+    if scope == "server" and inter.guild:
+        return str(inter.guild.id), inter.guild.name
+    return GLOBAL_SCOPE, "Global"
+
+@leaderboard.command(name="top", description="View the top players")
+@app_commands.describe(game="Which score to rank by (default: total)", scope="Rank across all servers or just this one")
+async def show_leaderboard(
+    inter: discord.Interaction,
+    game: Literal["total", "whosaid", "wordyapper"] = "total",
+    scope: Literal["global", "server"] = "global"
+):
     await inter.response.defer()
     
-    sorted_players = sorted(bot.leaderboard.items(), key=lambda x: x[1]["total"], reverse=True)
-    
-    embed = Embed(title="Leaderboard", color=discord.Color.gold())
-    for i, (player, scores) in enumerate(sorted_players[:10], 1):
-        embed.add_field(
-            name=f"{i}. {player}",
-            value=f"Total: {scores['total']} | Who Said: {scores['whosaid']} | Word Yapper: {scores['wordyapper']}",
-            inline=False
-        )
+    scope_key, scope_label = leaderboard_scope(inter, scope)
+    embed = Embed(title=f"Leaderboard - {scope_label} {GAME_NAMES[game]}", color=discord.Color.gold())
+    for rank, player, scores in bot.leaderboard.top(scope_key, game, 10):
+        add_leaderboard_row(embed, rank, player, scores)
     
     await inter.followup.send(embed=embed)
 
+@leaderboard.command(name="me", description="View your rank and the players around you")
+@app_commands.describe(game="Which score to rank by (default: total)", scope="Rank across all servers or just this one")
+async def show_my_rank(
+    inter: discord.Interaction,
+    game: Literal["total", "whosaid", "wordyapper"] = "total",
+    scope: Literal["global", "server"] = "global"
+):
+    await inter.response.defer(ephemeral=True)
+    
+    scope_key, scope_label = leaderboard_scope(inter, scope)
+    rank, neighbours = bot.leaderboard.standing(scope_key, inter.user.name, game)
+    if rank is None:
+        await inter.followup.send("You're not on this leaderboard yet. Play a game to get ranked!", ephemeral=True)
+        return
+    
+    embed = Embed(
+        title=f"Leaderboard - {scope_label} {GAME_NAMES[game]}",
+        description=f"You are ranked #{rank} of {len(bot.leaderboard.board(scope_key, game))}.",
+        color=discord.Color.gold()
+    )
+    for neighbour_rank, player, scores in neighbours:
+        add_leaderboard_row(embed, neighbour_rank, f"{player} (you)" if player == inter.user.name else player, scores)
+    
+    await inter.followup.send(embed=embed, ephemeral=True)
+
+bot.tree.add_command(leaderboard)
+
 
 class HallOfFameView(View):
     """View for Hall of Fame pagination and sharing."""
     
-    def __init__(self, bot_instance, entries: list, page: int = 0, per_page: int = 1):
+    def __init__(self, bot_instance, cursor: HallOfFameCursor):
         super().__init__(timeout=300)  # 5 minute timeout
         self.bot = bot_instance
-        self.entries = entries
-        self.page = page
-        self.per_page = per_page
-        self.total_pages = len(entries) if entries else 1
+        self.cursor = cursor
+        self.update_buttons()
         
     def get_page_entries(self):
         """Get entry for current page (single entry)."""
-        if 0 <= self.page < len(self.entries):
-            return [self.entries[self.page]]
-        return []
+        entry = self.cursor.current()
+        return [entry] if entry else []
+
+    def update_buttons(self):
+        self.cursor.current()
+        self.prev_button.disabled = self.cursor.page == 0
+        self.next_button.disabled = self.cursor.page >= len(self.cursor) - 1
     
     def create_embed(self):
         """Create embed for current page (single entry)."""
@@ -726,7 +877,7 @@ class HallOfFameView(View):
         # Create embed with entry details
         embed = Embed(
             title="Hall of Fame",
-            description=f"Entry {self.page + 1} of {len(self.entries)}",
+            description=f"Entry {self.cursor.page + 1} of {len(self.cursor)}",
             color=discord.Color.gold()
         )
         
@@ -795,19 +946,15 @@ class HallOfFameView(View):
     
     @discord.ui.button(label="Previous", emoji="◀️", style=discord.ButtonStyle.secondary, disabled=True)
     async def prev_button(self, interaction: discord.Interaction, button: Button):
-        if self.page > 0:
-            self.page -= 1
-            self.prev_button.disabled = self.page == 0
-            self.next_button.disabled = self.page >= self.total_pages - 1
-            await interaction.response.edit_message(embed=self.create_embed(), view=self)
+        self.cursor.move(-1)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
     
     @discord.ui.button(label="Next", emoji="▶️", style=discord.ButtonStyle.secondary)
     async def next_button(self, interaction: discord.Interaction, button: Button):
-        if self.page < self.total_pages - 1:
-            self.page += 1
-            self.prev_button.disabled = self.page == 0
-            self.next_button.disabled = self.page >= self.total_pages - 1
-            await interaction.response.edit_message(embed=self.create_embed(), view=self)
+        self.cursor.move(1)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
     
     @discord.ui.button(label="Share", emoji="📤", style=discord.ButtonStyle.primary, row=1)
     async def share_button(self, interaction: discord.Interaction, button: Button):
@@ -855,17 +1002,8 @@ class HallOfFameView(View):
             except Exception as e:
                 logger.warning(f"Could not remove reactions from original message: {e}")
             
-            # Update entries list
-            self.entries = [e for e in self.entries if str(e.get("message_id")) != message_id_str]
-            self.total_pages = len(self.entries) if self.entries else 1
-            
-            # Adjust current page if necessary
-            if self.page >= self.total_pages:
-                self.page = max(0, self.total_pages - 1)
-            
-            # Update button states
-            self.prev_button.disabled = self.page == 0
-            self.next_button.disabled = self.page >= self.total_pages - 1 or len(self.entries) == 0
+            # The cursor moves on to the next entry by itself
+            self.update_buttons()
             
             # Update the view
             embed = self.create_embed()
@@ -893,19 +1031,21 @@ class HallOfFameView(View):
             if original_message:
                 # Repost original message content and attachments
                 if original_message.attachments:
+                    # Upload mirrored images straight from disk and download the rest
                     files = []
-                    async with aiohttp.ClientSession() as session:
-                        try:
-                            for attachment in original_message.attachments:
-                                try:
-                                    async with session.get(attachment.url) as resp:
-                                        if resp.status == 200:
-                                            data = await resp.read()
-                                            files.append(discord.File(BytesIO(data), filename=attachment.filename))
-                                except Exception as e:
-                                    logger.warning(f"Failed to download attachment {attachment.url}: {e}")
-                        except Exception as e:
-                            logger.error(f"Error processing attachments: {e}")
+                    pending = []  # (slot in files, attachment) still to download
+                    for attachment in original_message.attachments:
+                        local = self.bot.image_mirror.local_file(entry, attachment.url)
+                        if local:
+                            files.append(discord.File(local[0], filename=attachment.filename))
+                        elif attachment.size <= self.bot.downloader.max_bytes:
+                            pending.append((len(files), attachment))
+                            files.append(None)
+                    downloads = await self.bot.downloader.fetch_all([a.url for _, a in pending])
+                    for (slot, attachment), data in zip(pending, downloads):
+                        if data is not None:
+                            files[slot] = discord.File(BytesIO(data), filename=attachment.filename)
+                    files = [f for f in files if f]
                     
                     if files:
                         if original_message.content:
@@ -923,24 +1063,28 @@ class HallOfFameView(View):
                 # Fallback: repost stored data
                 content = entry.get("original_message_text", "")
                 if entry.get("image_urls"):
-                    # Try to download and repost images
-                    async with aiohttp.ClientSession() as session:
-                        files = []
-                        for i, img_url in enumerate(entry["image_urls"][:10]):  # Limit to 10 images
-                            try:
-                                async with session.get(img_url) as resp:
-                                    if resp.status == 200:
-                                        data = await resp.read()
-                                        files.append(discord.File(BytesIO(data), filename=f"image_{i}.png"))
-                            except Exception as e:
-                                logger.warning(f"Failed to download image from {img_url}: {e}")
-                        
-                        if content:
-                            await channel.send(content=content, files=files if files else None)
-                        elif files:
-                            await channel.send(files=files)
+                    # Repost mirrored images from disk; try to download the others
+                    files = []
+                    pending = []  # (slot in files, url) still to download
+                    for i, img_url in enumerate(entry["image_urls"][:10]):  # Limit to 10 images
+                        local = self.bot.image_mirror.local_file(entry, img_url)
+                        if local:
+                            files.append(discord.File(local[0], filename=local[1]))
                         else:
-                            await channel.send("Could not retrieve original content.")
+                            pending.append((i, img_url))
+                            files.append(None)
+                    downloads = await self.bot.downloader.fetch_all([img_url for _, img_url in pending])
+                    for (i, _), data in zip(pending, downloads):
+                        if data is not None:
+                            files[i] = discord.File(BytesIO(data), filename=f"image_{i}.png")
+                    files = [f for f in files if f]
+                    
+                    if content:
+                        await channel.send(content=content, files=files if files else None)
+                    elif files:
+                        await channel.send(files=files)
+                    else:
+                        await channel.send("Could not retrieve original content.")
                     
                     await interaction.followup.send("Shared to channel!", ephemeral=True)
                 else:
@@ -959,16 +1103,21 @@ class HallOfFameView(View):
 
 
 @dejavu.command(name="halloffame", description="Browse the Hall of Fame")
-@app_commands.describe(random="Show a random entry instead of starting from the first")
-async def hall_of_fame(inter: discord.Interaction, random: bool = False):
+@app_commands.describe(
+    random="Show a random entry instead of starting from the first",
+    author="Only show pins of messages by this user"
+)
+async def hall_of_fame(inter: discord.Interaction, random: bool = False, author: discord.User = None):
     """Handle the /dejavu halloffame command."""
     await inter.response.defer()
     
-    # Get all entries, sorted by pinned_at (newest first)
-    entries = list(bot.hall_of_fame.values())
-    entries.sort(key=lambda x: x.get("pinned_at", ""), reverse=True)
+    # Newest first, or start at a random entry
+    if author:
+        cursor = bot.hall_of_fame.cursor("author_name", author.name, random=random)
+    else:
+        cursor = bot.hall_of_fame.cursor(random=random)
     
-    if not entries:
+    if not len(cursor):
         embed = Embed(
             title="Hall of Fame",
             description="No pinned items yet.",
@@ -977,57 +1126,163 @@ async def hall_of_fame(inter: discord.Interaction, random: bool = False):
         await inter.followup.send(embed=embed)
         return
     
-    # Determine starting page
-    if random:
-        start_page = randint(0, len(entries) - 1)
-    else:
-        start_page = 0
-    
-    # Create view with single-entry pagination
-    view = HallOfFameView(bot, entries, page=start_page, per_page=1)
+    view = HallOfFameView(bot, cursor)
     embed = view.create_embed()
     
-    # Update button states based on starting page
-    view.prev_button.disabled = start_page == 0
-    view.next_button.disabled = start_page >= len(entries) - 1 or len(entries) <= 1
-    
     await inter.followup.send(embed=embed, view=view)
 
-# Add alias command
-@dejavu.command(name="hof", description="Browse the Hall of Fame (alias)")
-@app_commands.describe(random="Show a random entry instead of starting from the first")
-async def hall_of_fame_alias(inter: discord.Interaction, random: bool = False):
-    """Handle the /dejavu hof command (alias for halloffame)."""
-    await hall_of_fame.callback(inter, random)
+# Short alias group: /dejavu hof browse and /dejavu hof search
+hof = app_commands.Group(name="hof", description="Browse and search the Hall of Fame", parent=dejavu)
+
+@hof.command(name="browse", description="Browse the Hall of Fame (alias)")
+@app_commands.describe(
+    random="Show a random entry instead of starting from the first",
+    author="Only show pins of messages by this user"
+)
+async def hall_of_fame_alias(inter: discord.Interaction, random: bool = False, author: discord.User = None):
+    """Handle the /dejavu hof browse command (alias for halloffame)."""
+    await hall_of_fame.callback(inter, random, author)
+
+@hof.command(name="search", description="Search the Hall of Fame")
+@app_commands.describe(
+    query="Words to look for in pinned messages or author names",
+    author="Only search pins of messages by this user",
+    after="Only messages sent on or after this date (YYYY-MM-DD)",
+    before="Only messages sent on or before this date (YYYY-MM-DD)"
+)
+async def hall_of_fame_search(
+    inter: discord.Interaction,
+    query: str,
+    author: discord.User = None,
+    after: str = None,
+    before: str = None
+):
+    """Handle the /dejavu hof search command."""
+    for date in (after, before):
+        if date:
+            try:
+                datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                await inter.response.send_message("Dates must look like 2024-01-31.", ephemeral=True)
+                return
+
+    await inter.response.defer()
+    results = bot.hall_of_fame.search(query, author.name if author else None, after, before)
+
+    embed = Embed(title=f"Hall of Fame - \"{query[:100]}\"", color=discord.Color.gold())
+    if not results:
+        embed.description = "No pinned items match that search."
+    for i, (entry, snippet) in enumerate(results, 1):
+        value = snippet or entry.get("original_message_text") or "(image)"
+        if len(value) > 900:
+            value = value[:897] + "..."
+        message_id = entry.get("message_id")
+        channel_id = entry.get("channel_id")
+        if message_id and channel_id:
+            value += f"\n[Jump to original](https://discord.com/channels/{entry.get('guild_id') or '@me'}/{channel_id}/{message_id})"
+        embed.add_field(
+            name=f"{i}. {entry.get('author_name', 'Unknown')} - {entry.get('timestamp', 'Unknown')}",
+            value=value,
+            inline=False
+        )
+
+    await inter.followup.send(embed=embed)
 
 @bot.event
 async def on_message(message: discord.Message):
     """Handle messages for the 'Who said' and 'Word Yapper' games."""
+    bot.archive.record_live(message)
+    if message.channel.id in bot.archive.live_channels:
+        bot.density.add(message.channel.id, [message.id])
+    bot.message_pool.touch(message.channel.id)
+
+    # Keep the word cache current so refreshes only need to fetch what we missed
+    guild_id = message.guild.id if message.guild else None
+    cache = bot.word_caches.peek(guild_id, message.channel.id)
+    if cache and cache["last_message_id"]:
+        if cache["updating"]:
+            cache["pending"].append(message)
+        else:
+            bot.word_caches.count_message(cache, message)
+
     if message.author.bot or not message.mentions:
         return
 
-    logger.debug(f"Processing mention: {message.content[:20]}...")  # Log first 20 chars of message
+    # One dict lookup routes a guess to the game running in this channel, if any
+    session = bot.sessions.get(message.channel.id)
+    if session and bot.sessions.is_open(session):
+        logger.debug(f"Processing guess: {message.content[:20]}...")  # Log first 20 chars of message
+        await handle_game_guess(message, session)
+
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    """Keep archived message content in sync with edits."""
+    if "content" in payload.data:
+        await asyncio.to_thread(bot.archive.update_content, payload.message_id, payload.data["content"])
+        bot.message_pool.discard(payload.channel_id, [payload.message_id])
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """Drop deleted messages from the archive so they are never recalled."""
+    await asyncio.to_thread(bot.archive.delete_messages, [payload.message_id])
+    bot.message_pool.discard(payload.channel_id, [payload.message_id])
 
 @bot.event
-async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
-    """Handle pin reactions (📌) to pin messages to Hall of Fame."""
-    # Skip if bot's own reaction
-    if user.bot:
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    await asyncio.to_thread(bot.archive.delete_messages, payload.message_ids)
+    bot.message_pool.discard(payload.channel_id, payload.message_ids)
+
+async def fetch_reacted_message(payload) -> discord.Message:
+    """The message a raw reaction event refers to, from the cache when possible."""
+    message = discord.utils.get(bot.cached_messages, id=payload.message_id)
+    if message is None:
+        channel = bot.get_channel(payload.channel_id) or await bot.fetch_channel(payload.channel_id)
+        message = await channel.fetch_message(payload.message_id)
+    return message
+
+async def seed_pinners(payload) -> set:
+    """Look up who has a 📌 on a pin stored before reactors were tracked; done once per pin."""
+    message = await fetch_reacted_message(payload)
+    user_ids = set()
+    for reaction in message.reactions:
+        if str(reaction.emoji) == "📌":
+            user_ids = {u.id async for u in reaction.users() if not u.bot}
+    bot.hall_of_fame.set_pinners(str(payload.message_id), user_ids)
+    logger.debug(f"Seeded {len(user_ids)} pinners for message {payload.message_id}")
+    return user_ids
+
+@bot.event
+async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+    """Handle pin reactions (📌) to pin messages to Hall of Fame, cached or not."""
+    # Only handle 📌 reactions
+    if str(payload.emoji) != "📌":
         return
     
-    # Only handle 📌 reactions
-    if str(reaction.emoji) != "📌":
+    # Skip bots, including our own reaction
+    if payload.user_id == bot.user.id or (payload.member and payload.member.bot):
         return
     
     try:
-        message = reaction.message
-        message_id_str = str(message.id)
+        message_id_str = str(payload.message_id)
         
-        # Check if already pinned
+        # Already pinned: just remember who else is keeping it pinned
         if message_id_str in bot.hall_of_fame:
+            if bot.hall_of_fame.pinners(message_id_str) is None:
+                await seed_pinners(payload)
+            else:
+                bot.hall_of_fame.add_pinner(message_id_str, payload.user_id)
+            bot.save_hall_of_fame()
             logger.debug(f"Message {message_id_str} is already pinned")
             return
         
+        message = await fetch_reacted_message(payload)
+        user = payload.member or bot.get_user(payload.user_id) or await bot.fetch_user(payload.user_id)
+        if message_id_str in bot.hall_of_fame:
+            # Someone else pinned it while we were fetching
+            bot.hall_of_fame.add_pinner(message_id_str, payload.user_id)
+            bot.save_hall_of_fame()
+            return
+        
         # Extract message metadata
         image_urls = []
         if message.attachments:
@@ -1050,7 +1305,8 @@ async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
             "background_used": None,  # Not a bot image
             "pinned_by": user.name,
             "pinned_at": datetime.now(timezone.utc).isoformat(),
-            "pin_type": "message"
+            "pin_type": "message",
+            "pinned_by_ids": [payload.user_id]
         }
         
         bot.hall_of_fame[message_id_str] = pin_entry
@@ -1074,54 +1330,51 @@ async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
         logger.error(f"Unexpected error handling pin reaction: {e}", exc_info=True)
 
 @bot.event
-async def on_reaction_remove(reaction: discord.Reaction, user: discord.User):
+async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     """Handle removal of pin reactions (📌) to unpin messages from Hall of Fame."""
-    # Skip if bot's own reaction removal
-    if user.bot:
+    # Only handle 📌 reactions
+    if str(payload.emoji) != "📌":
         return
     
-    # Only handle 📌 reactions
-    if str(reaction.emoji) != "📌":
+    # Skip bots, including our own reaction removal
+    user = bot.get_user(payload.user_id)
+    if payload.user_id == bot.user.id or (user and user.bot):
+        return
+    
+    message_id_str = str(payload.message_id)
+    
+    # Check if message is pinned
+    if message_id_str not in bot.hall_of_fame:
+        logger.debug(f"Message {message_id_str} is not in Hall of Fame")
         return
     
     try:
-        message = reaction.message
-        message_id_str = str(message.id)
+        # Don't unpin if others still have it pinned
+        if bot.hall_of_fame.pinners(message_id_str) is None:
+            try:
+                await seed_pinners(payload)
+            except discord.errors.NotFound:
+                logger.warning(f"Message {payload.message_id} not found when checking reactions")
+                bot.hall_of_fame.set_pinners(message_id_str, set())
+            except discord.errors.Forbidden:
+                logger.warning(f"No permission to fetch message {payload.message_id}")
+                bot.hall_of_fame.set_pinners(message_id_str, set())
+        else:
+            bot.hall_of_fame.remove_pinner(message_id_str, payload.user_id)
         
-        # Check if message is pinned
-        if message_id_str not in bot.hall_of_fame:
-            logger.debug(f"Message {message_id_str} is not in Hall of Fame")
+        if bot.hall_of_fame.pinners(message_id_str):
+            logger.debug(f"Other users still have message {message_id_str} pinned")
+            bot.save_hall_of_fame()
             return
         
-        # Check if there are any other 📌 reactions (don't unpin if others still have it)
-        # Get fresh reaction data
-        try:
-            message = await message.channel.fetch_message(message.id)
-            pin_reactions = [r for r in message.reactions if str(r.emoji) == "📌"]
-            if pin_reactions:
-                # Check if any non-bot users still have the reaction
-                pin_reaction = pin_reactions[0]
-                users_with_pin = [u async for u in pin_reaction.users() if not u.bot]
-                if users_with_pin:
-                    # Other users still have it pinned, don't unpin
-                    logger.debug(f"Other users still have message {message_id_str} pinned")
-                    return
-        except discord.errors.NotFound:
-            logger.warning(f"Message {message.id} not found when checking reactions")
-        except discord.errors.Forbidden:
-            logger.warning(f"No permission to fetch message {message.id}")
-        except Exception as e:
-            logger.warning(f"Could not fetch message for reaction check: {e}")
-        
         # Remove from Hall of Fame
         del bot.hall_of_fame[message_id_str]
         bot.save_hall_of_fame()
         
         # Remove ✅ checkmark if present
         try:
-            checkmark_reactions = [r for r in message.reactions if str(r.emoji) == "✅"]
-            if checkmark_reactions:
-                await message.remove_reaction("✅", bot.user)
+            message = bot.get_partial_messageable(payload.channel_id).get_partial_message(payload.message_id)
+            await message.remove_reaction("✅", bot.user)
         except discord.errors.Forbidden:
             logger.warning("Bot does not have permission to remove reactions")
         except discord.errors.NotFound:
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("PIL")
+
+from commands.archive import MessageArchive  # noqa: E402
+from commands.crawler import CRAWL_MIN_SEGMENT_SECONDS, CRAWL_SEGMENTS, HistoryCrawler  # noqa: E402
+from commands.density import ActivityDensity, seconds_snowflake  # noqa: E402
+
+DAY = 24 * 60 * 60
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = MessageArchive(str(tmp_path / "archive.db"))
+    yield archive
+    archive.close()
+
+
+def crawler_for(archive):
+    return HistoryCrawler(archive, ActivityDensity(archive))
+
+
+def test_plan_splits_an_unseen_history_into_contiguous_segments(archive):
+    channel = SimpleNamespace(id=seconds_snowflake(NOW - 400 * DAY))
+    until = seconds_snowflake(NOW)
+    crawler_for(archive).plan(channel, until)
+    segments = sorted((after_id, before_id) for _, after_id, before_id in archive.crawl_segments(channel.id))
+    assert len(segments) == CRAWL_SEGMENTS
+    assert segments[0][0] == channel.id - 1 and segments[-1][1] == until
+    assert all(upper[0] == lower[1] for lower, upper in zip(segments, segments[1:]))
+    assert archive.channel_state(channel.id)[3] == until
+
+
+def test_plan_keeps_a_short_history_in_one_segment(archive):
+    channel = SimpleNamespace(id=seconds_snowflake(NOW - DAY))
+    crawler_for(archive).plan(channel, seconds_snowflake(NOW))
+    assert len(archive.crawl_segments(channel.id)) == 1
+
+
+def test_plan_after_a_finished_crawl_only_covers_the_new_range(archive):
+    channel = SimpleNamespace(id=seconds_snowflake(NOW - 400 * DAY))
+    crawler = crawler_for(archive)
+    crawler.plan(channel, seconds_snowflake(NOW - DAY))
+    for segment_id, _, _ in archive.crawl_segments(channel.id):
+        archive.add_crawled(channel.id, [], segment_id, None)
+    crawler.plan(channel, seconds_snowflake(NOW))
+    assert [(after_id, before_id) for _, after_id, before_id in archive.crawl_segments(channel.id)] == [
+        (seconds_snowflake(NOW - DAY), seconds_snowflake(NOW))
+    ]
+
+
+def test_split_hands_out_the_lower_half_of_the_largest_open_segment(archive):
+    channel = SimpleNamespace(id=seconds_snowflake(NOW - 400 * DAY))
+    crawler = crawler_for(archive)
+    archive.plan_crawl(channel.id, [(channel.id, seconds_snowflake(NOW))], seconds_snowflake(NOW))
+    (segment_id, after_id, before_id), = archive.crawl_segments(channel.id)
+    small = {"id": 0, "after": before_id - 1, "before": before_id}
+    large = {"id": segment_id, "after": after_id, "before": before_id}
+    active = [small, large]
+
+    lower = asyncio.run(crawler.split(channel, active))
+    middle = (after_id + before_id) // 2
+    assert (lower["after"], lower["before"]) == (after_id, middle)
+    assert large["after"] == middle
+    assert sorted((a, b) for _, a, b in archive.crawl_segments(channel.id)) == [(after_id, middle), (middle, before_id)]
+
+    # Segments storing their last page and ones too short to split are left alone
+    large["done"] = True
+    assert asyncio.run(crawler.split(channel, active)) is None
+    short = {"id": 0, "after": seconds_snowflake(NOW - CRAWL_MIN_SEGMENT_SECONDS), "before": seconds_snowflake(NOW)}
+    assert asyncio.run(crawler.split(channel, [short])) is None
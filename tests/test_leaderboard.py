@@ -0,0 +1,50 @@
+from commands.leaderboard import GLOBAL_SCOPE, Leaderboard, RankedBoard
+
+
+def test_flat_legacy_file_becomes_the_global_scope():
+    board = Leaderboard({"alice": {"total": 5, "whosaid": 5}, "bob": {"total": 3, "wordyapper": 3}})
+    assert board.snapshot() == {
+        GLOBAL_SCOPE: {
+            "alice": {"total": 5, "whosaid": 5, "wordyapper": 0},
+            "bob": {"total": 3, "whosaid": 0, "wordyapper": 3},
+        }
+    }
+    assert [player for _, player, _ in board.top(GLOBAL_SCOPE)] == ["alice", "bob"]
+
+
+def test_legacy_player_named_like_the_global_scope_is_kept():
+    board = Leaderboard({"global": {"total": 7, "whosaid": 7}, "bob": {"total": 2}})
+    assert board.snapshot()[GLOBAL_SCOPE]["global"]["total"] == 7
+    assert board.snapshot()[GLOBAL_SCOPE]["bob"]["total"] == 2
+    assert list(board.snapshot()) == [GLOBAL_SCOPE]
+
+
+def test_scoped_file_round_trips():
+    data = {
+        GLOBAL_SCOPE: {"alice": {"total": 4, "whosaid": 4, "wordyapper": 0}},
+        "123": {"alice": {"total": 4, "whosaid": 4, "wordyapper": 0}},
+    }
+    assert Leaderboard(data).snapshot() == data
+    assert Leaderboard(Leaderboard(data).snapshot()).snapshot() == data
+
+
+def test_record_updates_global_and_guild_boards():
+    board = Leaderboard()
+    board.record(123, "whosaid", {"alice": 2, "bob": 3})
+    board.record(None, "wordyapper", {"alice": 4})
+    assert [(rank, player) for rank, player, _ in board.top(GLOBAL_SCOPE)] == [(1, "alice"), (2, "bob")]
+    assert [(rank, player) for rank, player, _ in board.top("123")] == [(1, "bob"), (2, "alice")]
+    assert board.top(GLOBAL_SCOPE, "wordyapper")[0][1] == "alice"
+    assert board.snapshot()["123"]["alice"] == {"total": 2, "whosaid": 2, "wordyapper": 0}
+
+
+def test_ranked_board_ties_and_neighbours():
+    board = RankedBoard()
+    for player, score in [("a", 5), ("b", 9), ("c", 5), ("d", 1), ("e", 7)]:
+        board.set(player, score)
+    board.set("d", 8)  # Moves up past e
+    assert board.top(3) == [(1, "b", 9), (2, "d", 8), (3, "e", 7)]
+    assert board.rank("a") == board.rank("c") == 4
+    assert board.rank("missing") is None
+    assert [player for _, player, _ in board.neighbours("e", radius=1)] == ["d", "e", "a"]
+    assert board.neighbours("missing") == []
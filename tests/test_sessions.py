@@ -0,0 +1,47 @@
+import asyncio
+
+from commands.sessions import SessionManager
+
+
+def test_only_rounds_still_open_at_their_deadline_time_out():
+    async def scenario():
+        manager = SessionManager()
+        timed_out = []
+
+        async def on_timeout(session):
+            timed_out.append(session["channel"])
+
+        scheduler = asyncio.create_task(manager.run(on_timeout))
+        try:
+            slow = manager.start("whosaid", 1, 3, False)
+            answered = manager.start("whosaid", 2, 3, False)
+            ended = manager.start("wordyapper", 3, 3, False)
+            reopened = manager.start("wordyapper", 4, 3, False)
+            manager.open_round(slow, timeout=0.05)
+            manager.open_round(answered, timeout=0.02)
+            manager.open_round(ended, timeout=0.02)
+            manager.open_round(reopened, timeout=0.01)
+            manager.close_round(answered)
+            manager.end(ended)
+            manager.open_round(reopened, timeout=0.08)  # The earlier deadline is now stale
+            await asyncio.sleep(0.04)
+            assert timed_out == []
+            await asyncio.sleep(0.1)
+            assert timed_out == [1, 4]
+            assert not manager.is_open(slow)
+        finally:
+            scheduler.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_start_reaps_idle_sessions_when_full():
+    manager = SessionManager(max_sessions=2, idle_timeout=60)
+    first = manager.start("whosaid", 1, 3, False)
+    manager.start("whosaid", 2, 3, False)
+    assert manager.start("whosaid", 3, 3, False) is None
+    first["last_activity"] -= 120
+    third = manager.start("whosaid", 3, 3, False)
+    assert third is not None
+    assert manager.get(1) is None and not first["playing"]
+    assert len(manager) == 2
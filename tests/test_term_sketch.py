@@ -0,0 +1,81 @@
+from collections import Counter
+from random import Random
+
+from commands.term_sketch import TermSketch, bigrams
+from commands.word_stats import RELAXED, STRICT
+
+
+def classify(term: str) -> int:
+    return STRICT if len(term) > 3 else RELAXED
+
+
+def stream(seed: int = 3, messages: int = 3000):
+    """(user id, words) messages: a long tail of shared terms, so the sketch has to prune, plus one favourite per user."""
+    rng = Random(seed)
+    vocabulary = [f"term{i}" for i in range(3000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for _ in range(messages):
+        user_id = rng.randrange(30)
+        yield user_id, rng.choices(vocabulary, weights, k=rng.randint(1, 10)) + [f"favourite{user_id}"]
+
+
+def build(capacity: int = 300, authors_per_term: int = 3):
+    sketch = TermSketch(classify, capacity, authors_per_term)
+    exact = Counter()
+    exact_authors = {}
+    total = 0
+    for user_id, words in stream():
+        sketch.add(user_id, f"user{user_id}", words)
+        exact.update(words)
+        for word in words:
+            exact_authors.setdefault(word, Counter())[user_id] += 1
+        total += len(words)
+    return sketch, exact, exact_authors, total
+
+
+def test_counts_never_overstate_and_stay_within_the_bound():
+    sketch, exact, _, total = build()
+    assert sketch.decrement > 0  # The stream overflowed the sketch
+    assert sketch.decrement <= total / (sketch.capacity + 1)
+    assert len(sketch.terms) <= 2 * sketch.capacity
+    for term, (count, _, _, _) in sketch.terms.items():
+        assert exact[term] - sketch.decrement <= count <= exact[term]
+    # Every term used more than the decrement is kept
+    assert all(term in sketch.terms for term, count in exact.items() if count > sketch.decrement)
+
+
+def test_top_author_is_always_the_true_top_author():
+    sketch, _, exact_authors, _ = build()
+    answered = 0
+    for term in sketch.terms:
+        author = sketch.top_author(term)
+        if author is None:
+            continue
+        answered += 1
+        (leader, lead), *rest = exact_authors[term].most_common(2)
+        assert sketch.author_ids[author] == leader
+        assert not rest or lead > rest[0][1]
+    assert answered
+
+
+def test_top_author_skips_excluded_users():
+    sketch = TermSketch(classify)
+    sketch.add(1, "alice", ["word"] * 5)
+    sketch.add(2, "bob", ["word"] * 2)
+    assert sketch.author_ids[sketch.top_author("word")] == 1
+    assert sketch.author_ids[sketch.top_author("word", excluded_user_ids={1})] == 2
+
+
+def test_dict_round_trip_keeps_terms_and_authors():
+    sketch, _, _, _ = build()
+    loaded = TermSketch.from_dict(sketch.to_dict(), classify)
+    assert loaded.terms == sketch.terms
+    assert loaded.decrement == sketch.decrement
+    assert list(loaded.author_ids) == list(sketch.author_ids)
+    assert loaded.author_index == sketch.author_index
+    assert loaded.candidates(True) == sketch.candidates(True)
+
+
+def test_bigrams():
+    assert bigrams(["a", "b", "c"]) == ["a b", "b c"]
+    assert bigrams(["a"]) == []
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("enchant")
+
+from commands import word_cache  # noqa: E402
+
+
+async def history(size: int):
+    for i in range(size, 0, -1):
+        # The fields of an ArchivedMessage that counting reads
+        yield SimpleNamespace(
+            id=i, author_id=i % 3, author_name=f"user{i % 3}", author_bot=False,
+            content="hello there general kenobi",
+        )
+
+
+def count(cache, size: int, **kwargs):
+    return asyncio.run(asyncio.wait_for(word_cache.count_history(cache, history(size), **kwargs), timeout=10))
+
+
+def test_count_history_counts_every_message():
+    cache = word_cache.empty_word_cache(1, 1)
+    assert count(cache, 1000) == 1000
+    stats = cache["stats"]
+    assert sum(stats.row(stats.intern_word("hello")).values()) == 1000
+    assert (cache["first_message_id"], cache["last_message_id"]) == (1, 1000)
+    assert cache["phrases"] is None
+
+
+def test_count_history_counts_only_phrases_into_a_new_sketch():
+    cache = word_cache.empty_word_cache(1, 1)
+    count(cache, 1000)
+    words = cache["stats"].size
+    cache["phrases"] = word_cache.empty_phrase_sketch()
+    assert count(cache, 2000, count_words=False) == 2000
+    assert cache["stats"].size == words
+    assert cache["last_message_id"] == 1000
+    assert cache["phrases"].terms["hello there"][0] == 2000
+
+
+def test_count_history_raises_when_a_page_fails_to_count(monkeypatch):
+    def fail(page, *kinds):
+        raise ValueError("bad page")
+
+    monkeypatch.setattr(word_cache, "count_page", fail)
+    cache = word_cache.empty_word_cache(1, 1)
+    # Many more pages than the queue holds, so a stuck producer would time out instead
+    with pytest.raises(ValueError):
+        count(cache, 100 * word_cache.PIPELINE_QUEUE_PAGES * 10)
+    assert cache["last_message_id"] is None
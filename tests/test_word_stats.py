@@ -0,0 +1,90 @@
+from commands.word_stats import NOT_CANDIDATE, RELAXED, STRICT, WordStats, write_word_stats
+
+
+def classify(word: str) -> int:
+    if len(word) <= 1:
+        return NOT_CANDIDATE
+    return STRICT if len(word) > 4 else RELAXED
+
+
+def counts(stats: WordStats) -> dict:
+    """{word: {user id: count}}, independent of how the stats are stored."""
+    return {
+        stats.word(word_id): {stats.author_ids[author]: count for author, count in stats.row(word_id).items()}
+        for word_id in range(len(stats))
+    }
+
+
+def candidates(stats: WordStats, strict: bool) -> set:
+    return {stats.word(word_id) for part in stats.candidates(strict) for word_id in part}
+
+
+def round_trip(stats: WordStats, tmp_path) -> WordStats:
+    path = str(tmp_path / "stats.bin")
+    write_word_stats(path, stats.copy())
+    return WordStats.from_file(path, classify)
+
+
+def sample_stats() -> WordStats:
+    stats = WordStats(classify)
+    stats.add(1, "alice", ["hello", "world", "hello", "a", "hey"])
+    stats.add(2, "bob", ["hello", "there"])
+    stats.add(1, "alice2", ["kenobi"])
+    return stats
+
+
+def test_round_trip_keeps_counts_names_and_candidates(tmp_path):
+    stats = sample_stats()
+    stats.meta = {"last_message_id": 42}
+    loaded = round_trip(stats, tmp_path)
+    assert counts(loaded) == counts(stats)
+    assert loaded.meta == {"last_message_id": 42}
+    assert loaded.author_names == ["alice2", "bob"]
+    assert candidates(loaded, True) == {"hello", "world", "there", "kenobi"}
+    assert candidates(loaded, False) == {"hello", "world", "there", "kenobi", "hey"}
+    hello = loaded.intern_word("hello")
+    assert [loaded.author_ids[a] for a in loaded.top_authors(hello)] == [1, 2]
+
+
+def test_round_trip_of_empty_stats(tmp_path):
+    loaded = round_trip(WordStats(classify), tmp_path)
+    assert len(loaded) == 0
+    assert loaded.size == 0
+    assert counts(loaded) == {}
+    loaded.add(3, "carol", ["fresh"])
+    assert counts(loaded) == {"fresh": {3: 1}}
+
+
+def test_counts_added_after_a_load_round_trip_again(tmp_path):
+    loaded = round_trip(sample_stats(), tmp_path)
+    # Lands in the delta on top of the mapped arrays: an existing word, a new word and a new author
+    loaded.add(2, "bob", ["hello", "brand"])
+    loaded.add(3, "carol", ["world"])
+    expected = counts(sample_stats())
+    expected["hello"][2] += 1
+    expected["brand"] = {2: 1}
+    expected["world"][3] = 1
+    assert counts(loaded) == expected
+    assert loaded.delta_pairs == 3
+
+    reloaded = round_trip(loaded, tmp_path)
+    assert counts(reloaded) == expected
+    assert reloaded.delta_pairs == 0
+    assert "brand" in candidates(reloaded, True)
+
+
+def test_compact_keeps_ids_and_counts():
+    stats = sample_stats()
+    before = counts(stats)
+    ids = {stats.word(word_id): word_id for word_id in range(len(stats))}
+    stats.compact()
+    assert counts(stats) == before
+    assert {stats.word(word_id): word_id for word_id in range(len(stats))} == ids
+    assert stats.delta == {} and stats.size == len(stats.cols)
+
+
+def test_copy_is_not_changed_by_later_counts():
+    stats = sample_stats()
+    copy = stats.copy()
+    stats.add(2, "bob", ["hello", "other"])
+    assert counts(copy) == counts(sample_stats())